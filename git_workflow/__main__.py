@@ -7,32 +7,48 @@ argcomplete.autocomplete(parser)
 import os
 import sys
 from cmd_utils import cmd
-from git import Repo
-from git.exc import InvalidGitRepositoryError, NoSuchPathError
-from git_workflow.utils import repository
-from git_workflow.workflow import run_command
+from git_workflow.utils import repository, tracing
+from git_workflow.utils.git_repo import InvalidGitRepositoryError, NoSuchPathError, Repo
+from git_workflow.workflow import commands, run_command
 
 
 def main():
     # Argument Parser
     parsed_args = parser.parse_args()
+    # Tracing (if enabled via --profile or WORKFLOW_PROFILE env var)
+    tracing.enable(getattr(parsed_args, 'profile', None),
+                   cprofile=getattr(parsed_args, 'cprofile', None))
+    try:
+        with tracing.span('main'):
+            run_main(parsed_args)
+    finally:
+        trace_path = tracing.finish()
+        if trace_path:
+            cmd.print_info(f'Trace written to {trace_path}')
+
+
+def run_main(parsed_args):
     # Check installed git version
     try:
         repository.verify_git_version()
     except Exception as e:
         cmd.print_error(e)
         return
-    # Initialize Repo object
+    # Initialize Repo object (optional for some commands)
+    command_class = commands.get(getattr(parsed_args, 'command', None))
+    requires_repo = command_class is None or command_class.requires_repo
     repo = None
     try:
-        repo = Repo(os.getcwd(), search_parent_directories=True)
+        with tracing.span('Repo'):
+            repo = Repo(os.getcwd(), search_parent_directories=True)
     except InvalidGitRepositoryError as e:
-        cmd.print_error('No git repo found: {}'.format(e))
+        if requires_repo:
+            cmd.print_error('No git repo found: {}'.format(e))
     except NoSuchPathError as e:
         cmd.print_error('Invalid path: {}'.format(e))
-    finally:
-        if repo is None:
-            return
+        return
+    if repo is None and requires_repo:
+        return
     try:
         run_command(repo, parser, parsed_args=parsed_args)
     except KeyboardInterrupt:
@@ -1,5 +1,7 @@
 """Utility modules."""
+from . import git_repo
 from . import repository
 from . import configs
 from . import files
+from . import branches
 from . import parser
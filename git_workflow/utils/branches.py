@@ -0,0 +1,86 @@
+"""Utilities for working with workflow branch names."""
+from collections import namedtuple
+from datetime import date, timedelta
+import re
+
+#: Matches branch names created by ``workflow start``, i.e.
+#: ``[<client>-]<description>-<yyyymmdd>-<initials>``
+BRANCH_NAME_REGEX = re.compile(
+    r'^(?P<prefix>.+)-(?P<date>\d{8})-(?P<initials>[^/]+)$'
+)
+
+
+#: Matches durations accepted by parse_duration()
+DURATION_REGEX = re.compile(r'^(?P<count>\d+)(?P<unit>[dwmy]?)$')
+#: Number of days in each duration unit (months and years are approximate)
+DURATION_UNITS = {'': 1, 'd': 1, 'w': 7, 'm': 30, 'y': 365}
+
+
+def is_workflow_branch(branch_name):
+    """Returns True if branch_name follows the ``workflow start`` naming
+    scheme.
+
+    :param branch_name: Name of the branch to check
+    """
+    return BRANCH_NAME_REGEX.match(branch_name) is not None
+
+
+#: Components of a branch name created by ``workflow start``. Fields are
+#: strings, client is None if the branch doesn't have one (or it can't be
+#: determined), and date is in ``yyyymmdd`` format
+BranchName = namedtuple('BranchName', ['client', 'description', 'date', 'initials'])
+
+
+def parse_branch_name(branch_name, client=None):
+    """Split a branch name created by ``workflow start`` into its components.
+
+    Since clients and descriptions are both hyphenated, the client can't be
+    determined from the name alone. If the client is known (e.g. it was
+    recorded when the branch was created), it can be passed to split it from
+    the description. Otherwise, the whole prefix is treated as the
+    description.
+
+    :param branch_name: Name of the branch to parse
+    :param client: (Optional) The branch's client, if known
+
+    :return: BranchName tuple, or None if the branch doesn't follow the naming
+        scheme
+    """
+    match = BRANCH_NAME_REGEX.match(branch_name)
+    if match is None:
+        return None
+    description = match.group('prefix')
+    if client and description.startswith(client + '-'):
+        description = description[len(client) + 1:]
+    else:
+        client = None
+    return BranchName(client, description, match.group('date'), match.group('initials'))
+
+
+def parse_duration(duration):
+    """Parse a duration like ``90d``, ``12w``, ``6m`` or ``1y`` (days, weeks,
+    months and years). Numbers without a unit are days.
+
+    :param duration: Duration to parse
+
+    :return: Number of days
+
+    :raises ValueError: If duration isn't a valid duration
+    """
+    match = DURATION_REGEX.match(duration.strip().lower())
+    if match is None:
+        raise ValueError(f"Invalid duration '{duration}', expected e.g. 90d, 12w, 6m or 1y.")
+    return int(match.group('count')) * DURATION_UNITS[match.group('unit')]
+
+
+def get_cutoff_date(days, today=None):
+    """Get the date a number of days ago, in the ``yyyymmdd`` format used in
+    branch names. Dates in that format sort chronologically as strings, so a
+    branch is older than the duration if its date is less than the cutoff.
+
+    :param days: Number of days (e.g. a parse_duration() result)
+    :param today: (Default: today's date) Date to count back from
+
+    :return: Date string
+    """
+    return ((today or date.today()) - timedelta(days=days)).strftime('%Y%m%d')
@@ -0,0 +1,288 @@
+"""Completion of client names and descriptions for ``workflow start``.
+
+Candidates come from the names of existing local and remote branches that
+follow the ``[<client>-]<description>-<yyyymmdd>-<initials>`` scheme, so a
+client is spelled the same way across branches. The ``[<client>-]<description>``
+part of each name is stored in a PrefixTrie, which is cached in the common git
+dir along with the ref names it was built from and the stat info of the files
+and directories refs are stored in:
+
+- If no ref was added or removed, the cached trie is used as is
+- Otherwise, only the added and removed refs are applied to the cached trie
+
+Since clients and descriptions are both hyphenated, names are completed one
+hyphen-separated segment at a time (like paths in a shell).
+
+Note: refs in nested directories (e.g. ``refs/heads/feature/x``) don't
+change the stat info of the directories that are checked, so they're only
+picked up with the next change to a top level ref.
+"""
+from bisect import bisect_left
+import contextlib
+import os
+import re
+import sys
+from . import stat_cache
+from .branches import BRANCH_NAME_REGEX
+
+#: Filename of the cache in the common git dir
+CACHE_FILENAME = 'workflow_completion_cache'
+#: Bump when the cache format changes
+CACHE_VERSION = 1
+#: Separates segments of client names and descriptions
+SEPARATOR = '-'
+#: Sorts after any character, used as the upper bound of a prefix's range
+MAX_CHAR = '\U0010ffff'
+
+
+class PrefixTrie:
+    """Prefix trie of strings, each with a count of how often it occurs.
+
+    The trie is stored as parallel sorted lists of keys and counts rather than
+    as nested nodes: the keys under a prefix (i.e. its subtree) are always a
+    contiguous range that's found by binary search. Only builtin types are
+    used, so the trie can be cached with marshal, and loading it doesn't mean
+    creating an object per node.
+    """
+
+    def __init__(self, keys=None, counts=None):
+        """Constructor
+
+        :param keys: (Optional) Sorted list of keys
+        :param counts: (Optional) List of counts of each key
+        """
+        self.keys = keys or []
+        self.counts = counts or []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, count=1):
+        """Add occurrences of a key."""
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            self.counts[index] += count
+        else:
+            self.keys.insert(index, key)
+            self.counts.insert(index, count)
+
+    def remove(self, key, count=1):
+        """Remove occurrences of a key, and the key itself if none are
+        left."""
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return
+        self.counts[index] -= count
+        if self.counts[index] <= 0:
+            del self.keys[index]
+            del self.counts[index]
+
+    def get_range(self, prefix):
+        """Returns the start and end indexes of the keys that start with
+        prefix."""
+        return (bisect_left(self.keys, prefix),
+                bisect_left(self.keys, prefix + MAX_CHAR))
+
+    def complete(self, prefix):
+        """Complete prefix up to the end of its current segment.
+
+        :param prefix: Text to complete
+
+        :return: List of completions, most common first. Completions of keys
+            with more segments end with SEPARATOR, so they can be completed
+            further
+        """
+        start, end = self.get_range(prefix)
+        totals = {}
+        for index in range(start, end):
+            key = self.keys[index]
+            separator_index = key.find(SEPARATOR, len(prefix))
+            completion = key if separator_index == -1 else key[:separator_index + 1]
+            totals[completion] = totals.get(completion, 0) + self.counts[index]
+        return sorted(totals, key=lambda completion: (-totals[completion], completion))
+
+
+def get_ref_prefix(ref):
+    """Get the ``[<client>-]<description>`` part of a ref's branch name.
+
+    :param ref: Full ref name (e.g. ``refs/remotes/origin/<branch>``)
+
+    :return: Prefix, or None if the branch doesn't follow the naming scheme
+    """
+    if ref.startswith('refs/heads/'):
+        branch_name = ref[len('refs/heads/'):]
+    else:
+        # Remove refs/remotes/<remote>/
+        branch_name = ref.split('/', 3)[-1]
+    match = BRANCH_NAME_REGEX.match(branch_name)
+    return match.group('prefix') if match is not None else None
+
+
+def get_ref_files(repo):
+    """Returns paths of the files and directories that change when a branch
+    is added or removed."""
+    paths = [
+        os.path.join(repo.common_dir, 'packed-refs'),
+        os.path.join(repo.common_dir, 'refs', 'heads'),
+    ]
+    remotes_dir = os.path.join(repo.common_dir, 'refs', 'remotes')
+    paths.append(remotes_dir)
+    try:
+        paths.extend(sorted(entry.path for entry in os.scandir(remotes_dir) if entry.is_dir()))
+    except OSError:
+        pass
+    return paths
+
+
+def get_refs(repo):
+    """Returns the set of full names of local and remote branches."""
+    refs = {'refs/heads/' + name for name in repo.get_refs('refs/heads/')}
+    refs.update('refs/remotes/' + name for name in repo.get_refs('refs/remotes/'))
+    return refs
+
+
+def load_trie(repo):
+    """Get the trie of branch name prefixes, using the cache if no branch was
+    added or removed and updating it incrementally otherwise.
+
+    :param repo: Repo object
+
+    :return: PrefixTrie
+    """
+    cache_path = os.path.join(repo.common_dir, CACHE_FILENAME)
+    cached, cached_stamp = stat_cache.load_stale(cache_path, CACHE_VERSION)
+    stamp = stat_cache.stat_files(get_ref_files(repo))
+    if cached is not None and cached_stamp == stamp:
+        return PrefixTrie(cached['keys'], cached['counts'])
+    if cached is None:
+        cached = {'refs': [], 'keys': [], 'counts': []}
+    trie = PrefixTrie(cached['keys'], cached['counts'])
+    cached_refs = set(cached['refs'])
+    refs = get_refs(repo)
+    for ref in cached_refs - refs:
+        prefix = get_ref_prefix(ref)
+        if prefix is not None:
+            trie.remove(prefix)
+    for ref in refs - cached_refs:
+        prefix = get_ref_prefix(ref)
+        if prefix is not None:
+            trie.add(prefix)
+    stat_cache.store(cache_path, CACHE_VERSION, stamp, {
+        # A list loads much faster than a set
+        'refs': sorted(refs),
+        'keys': trie.keys,
+        'counts': trie.counts,
+    })
+    return trie
+
+
+def format_text(text):
+    """Format text the way ``workflow start`` formats branch name parts."""
+    return re.sub('[ _]+', SEPARATOR, text.lower())
+
+
+def complete_client(trie, text):
+    """Get client names that complete text.
+
+    :param trie: Result of load_trie()
+    :param text: Text to complete
+
+    :return: List of client names, most common first
+    """
+    # Only prefixes with another segment after the client can have one
+    return [
+        completion[:-1] for completion in trie.complete(format_text(text))
+        if completion.endswith(SEPARATOR)
+    ]
+
+
+def complete_description(trie, text, client=None):
+    """Get descriptions that complete text. Unambiguous segments are
+    completed right away.
+
+    :param trie: Result of load_trie()
+    :param text: Text to complete
+    :param client: (Optional) Client name, to only complete descriptions of
+        that client's branches
+
+    :return: List of descriptions, most common first
+    """
+    client_prefix = format_text(client) + SEPARATOR if client else ''
+    prefix = client_prefix + format_text(text)
+    completions = trie.complete(prefix)
+    while (len(completions) == 1 and completions[0].endswith(SEPARATOR)
+           and completions[0] != prefix):
+        prefix = completions[0]
+        completions = trie.complete(prefix)
+    return [completion[len(client_prefix):] for completion in completions]
+
+
+@contextlib.contextmanager
+def prompt_completion(complete):
+    """Context manager that completes input() with Tab (if readline is
+    available and stdin is a terminal).
+
+    :param complete: Function that takes the text before the cursor and
+        returns a list of completions for it
+    """
+    try:
+        import readline
+    except ImportError:
+        readline = None
+    if readline is None or not sys.stdin.isatty():
+        yield
+        return
+    matches = []
+
+    def completer(text, state):
+        if state == 0:
+            try:
+                matches[:] = complete(text)
+            except Exception:
+                # Never let completion break the prompt
+                matches[:] = []
+        return matches[state] if state < len(matches) else None
+
+    old_completer = readline.get_completer()
+    old_delims = readline.get_completer_delims()
+    # Complete the whole input, since hyphens and spaces are part of names
+    readline.set_completer_delims('')
+    readline.set_completer(completer)
+    if 'libedit' in (readline.__doc__ or ''):
+        readline.parse_and_bind('bind ^I rl_complete')
+    else:
+        readline.parse_and_bind('tab: complete')
+    try:
+        yield
+    finally:
+        readline.set_completer(old_completer)
+        readline.set_completer_delims(old_delims)
+
+
+# argcomplete completers
+
+def _load_cwd_trie():
+    """Returns the trie for the repo in the current directory, or None if
+    there isn't one."""
+    # Imported here so argcomplete doesn't pay for it unless completing
+    from .git_repo import Repo
+    try:
+        return load_trie(Repo(os.getcwd(), search_parent_directories=True))
+    except Exception:
+        return None
+
+
+def client_completer(prefix, **kwargs):
+    """argcomplete completer for client names."""
+    trie = _load_cwd_trie()
+    return complete_client(trie, prefix) if trie is not None else []
+
+
+def description_completer(prefix, parsed_args=None, **kwargs):
+    """argcomplete completer for descriptions (of the client passed with
+    --client, if any)."""
+    trie = _load_cwd_trie()
+    if trie is None:
+        return []
+    client = getattr(parsed_args, 'client', None)
+    return complete_description(trie, prefix, client=client)
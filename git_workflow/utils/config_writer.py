@@ -0,0 +1,236 @@
+"""Edit git config files without running ``git config``.
+
+Multiple changes to the same file can be applied to its contents in memory and
+written back at once, instead of running ``git config`` (and rewriting the
+file) once per change. Files are locked the same way git locks them (with a
+``.lock`` file next to them), so concurrent git commands can't interleave
+writes. Lines that aren't changed are kept as is, including comments.
+"""
+import os
+
+#: Characters that have to be escaped in config values
+_VALUE_ESCAPES = [('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\t', '\\t')]
+
+
+def split_config_key(key):
+    """Split a config name into its parts.
+
+    :param key: Full config name, e.g. ``includeIf.onbranch:main.path``
+
+    :return: Tuple of (section, subsection, name) as written in key.
+        subsection is None if there isn't one
+    """
+    section, _, name = key.rpartition('.')
+    section, dot, subsection = section.partition('.')
+    return section, subsection if dot else None, name
+
+
+def normalize_section(section, subsection=None):
+    """Returns the section in the form used by parse_config() (section name
+    lowercased, subsection kept as is)."""
+    if subsection is None:
+        return section.lower()
+    return f'{section.lower()}.{subsection}'
+
+
+def format_config_value(value):
+    """Format a value to be written to a config file, quoting it if it has
+    leading/trailing whitespace or comment characters (as git does)."""
+    value = str(value)
+    escaped = value
+    for char, escape in _VALUE_ESCAPES:
+        escaped = escaped.replace(char, escape)
+    if value != value.strip() or '#' in value or ';' in value:
+        return f'"{escaped}"'
+    return escaped
+
+
+class ConfigEditor:
+    """In-memory editor for the contents of a config file."""
+
+    def __init__(self, text=''):
+        """Constructor
+
+        :param text: (Optional) Current contents of the file
+        """
+        self.lines = text.splitlines(keepends=True)
+        if self.lines and not self.lines[-1].endswith('\n'):
+            self.lines[-1] += '\n'
+
+    @property
+    def text(self):
+        """Contents of the file."""
+        return ''.join(self.lines)
+
+    # Edits
+
+    def set(self, key, value):
+        """Set a config value, replacing any existing values.
+
+        :param key: Full config name
+        :param value: Value to set
+        """
+        section, subsection, name = split_config_key(key)
+        section_key = normalize_section(section, subsection)
+        line = f'\t{name} = {format_config_value(value)}\n'
+        spans = [
+            (start, end) for entry_section, entry_name, start, end in self._scan_keys()
+            if entry_section == section_key and entry_name == name.lower()
+        ]
+        if spans:
+            # Replace the last value and remove the rest
+            start, end = spans.pop()
+            self.lines[start:end] = [line]
+            for start, end in reversed(spans):
+                del self.lines[start:end]
+            return
+        section_end = self._find_section_end(section_key)
+        if section_end is not None:
+            self.lines.insert(section_end, line)
+            return
+        if subsection is None:
+            header = f'[{section}]\n'
+        else:
+            for char, escape in _VALUE_ESCAPES[:2]:
+                subsection = subsection.replace(char, escape)
+            header = f'[{section} "{subsection}"]\n'
+        self.lines.extend([header, line])
+
+    def unset(self, key):
+        """Remove all values of a config. Removes its section too if it's left
+        empty.
+
+        :param key: Full config name
+        """
+        section, subsection, name = split_config_key(key)
+        section_key = normalize_section(section, subsection)
+        spans = [
+            (start, end) for entry_section, entry_name, start, end in self._scan_keys()
+            if entry_section == section_key and entry_name == name.lower()
+        ]
+        for start, end in reversed(spans):
+            del self.lines[start:end]
+        if spans:
+            self._remove_empty_sections(section_key)
+
+    def remove_section(self, section_key):
+        """Remove a section and everything in it.
+
+        :param section_key: Section in the form ``section`` or
+            ``section.subsection`` (section name is case insensitive)
+        """
+        section, dot, subsection = section_key.partition('.')
+        section_key = normalize_section(section, subsection if dot else None)
+        for start, end in reversed(list(self._scan_sections(section_key))):
+            del self.lines[start:end]
+
+    # Helper Methods
+
+    def _scan(self):
+        """Iterate over the lines of the file.
+
+        :return: Generator that yields (kind, section, name, start, end)
+            tuples, where kind is 'header', 'key' or 'other', section is the
+            normalized section the line belongs to, name is the lowercased key
+            name (for keys), and start/end are line indexes (end is exclusive,
+            and greater than start + 1 for values with continuation lines)
+        """
+        section = None
+        index = 0
+        while index < len(self.lines):
+            stripped = self.lines[index].strip()
+            start = index
+            index += 1
+            if stripped.startswith('['):
+                header, _, _ = stripped[1:].partition(']')
+                name, _, subsection = header.partition(' ')
+                subsection = subsection.strip()
+                if subsection.startswith('"') and subsection.endswith('"'):
+                    subsection = subsection[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+                    section = normalize_section(name, subsection)
+                elif '.' in name:
+                    # Deprecated [section.subsection] syntax
+                    name, _, subsection = name.partition('.')
+                    section = f'{name.lower()}.{subsection.lower()}'
+                else:
+                    section = name.lower()
+                yield 'header', section, None, start, index
+                continue
+            if not stripped or stripped[0] in '#;' or section is None:
+                yield 'other', section, None, start, index
+                continue
+            name, _, value = stripped.partition('=')
+            # Include continuation lines
+            while (value.endswith('\\') and not value.endswith('\\\\')
+                   and index < len(self.lines)):
+                value = self.lines[index].rstrip('\n')
+                index += 1
+            yield 'key', section, name.strip().lower(), start, index
+
+    def _scan_keys(self):
+        """Returns (section, name, start, end) for each key line."""
+        return [
+            (section, name, start, end)
+            for kind, section, name, start, end in self._scan() if kind == 'key'
+        ]
+
+    def _scan_sections(self, section_key):
+        """Returns (start, end) for each occurrence of a section, from its
+        header to the next header."""
+        spans = []
+        current = None
+        for kind, section, _, start, end in self._scan():
+            if kind == 'header':
+                if current is not None:
+                    spans.append((current, start))
+                current = start if section == section_key else None
+        if current is not None:
+            spans.append((current, len(self.lines)))
+        return spans
+
+    def _find_section_end(self, section_key):
+        """Returns the index to insert a new key in the last occurrence of a
+        section at (after its last key), or None if the section doesn't
+        exist."""
+        insert_at = None
+        for kind, section, _, start, end in self._scan():
+            if section != section_key:
+                continue
+            if kind in ('header', 'key'):
+                insert_at = end
+        return insert_at
+
+    def _remove_empty_sections(self, section_key):
+        """Remove occurrences of a section that have no keys or comments
+        left."""
+        for start, end in reversed(self._scan_sections(section_key)):
+            if all(not line.strip() for line in self.lines[start + 1:end]):
+                # Keep blank lines separating sections
+                del self.lines[start:start + 1]
+
+
+def write_config_file(path, text):
+    """Replace the contents of a config file, holding git's lock on it while
+    writing.
+
+    :param path: Path to the config file
+    :param text: New contents
+
+    :raises Exception: if the file is locked (e.g. by a running git command)
+    """
+    lock_path = path + '.lock'
+    try:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        raise Exception(f'Unable to lock {path}: {lock_path} exists. '
+                        'If no other git process is running, remove it and try again.')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(lock_path, path)
+    except BaseException:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+        raise
@@ -1,7 +1,9 @@
 """Utilities for interacting with git configs."""
+import os
 import textwrap
-from git.exc import GitCommandError
-from . import repository
+from git_workflow.__about__ import __version__
+from . import repository, stat_cache, ticket_registry
+from .git_repo import GitCommandError, get_config_environment
 
 
 class Configs:
@@ -17,12 +19,30 @@ class Configs:
     # Space separated list:
     DATA_TYPE_LIST = 'list'
 
+    #: Filename of the resolved config cache (relative to the git dir, since
+    #: conditional includes make values depend on the worktree's HEAD)
+    CACHE_FILENAME = 'workflow_configs_cache'
+    #: Bump when the cache format changes
+    CACHE_VERSION = 1
+
     def __init__(self, repo, debug=False, no_init=False):
         self.repo = repo
         self.debug = debug
         # Make sure repo is initialized before proceeding
         if not no_init:
             repository.initialize(self.repo)
+        # Maps config names to resolved values. Loaded from the cache if no
+        # config file changed since it was written, otherwise filled in by
+        # get_workflow_config() and stored at the end
+        cache_path = os.path.join(self.repo.git_dir, self.CACHE_FILENAME)
+        cache_key = self.get_cache_key()
+        cached_values = stat_cache.load(cache_path, cache_key)
+        self._cache_hit = cached_values is not None
+        if self._cache_hit:
+            self._values = cached_values
+        else:
+            self._values = {}
+            cache_stamp = stat_cache.stat_files(self.repo.get_config_files())
 
         # CONFIGS ==============================================================
         # Internal -------------------------------------------------------------
@@ -66,6 +86,26 @@ class Configs:
         self.BASE_BRANCH = self.get_workflow_config(
             'baseBranch', default='master'
         )
+        # updateBaseInPlace
+        self.UPDATE_BASE_IN_PLACE_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``false``
+
+            If ``true``, ``workflow start`` and ``workflow finish`` will fetch
+            the base branch and fast-forward it without checking it out,
+            instead of checking it out and running ``git pull``. ``workflow
+            start`` then creates the new branch from the updated base with a
+            single checkout, and ``workflow finish`` deletes the branch without
+            checking out the base branch (unless it's finishing the current
+            branch). If the base branch can't be fast-forwarded, the command
+            will stop without making changes.
+
+            Can be overridden with ``--in-place`` or ``--checkout-base``.
+            ''')
+        self.UPDATE_BASE_IN_PLACE = self.get_workflow_config(
+            'updateBaseInPlace', default=False,
+            config_type=self.TYPE_BOOL
+        )
         # badBranchNamePatterns
         self.BAD_BRANCH_NAME_PATTERNS_DOC = textwrap.dedent(
             '''\
@@ -86,6 +126,157 @@ class Configs:
             data_type=self.DATA_TYPE_LIST
         )
 
+        # Fetching -------------------------------------------------------------
+        # fetchMaxAge
+        self.FETCH_MAX_AGE_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``0``
+
+            If set to a number of seconds greater than ``0``, ``workflow
+            start`` and ``workflow finish`` will skip fetching the base branch
+            (or tags when using ``--base-release``) if it was fetched within
+            that many seconds. Freshness is determined by the modification
+            times of ``FETCH_HEAD`` and the remote-tracking ref (or a stamp
+            file in ``.git`` for tags). Already fetched changes are still
+            applied to the base branch.
+
+            Use ``--refresh`` to fetch regardless of this config.
+
+            **E.g.:** To skip fetching if the base branch was fetched in the
+            last 5 minutes:
+
+            ::
+
+                git config workflow.fetchMaxAge 300
+            ''')
+        self.FETCH_MAX_AGE = self.get_workflow_config(
+            'fetchMaxAge', default=0,
+            config_type=self.TYPE_INT
+        )
+
+        # fetchJobs
+        self.FETCH_JOBS_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``4``
+
+            Maximum number of remotes to fetch from at once when fetching tags
+            (e.g. ``workflow start --base-release``).
+            ''')
+        self.FETCH_JOBS = self.get_workflow_config(
+            'fetchJobs', default=4,
+            config_type=self.TYPE_INT
+        )
+
+        # mirrorPath
+        self.MIRROR_PATH_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``None``
+
+            Path to a local mirror of the remote (e.g. a bare ``git clone
+            --mirror`` that is refreshed periodically) to fetch the base branch
+            and tags from before contacting the remote. Relative paths are
+            relative to the main worktree. ``{repo}`` is replaced with the name
+            of the main worktree's directory and ``{remote}`` with the name of
+            the remote being fetched, so a single config can cover several
+            repos and remotes.
+
+            The remote is fetched instead if the mirror doesn't exist, doesn't
+            contain the ref, is behind what was already fetched, or is older
+            than ``workflow.mirrorMaxAge``. ``--refresh`` skips the mirror.
+
+            **E.g.:**
+
+            ::
+
+                git config --global workflow.mirrorPath '/srv/git-mirrors/{repo}.git'
+            ''')
+        self.MIRROR_PATH = self.get_workflow_config('mirrorPath')
+
+        # mirrorMaxAge
+        self.MIRROR_MAX_AGE_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``600``
+
+            Maximum number of seconds since ``workflow.mirrorPath`` was last
+            fetched (based on the modification times of its ``FETCH_HEAD`` and
+            the requested ref) for it to be used instead of the remote.
+            ''')
+        self.MIRROR_MAX_AGE = self.get_workflow_config(
+            'mirrorMaxAge', default=600,
+            config_type=self.TYPE_INT
+        )
+
+        # ciMode
+        self.CI_MODE_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``false``
+
+            If ``true``, ``workflow start`` and ``workflow finish`` fetch as
+            little as possible, for short-lived clones (e.g. in CI) that may be
+            shallow (``git clone --depth 1``) or partial (``git clone
+            --filter=blob:none``):
+
+            - Only the tip of the base branch (or the tag passed to
+              ``--base-release``) is fetched, without tags. Shallow clones
+              aren't deepened, except by ``workflow finish`` to check if a
+              branch was merged, and only back to the branch's last commit
+            - The local base branch isn't updated or checked out. Branches are
+              created from (and checked against) the remote-tracking branch
+              instead, so there's no ``git pull`` or fast-forward check
+            - ``workflow finish`` doesn't check for squash-merges or
+              rebase-merges, since comparing patch IDs reads the contents of
+              every changed file
+            - ``workflow.fetchMaxAge`` and ``workflow.mirrorPath`` are ignored
+
+            Can be enabled for a single command with ``--ci``.
+
+            **E.g.:** In a CI job:
+
+            ::
+
+                git clone --filter=blob:none <url> repo
+                cd repo
+                git config workflow.ciMode true
+                workflow start -C -T -d bump-dependencies -i ci
+            ''')
+        self.CI_MODE = self.get_workflow_config(
+            'ciMode', default=False,
+            config_type=self.TYPE_BOOL
+        )
+
+        # Worktrees ------------------------------------------------------------
+        # worktreePath
+        self.WORKTREE_PATH_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``'../{repo}-worktrees/{branch}'``
+
+            Path to create new worktrees at when using ``workflow start
+            --worktree``. Relative paths are relative to the root of the main
+            worktree. Supports the following placeholders:
+
+              - ``{repo}``: Replaced with the name of the main worktree's
+                directory
+              - ``{branch}``: Replaced with branch name
+            ''')
+        self.WORKTREE_PATH = self.get_workflow_config(
+            'worktreePath', default='../{repo}-worktrees/{branch}'
+        )
+
+        # Syncing --------------------------------------------------------------
+        # syncJobs
+        self.SYNC_JOBS_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``4``
+
+            Maximum number of branches ``workflow sync`` updates at once. Each
+            branch is updated in its own temporary worktree, so higher values
+            use more disk space and I/O.
+            ''')
+        self.SYNC_JOBS = self.get_workflow_config(
+            'syncJobs', default=4,
+            config_type=self.TYPE_INT
+        )
+
         # Commit Templates -----------------------------------------------------
         # TODO Document examples?
         # commitTemplateFormat
@@ -144,6 +335,23 @@ class Configs:
             config_type=self.TYPE_BOOL
         )
 
+        # ticketRegistryPath
+        self.TICKET_REGISTRY_PATH_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``tickets.sqlite3`` in the ``git-workflow`` directory
+            of the user cache directory (e.g. ``~/.cache/git-workflow``)
+
+            Path of the per-user ticket registry, which records the ticket,
+            repo and branch of every commit template configured with
+            ``workflow set-template`` (or ``workflow start``) across all
+            repos. Used by ``workflow where`` and ``workflow checkout``. Set
+            in your global config to change it for all repos, or set it to an
+            empty string to disable the registry.
+            ''')
+        self.TICKET_REGISTRY_PATH = ticket_registry.get_registry_path(
+            self.get_workflow_config('ticketRegistryPath')
+        )
+
         # Confirmation Prompts -------------------------------------------------
         # finishBranchConfirmationPrompt
         self.FINISH_BRANCH_CONFIRMATION_PROMPT_DOC = textwrap.dedent(
@@ -186,8 +394,43 @@ class Configs:
             config_type=self.TYPE_BOOL
         )
 
+        # Branch Picker --------------------------------------------------------
+        # branchPicker
+        self.BRANCH_PICKER_DOC = textwrap.dedent(
+            '''\
+            **Default:** ``true``
+
+            If ``true``, ``workflow finish`` and ``workflow unset-template``
+            will show an interactive branch picker when run in a terminal
+            without a branch. Type to filter branches (fuzzy matching), use
+            the arrow keys to move, Tab to select multiple branches and Enter
+            to confirm. The current branch is listed first, followed by
+            workflow branches from newest to oldest. If ``false``, the current
+            branch is used.
+            ''')
+        self.BRANCH_PICKER = self.get_workflow_config(
+            'branchPicker', default=True,
+            config_type=self.TYPE_BOOL
+        )
+
         # END CONFIGS ==========================================================
 
+        if not self._cache_hit:
+            stat_cache.store(cache_path, cache_key, cache_stamp, self._values)
+
+    def get_cache_key(self):
+        """Returns the key that cached values must have been stored with to be
+        valid: the cache and package versions, environment variables that
+        affect config files, and the contents of HEAD (since ``onbranch``
+        includes depend on it).
+        """
+        try:
+            with open(os.path.join(self.repo.git_dir, 'HEAD')) as f:
+                head = f.read().strip()
+        except OSError:
+            head = None
+        return (self.CACHE_VERSION, __version__, get_config_environment(), head)
+
     def get_workflow_config(self, key, default=None,
                             config_type=None, data_type=None,
                             section='workflow'):
@@ -207,15 +450,18 @@ class Configs:
             or None if no default is specified. If data_type is set, will be
             passed through convert_config_value()
         """
-        value = default
         config = f'{section}.{key}' if section else key
-        if data_type is None and config_type is not None:
-            data_type = config_type
-        default_arg = None if default is None else str(default)
-        value = self.get_config(config,
-                                default=default_arg, type=config_type)
-        if value is not None and data_type:
-            value = self.convert_config_value(value, data_type)
+        if config in self._values:
+            value = self._values[config]
+        else:
+            if data_type is None and config_type is not None:
+                data_type = config_type
+            default_arg = None if default is None else str(default)
+            value = self.get_config(config,
+                                    default=default_arg, type=config_type)
+            if value is not None and data_type:
+                value = self.convert_config_value(value, data_type)
+            self._values[config] = value
         # Show config name and value in debug mode
         if self.debug:
             print(f'{config}: "{value}"')
@@ -0,0 +1,556 @@
+"""Lightweight git repository handle.
+
+Reads repository metadata (``HEAD``, loose refs, ``packed-refs`` and config
+files) directly from the git dir instead of going through GitPython objects or
+spawning git. Files are cached by their stat info, so repeated reads during a
+command are free while changes made by git commands (e.g. a checkout) are
+still picked up. ``packed-refs`` is binary-searched rather than parsed (see
+:mod:`git_workflow.utils.packed_refs`).
+
+Anything that can't be answered from these files is delegated to the git
+executable through :class:`Git`, which follows GitPython's conventions for
+converting keyword arguments to command line options.
+"""
+from collections import namedtuple
+import os
+from .packed_refs import PackedRefs
+
+
+# Exceptions
+
+class GitCommandError(Exception):
+    """Raised when a git command exits with a non-zero status."""
+
+    def __init__(self, command, status, stderr=None, stdout=None):
+        """Constructor
+
+        :param command: List of command line arguments
+        :param status: Exit status of the command
+        :param stderr: (Optional) Error output of the command
+        :param stdout: (Optional) Output of the command
+        """
+        self.command = command
+        self.status = status
+        self.stderr = _decode(stderr) if stderr else ''
+        self.stdout = _decode(stdout) if stdout else ''
+        super().__init__(command, status, self.stderr)
+
+    def __str__(self):
+        message = (f"Cmd('git') failed due to: exit code({self.status})\n"
+                   f"  cmdline: {' '.join(map(str, self.command))}")
+        if self.stderr.strip():
+            message += f"\n  stderr: '{self.stderr.strip()}'"
+        return message
+
+
+class InvalidGitRepositoryError(Exception):
+    """Raised when a path is not inside a git repository."""
+
+
+class NoSuchPathError(OSError):
+    """Raised when the path to open a repository at doesn't exist."""
+
+
+def _decode(value):
+    """Decode command output if it's bytes."""
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+
+
+def get_config_environment():
+    """Returns the environment variables that affect which config files git
+    reads (or add config values), as a sorted tuple of (name, value) tuples.
+    """
+    return tuple(sorted(
+        (name, value) for name, value in os.environ.items()
+        if name.startswith('GIT_CONFIG') or name in ('HOME', 'XDG_CONFIG_HOME')
+    ))
+
+
+# Git Command Runner
+
+class Git:
+    """Runs git commands.
+
+    Calling an attribute runs the git subcommand of the same name (with
+    underscores replaced by hyphens), e.g. ``git.rev_parse('HEAD')``.
+    Keyword arguments are converted to options before positional arguments:
+    ``True`` becomes a flag (``-b`` or ``--no-track``), other values are
+    passed as ``-b <value>`` or ``--file=<value>``, and ``False``/``None`` are
+    omitted. Output is returned as a string without its trailing newline.
+    """
+
+    #: Keyword arguments passed to execute() instead of being converted to
+    #: command line options
+    EXECUTE_KWARGS = ('stdout_as_string', 'input', 'env')
+
+    def __init__(self, working_dir=None):
+        """Constructor
+
+        :param working_dir: (Optional) Directory to run commands in
+        """
+        self.working_dir = working_dir
+        self._version_info = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call_process(name, *args, **kwargs)
+
+    @property
+    def version_info(self):
+        """Tuple with the major, minor and patch version of git."""
+        if self._version_info is None:
+            version = self.version().split(' ')[2]
+            self._version_info = tuple(
+                int(number) for number in version.split('.')[:3] if number.isdigit()
+            )
+        return self._version_info
+
+    @staticmethod
+    def transform_kwargs(**kwargs):
+        """Convert keyword arguments to command line options.
+
+        :return: List of command line arguments
+        """
+        options = []
+        for name, value in kwargs.items():
+            for item in value if isinstance(value, (list, tuple)) else [value]:
+                if item is None or item is False:
+                    continue
+                if len(name) == 1:
+                    options.append(f'-{name}')
+                    if item is not True:
+                        options.append(str(item))
+                else:
+                    option = '--' + name.replace('_', '-')
+                    options.append(option if item is True else f'{option}={item}')
+        return options
+
+    def _call_process(self, method, *args, **kwargs):
+        execute_kwargs = {
+            name: kwargs.pop(name) for name in self.EXECUTE_KWARGS if name in kwargs
+        }
+        command = ['git', method.replace('_', '-'), *self.transform_kwargs(**kwargs)]
+        command.extend(str(arg) for arg in args if arg is not None)
+        return self.execute(command, **execute_kwargs)
+
+    def execute(self, command, stdout_as_string=True, input=None, env=None):
+        """Run a git command and return its output.
+
+        :param command: List of command line arguments, starting with 'git'
+        :param stdout_as_string: (Default: True) If False, return output as
+            bytes
+        :param input: (Optional) Text to write to the command's stdin
+        :param env: (Optional) Dictionary of environment variables to set for
+            the command (in addition to the current environment)
+
+        :return: Output of the command, without the trailing newline
+        """
+        # Deferred so hooks that only read files don't pay for the import
+        import subprocess
+        env = dict(os.environ, **(env or {}), LANGUAGE='C', LC_ALL='C')
+        process = subprocess.run(
+            command, cwd=self.working_dir, env=env,
+            input=input.encode() if isinstance(input, str) else input,
+            stdin=None if input is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        if process.returncode != 0:
+            raise GitCommandError(command, process.returncode,
+                                  process.stderr, process.stdout)
+        stdout = process.stdout
+        if stdout.endswith(b'\n'):
+            stdout = stdout[:-1]
+        return _decode(stdout) if stdout_as_string else stdout
+
+
+# Config Files
+
+def parse_config(text):
+    """Parse the contents of a git config file.
+
+    Supports sections with and without subsections, quoted values, escape
+    sequences, comments and line continuations. Section and key names are
+    lowercased, subsection names are kept as is.
+
+    :param text: Contents of the config file
+
+    :return: List of (key, value) tuples in file order, where key is the full
+        config name (e.g. ``branch.main.remote``). Keys without a value have a
+        value of None
+    """
+    entries = []
+    section = None
+    lines = iter(text.splitlines())
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or stripped[0] in '#;':
+            continue
+        if stripped.startswith('['):
+            header, _, rest = stripped[1:].partition(']')
+            name, _, subsection = header.partition(' ')
+            subsection = subsection.strip()
+            if subsection.startswith('"') and subsection.endswith('"'):
+                subsection = subsection[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+                section = f'{name.lower()}.{subsection}'
+            elif '.' in name:
+                # Deprecated [section.subsection] syntax
+                name, _, subsection = name.partition('.')
+                section = f'{name.lower()}.{subsection.lower()}'
+            else:
+                section = name.lower()
+            stripped = rest.strip()
+            if not stripped or stripped[0] in '#;':
+                continue
+        if section is None:
+            continue
+        name, equals, value = stripped.partition('=')
+        name = name.strip().lower()
+        if not equals:
+            entries.append((f'{section}.{name}', None))
+            continue
+        # Join continuation lines
+        while value.endswith('\\') and not value.endswith('\\\\'):
+            value = value[:-1] + next(lines, '')
+        entries.append((f'{section}.{name}', _parse_config_value(value)))
+    return entries
+
+
+#: Escape sequences supported in config values
+_CONFIG_ESCAPES = {'n': '\n', 't': '\t', 'b': '\b', '"': '"', '\\': '\\'}
+
+
+def _parse_config_value(value):
+    """Parse a config value, handling quotes, escapes and trailing comments."""
+    result = []
+    in_quotes = False
+    # Whitespace is only kept between non-whitespace characters or in quotes
+    pending_space = ''
+    chars = iter(value.strip())
+    for char in chars:
+        if char == '"':
+            in_quotes = not in_quotes
+            result.append(pending_space)
+            pending_space = ''
+        elif char == '\\':
+            result.append(pending_space + _CONFIG_ESCAPES.get(next(chars, ''), ''))
+            pending_space = ''
+        elif char in '#;' and not in_quotes:
+            break
+        elif char.isspace() and not in_quotes:
+            pending_space += char
+        else:
+            result.append(pending_space + char)
+            pending_space = ''
+    return ''.join(result)
+
+
+# Repository
+
+#: Refs that are stored per worktree rather than in the common git dir
+PER_WORKTREE_REF_PREFIXES = ('refs/bisect/', 'refs/worktree/', 'refs/rewritten/')
+
+#: Upstream details for a branch. remote_name and merge_ref are the values of
+#: branch.<name>.remote and branch.<name>.merge, ref is the full name of the
+#: remote-tracking ref
+TrackingInfo = namedtuple('TrackingInfo', ['remote_name', 'merge_ref', 'ref'])
+
+
+class Repo:
+    """Handle for a git repository.
+
+    :ivar git_dir: Path to the git dir (``.git``, or the worktree's dir under
+        ``.git/worktrees`` for linked worktrees)
+    :ivar common_dir: Path to the git dir shared by all worktrees
+    :ivar working_tree_dir: Path to the working tree, or None for bare repos
+    :ivar git: Git instance that runs commands in the working tree
+    """
+
+    def __init__(self, path=None, search_parent_directories=False):
+        """Constructor
+
+        :param path: (Optional) Path to the repository. Defaults to the
+            current directory
+        :param search_parent_directories: (Default: False) If True, also look
+            for a repository in parent directories of path
+
+        :raises NoSuchPathError: if path doesn't exist
+        :raises InvalidGitRepositoryError: if no repository was found
+        """
+        path = os.path.abspath(path or os.getcwd())
+        if not os.path.exists(path):
+            raise NoSuchPathError(path)
+        self.git_dir, self.working_tree_dir = self.find_git_dir(path, search_parent_directories)
+        commondir_path = os.path.join(self.git_dir, 'commondir')
+        self.common_dir = self.git_dir
+        if os.path.isfile(commondir_path):
+            with open(commondir_path) as f:
+                self.common_dir = os.path.normpath(os.path.join(self.git_dir, f.read().strip()))
+        self.git = Git(self.working_tree_dir or self.git_dir)
+        self.packed_refs = PackedRefs(os.path.join(self.common_dir, 'packed-refs'))
+        # Maps file paths to (stat key, parsed contents)
+        self._file_cache = {}
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} {self.working_tree_dir or self.git_dir!r}>'
+
+    @staticmethod
+    def find_git_dir(path, search_parent_directories=False):
+        """Find the git dir and working tree for a path.
+
+        :param path: Absolute path to start looking in
+        :param search_parent_directories: (Default: False) If True, also look
+            in parent directories
+
+        :return: Tuple of (git_dir, working_tree_dir). working_tree_dir is
+            None for bare repositories
+
+        :raises InvalidGitRepositoryError: if no repository was found
+        """
+        current = path
+        while True:
+            dot_git = os.path.join(current, '.git')
+            if os.path.isdir(dot_git):
+                return dot_git, current
+            if os.path.isfile(dot_git):
+                # Linked worktrees and submodules use a gitdir file
+                with open(dot_git) as f:
+                    content = f.read().strip()
+                if content.startswith('gitdir:'):
+                    git_dir = content[len('gitdir:'):].strip()
+                    return os.path.normpath(os.path.join(current, git_dir)), current
+            if (os.path.isfile(os.path.join(current, 'HEAD'))
+                    and os.path.isdir(os.path.join(current, 'objects'))
+                    and os.path.isdir(os.path.join(current, 'refs'))):
+                return current, None
+            parent = os.path.dirname(current)
+            if not search_parent_directories or parent == current:
+                raise InvalidGitRepositoryError(path)
+            current = parent
+
+    # Cached Files
+
+    def read_cached(self, path, parse):
+        """Read and parse a file, reusing the previous result if the file
+        hasn't changed since it was last read.
+
+        :param path: Path of the file to read
+        :param parse: Function that takes the file contents (str) and returns
+            the parsed value
+
+        :return: Parsed contents, or None if the file doesn't exist
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._file_cache.pop(path, None)
+            return None
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = self._file_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(path, encoding='utf-8', errors='replace') as f:
+            value = parse(f.read())
+        self._file_cache[path] = (key, value)
+        return value
+
+    # Refs
+
+    def read_ref(self, ref):
+        """Resolve a ref to a commit SHA without running git.
+
+        Loose refs take precedence over packed refs, and symbolic refs (like
+        ``HEAD``) are followed. Only full ref names are supported, use ``git
+        rev-parse`` for anything else.
+
+        :param ref: Full name of the ref, e.g. ``refs/heads/main`` or ``HEAD``
+
+        :return: SHA the ref points to, or None if it doesn't exist
+        """
+        for _ in range(10):
+            value = self._read_loose_ref(ref)
+            if value is None:
+                return self.packed_refs.get(ref)
+            if not value.startswith('ref:'):
+                return value
+            ref = value[len('ref:'):].strip()
+        return None
+
+    def _read_loose_ref(self, ref):
+        """Returns the contents of a loose ref file, or None if it doesn't
+        exist."""
+        if ref.startswith('refs/') and not ref.startswith(PER_WORKTREE_REF_PREFIXES):
+            ref_dir = self.common_dir
+        else:
+            ref_dir = self.git_dir
+        try:
+            with open(os.path.join(ref_dir, ref)) as f:
+                return f.read().strip() or None
+        except (OSError, ValueError):
+            return None
+
+    def get_refs(self, prefix='refs/heads/'):
+        """Get all refs that start with prefix without running git.
+
+        :param prefix: (Default: 'refs/heads/') Ref name prefix. Must end
+            with a slash
+
+        :return: Dictionary mapping ref names (with prefix removed) to SHAs,
+            sorted by name
+        """
+        refs = dict(self.packed_refs.iter_prefix(prefix))
+        # Overlay loose refs
+        ref_dir = self.git_dir if prefix.startswith(PER_WORKTREE_REF_PREFIXES) else self.common_dir
+        loose_dir = os.path.join(ref_dir, prefix)
+        for dir_path, _, file_names in os.walk(loose_dir):
+            for file_name in file_names:
+                if file_name.endswith('.lock'):
+                    continue
+                ref = os.path.relpath(os.path.join(dir_path, file_name), ref_dir)
+                ref = ref.replace(os.sep, '/')
+                sha = self.read_ref(ref)
+                if sha is not None:
+                    refs[ref] = sha
+        return {ref[len(prefix):]: refs[ref] for ref in sorted(refs)}
+
+    def ref_exists(self, ref):
+        """Returns True if a ref exists.
+
+        :param ref: Full name of the ref, e.g. ``refs/heads/main``
+        """
+        return self.read_ref(ref) is not None
+
+    @property
+    def active_branch_name(self):
+        """Name of the branch checked out in this worktree.
+
+        :raises TypeError: if HEAD is detached
+        """
+        head = self._read_loose_ref('HEAD') or ''
+        if not head.startswith('ref: refs/heads/'):
+            raise TypeError(f"HEAD is a detached symbolic reference as it points to '{head}'")
+        return head[len('ref: refs/heads/'):]
+
+    # Config
+
+    def get_config_entries(self):
+        """Returns (key, value) tuples from the repo's local config (and any
+        files it includes with ``include.path``). Conditional includes are not
+        followed.
+        """
+        entries = []
+        self._read_config_file(os.path.join(self.common_dir, 'config'), entries, depth=0)
+        return entries
+
+    def _read_config_file(self, path, entries, depth):
+        if depth > 10:
+            return
+        for key, value in self.read_cached(path, parse_config) or []:
+            entries.append((key, value))
+            if key == 'include.path' and value:
+                include_path = os.path.join(os.path.dirname(path), os.path.expanduser(value))
+                self._read_config_file(include_path, entries, depth + 1)
+
+    def get_config_files(self):
+        """Get the path of every file that git may read config values from for
+        this repo: the system, global, XDG and local configs, the worktree
+        config, and every file they include (conditionally or not, followed
+        recursively). Paths are included even if the file doesn't exist, so
+        creating it can be detected.
+
+        The system config's location depends on how git was installed (e.g.
+        Homebrew or Git for Windows), so every file ``git config --list
+        --show-origin`` reads from is added as well. This runs git, so only
+        call this when a cache is stale.
+
+        :return: List of absolute paths
+        """
+        home = os.path.expanduser('~')
+        paths = []
+        if not os.environ.get('GIT_CONFIG_NOSYSTEM'):
+            paths.append(os.environ.get('GIT_CONFIG_SYSTEM') or '/etc/gitconfig')
+        if os.environ.get('GIT_CONFIG_GLOBAL'):
+            paths.append(os.environ['GIT_CONFIG_GLOBAL'])
+        else:
+            xdg_config_home = os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config')
+            paths.append(os.path.join(xdg_config_home, 'git', 'config'))
+            paths.append(os.path.join(home, '.gitconfig'))
+        paths.append(os.path.join(self.common_dir, 'config'))
+        paths.append(os.path.join(self.git_dir, 'config.worktree'))
+        config_files = []
+        for path in paths:
+            self._find_included_files(os.path.abspath(path), config_files, depth=0)
+        for path in self.get_config_origins():
+            self._find_included_files(path, config_files, depth=0)
+        return config_files
+
+    def get_config_origins(self):
+        """Returns the absolute paths of the files git actually reads config
+        values from for this repo (only ones that exist and have values)."""
+        try:
+            output = self.git.config(list=True, show_origin=True, null=True)
+        except GitCommandError:
+            return []
+        origins = []
+        # Entries are <origin>NUL<key>NL<value>NUL
+        for origin in output.split('\0')[::2]:
+            if origin.startswith('file:'):
+                path = os.path.abspath(os.path.join(self.git.working_dir, origin[len('file:'):]))
+                if path not in origins:
+                    origins.append(path)
+        return origins
+
+    def _find_included_files(self, path, config_files, depth):
+        if depth > 10 or path in config_files:
+            return
+        config_files.append(path)
+        for key, value in self.read_cached(path, parse_config) or []:
+            if value and key.startswith(('include.', 'includeif.')) and key.endswith('.path'):
+                include_path = os.path.join(os.path.dirname(path), os.path.expanduser(value))
+                self._find_included_files(os.path.abspath(include_path), config_files, depth + 1)
+
+    def get_config_value(self, key, default=None):
+        """Get the last value of a key in the repo's local config.
+
+        :param key: Full config name. The section and key name are case
+            insensitive, the subsection is not
+        :param default: (Optional) Value to return if key isn't set
+
+        :return: Config value
+        """
+        section, _, name = key.rpartition('.')
+        first, dot, subsection = section.partition('.')
+        key = first.lower() + dot + subsection + '.' + name.lower()
+        value = default
+        for entry_key, entry_value in self.get_config_entries():
+            if entry_key == key:
+                value = entry_value
+        return value
+
+    @property
+    def remote_names(self):
+        """Names of the repo's remotes, in the order they were configured."""
+        names = []
+        for key, _ in self.get_config_entries():
+            if key.startswith('remote.'):
+                name = key[len('remote.'):].rpartition('.')[0]
+                if name and name not in names:
+                    names.append(name)
+        return names
+
+    def get_tracking_info(self, branch_name):
+        """Get upstream details for a branch.
+
+        :param branch_name: Name of the branch
+
+        :return: TrackingInfo, or None if the branch has no upstream
+        """
+        remote_name = self.get_config_value(f'branch.{branch_name}.remote')
+        merge_ref = self.get_config_value(f'branch.{branch_name}.merge')
+        if not remote_name or not merge_ref:
+            return None
+        if remote_name == '.':
+            # Upstream is a local branch
+            return TrackingInfo(remote_name, merge_ref, merge_ref)
+        ref = f'refs/remotes/{remote_name}/{merge_ref[len("refs/heads/"):]}'
+        return TrackingInfo(remote_name, merge_ref, ref)
@@ -0,0 +1,247 @@
+"""Git hooks that enforce workflow conventions.
+
+The ``commit-msg`` hook rejects commits on branches with a ticket number
+configured (via ``workflow start -t`` or ``workflow set-template``) unless the
+message starts with the prefix from ``workflow.commitTemplateFormat``, where
+``{ticket}`` matches ``workflow.ticketInputFormatRegex``.
+
+Hooks run on every commit, so this module avoids anything slow on the common
+path. The per-branch patterns are built once and cached in the git dir along
+with the stat info of every config file they were derived from. As long as
+none of those files change, checking a message only reads ``HEAD``, stats the
+config files and runs one regex, without spawning git. The installed hook
+script also loads this module without the rest of git_workflow.
+"""
+import os
+import re
+import string
+import sys
+from . import stat_cache
+from .git_repo import Repo, get_config_environment, parse_config
+
+#: Filename of the pattern cache (relative to the common git dir)
+CACHE_FILENAME = 'workflow_hook_cache'
+#: Bump when the cache format changes
+CACHE_VERSION = 2
+
+#: Commit messages generated by git that are always allowed
+ALLOWED_MESSAGE_PREFIXES = ('Merge ', 'Revert "', 'fixup! ', 'squash! ', 'amend! ')
+
+#: Hooks that can be installed
+HOOKS = ['commit-msg']
+
+#: Marks hook scripts installed by install_hook()
+HOOK_MARKER = '# Installed by workflow hook --install'
+
+#: Hook script template. Stub modules are registered for the git_workflow
+#: packages so their __init__ files (which import every command) don't run,
+#: and -S skips site-packages setup since only absolute paths are used
+HOOK_SCRIPT_TEMPLATE = '''\
+#!{python} -S
+{marker}
+import sys
+import types
+try:
+    for name, path in {packages!r}:
+        package = types.ModuleType(name)
+        package.__path__ = [path]
+        sys.modules[name] = package
+    from git_workflow.utils.hooks import main
+except ImportError as e:
+    sys.stderr.write('workflow {hook} hook skipped: %s\\n' % e)
+    sys.exit(0)
+sys.exit(main([{hook!r}] + sys.argv[1:]))
+'''
+
+
+# Pattern Cache
+
+def get_rule_files(repo):
+    """Returns the paths of every file that commit message rules are derived
+    from: all config files (see Repo.get_config_files()) and the branch
+    metadata file.
+
+    :param repo: Repo object
+    """
+    paths = repo.get_config_files()
+    for path in (os.path.join(repo.common_dir, 'config_workflow'),
+                 os.path.join(repo.common_dir, 'workflow_branches')):
+        if path not in paths:
+            paths.append(path)
+    return paths
+
+
+def get_commit_msg_rules(repo):
+    """Get commit message rules for every branch with a ticket, using the
+    cache if none of the files they're derived from changed.
+
+    :param repo: Repo object
+
+    :return: Dictionary mapping branch names to (pattern, example) tuples,
+        where pattern is the source of a regex messages must match and example
+        is a correctly formatted prefix
+    """
+    cache_path = os.path.join(repo.common_dir, CACHE_FILENAME)
+    cache_key = (CACHE_VERSION, get_config_environment())
+    rules = stat_cache.load(cache_path, cache_key)
+    if rules is not None:
+        return rules
+    stamp = stat_cache.stat_files(get_rule_files(repo))
+    rules = build_commit_msg_rules(repo)
+    stat_cache.store(cache_path, cache_key, stamp, rules)
+    return rules
+
+
+def build_commit_msg_rules(repo):
+    """Build commit message rules for every branch with a ticket from the
+    current configs. Only called when the cache is stale.
+
+    :param repo: Repo object
+
+    :return: See get_commit_msg_rules()
+    """
+    # Deferred since loading configs is slow
+    from .configs import Configs
+    configs = Configs(repo, no_init=True)
+    # Branches with a ticket recorded or a commit template configured
+    tickets = {}
+    metadata_path = os.path.join(repo.common_dir, 'workflow_branches')
+    branch_entries = repo.read_cached(metadata_path, parse_config) or []
+    for key, value in branch_entries:
+        branch_name, _, name = key[len('branch.'):].rpartition('.')
+        if name == 'ticket' and value:
+            tickets[branch_name] = value
+    template_entries = repo.read_cached(os.path.join(repo.common_dir, 'config_workflow'),
+                                        parse_config) or []
+    for key, _ in template_entries:
+        if key.startswith('includeif.onbranch:') and key.endswith('.path'):
+            tickets.setdefault(key[len('includeif.onbranch:'):-len('.path')], None)
+    initials = configs.INITIALS or ''
+    return {
+        branch_name: (
+            build_commit_msg_pattern(configs.COMMIT_TEMPLATE_FORMAT,
+                                     configs.TICKET_INPUT_FORMAT_REGEX,
+                                     branch_name, initials),
+            configs.COMMIT_TEMPLATE_FORMAT.format(ticket=ticket or 'TICKET-123',
+                                                  branch=branch_name, initials=initials),
+        )
+        for branch_name, ticket in tickets.items()
+    }
+
+
+def build_commit_msg_pattern(template_format, ticket_regex, branch_name, initials=''):
+    """Convert a commit template format into a regex that matches messages
+    starting with the formatted template.
+
+    :param template_format: Value of workflow.commitTemplateFormat
+    :param ticket_regex: Value of workflow.ticketInputFormatRegex
+    :param branch_name: Name of the branch (for ``{branch}``)
+    :param initials: (Optional) User's initials (for ``{initials}``)
+
+    :return: Regex source
+    """
+    replacements = {
+        'ticket': f'(?:{ticket_regex})',
+        'branch': re.escape(branch_name),
+        'initials': re.escape(initials),
+    }
+    pattern = ''
+    # Trailing whitespace in the template isn't required in messages
+    for literal, field, _, _ in string.Formatter().parse(template_format.rstrip()):
+        pattern += re.escape(literal)
+        if field is not None:
+            pattern += replacements.get(field, '.*?')
+    return pattern
+
+
+# Checks
+
+def get_message_subject(message):
+    """Returns the first line of a commit message that isn't blank or a
+    comment."""
+    for line in message.splitlines():
+        if line.strip() and not line.startswith('#'):
+            return line
+    return ''
+
+
+def check_commit_msg(repo, message):
+    """Check a commit message against the current branch's rules.
+
+    :param repo: Repo object
+    :param message: Commit message
+
+    :return: Error message, or None if the message is valid
+    """
+    try:
+        branch_name = repo.active_branch_name
+    except TypeError:
+        return None
+    rule = get_commit_msg_rules(repo).get(branch_name)
+    if rule is None:
+        return None
+    pattern, example = rule
+    subject = get_message_subject(message)
+    if not subject or subject.startswith(ALLOWED_MESSAGE_PREFIXES):
+        return None
+    if re.match(pattern, subject):
+        return None
+    return (f'Commit messages on {branch_name} must start with the ticket prefix, '
+            f'e.g.: {example.strip()} <message>')
+
+
+# Installation
+
+def install_hook(repo, hook='commit-msg', force=False):
+    """Install a hook script in the repo's hooks directory (respecting
+    core.hooksPath).
+
+    :param repo: Repo object
+    :param hook: (Default: 'commit-msg') Name of the hook to install
+    :param force: (Default: False) If True, replace existing hooks that
+        weren't installed by this function
+
+    :return: Path of the installed hook
+
+    :raises Exception: if a different hook already exists and force is False
+    """
+    hooks_dir = repo.git.rev_parse('--git-path', 'hooks')
+    hooks_dir = os.path.join(repo.working_tree_dir or repo.git_dir, hooks_dir)
+    hook_path = os.path.normpath(os.path.join(hooks_dir, hook))
+    if os.path.exists(hook_path) and not force:
+        with open(hook_path, errors='replace') as f:
+            if HOOK_MARKER not in f.read():
+                raise Exception(f'{hook_path} already exists. Use --force to replace it.')
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = HOOK_SCRIPT_TEMPLATE.format(
+        python=sys.executable, marker=HOOK_MARKER, hook=hook,
+        packages=(('git_workflow', package_dir),
+                  ('git_workflow.utils', os.path.join(package_dir, 'utils'))),
+    )
+    os.makedirs(hooks_dir, exist_ok=True)
+    with open(hook_path, 'w') as f:
+        f.write(script)
+    os.chmod(hook_path, 0o755)
+    return hook_path
+
+
+# Entry Point
+
+def main(argv):
+    """Run a hook. Used by installed hook scripts.
+
+    :param argv: Hook name followed by the arguments git passed to the hook
+
+    :return: Exit code
+    """
+    hook, args = argv[0], argv[1:]
+    if hook != 'commit-msg' or not args:
+        sys.stderr.write(f'Unsupported hook: {" ".join(argv)}\n')
+        return 1
+    with open(args[0], encoding='utf-8', errors='replace') as f:
+        message = f.read()
+    error = check_commit_msg(Repo(search_parent_directories=True), message)
+    if error is not None:
+        sys.stderr.write(error + '\n')
+        return 1
+    return 0
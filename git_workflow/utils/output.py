@@ -0,0 +1,135 @@
+"""Buffered, throttled progress reporting for bulk operations.
+
+Printing a line per item (e.g. per branch cleaned up) means a separate colored
+write per item, which is slow over SSH and floods CI logs. A Progress instead
+collects output in a buffer and writes it all at once, at most every
+TTY_INTERVAL seconds:
+
+- In a terminal, a single progress line is updated in place
+- Otherwise (e.g. in CI logs), a summary line is written every LOG_INTERVAL
+  seconds
+- Per-item details are only shown at verbosity 2 (``--verbose``). Warnings are
+  always shown (unless verbosity is 0)
+"""
+import sys
+import time
+from cmd_utils import cmd
+
+#: Moves to the start of the line and clears everything below it
+CLEAR = '\r\x1b[J'
+#: Seconds between redraws of the progress line in a terminal
+TTY_INTERVAL = 0.1
+#: Seconds between summary lines when output isn't a terminal
+LOG_INTERVAL = 5
+
+
+def pluralize(count, singular, plural=None):
+    """Returns count followed by the singular or plural form of a noun (e.g.
+    '1 branch', '2 branches').
+
+    :param count: Number of items
+    :param singular: Singular noun
+    :param plural: (Default: singular + 's') Plural noun
+    """
+    if count == 1:
+        return f'{count} {singular}'
+    return f'{count} {plural or singular + "s"}'
+
+
+class Progress:
+    """Reports progress of an operation on many items. Use as a context
+    manager, so buffered output is written (and the progress line cleared)
+    when the operation ends, even if it fails.
+    """
+
+    def __init__(self, label, total, verbosity=1, stream=None):
+        """Constructor
+
+        :param label: Description of the operation (e.g. 'Deleting branches')
+        :param total: Number of items that will be processed
+        :param verbosity: (Default: 1) Output verbosity level. 0 shows
+            nothing, 2 also shows details for each item
+        :param stream: (Default: sys.stdout) Stream to write to
+        """
+        self.label = label
+        self.total = total
+        self.verbosity = verbosity
+        self.stream = stream or sys.stdout
+        self.is_tty = self.stream.isatty()
+        self.interval = TTY_INTERVAL if self.is_tty else LOG_INTERVAL
+        #: Number of items processed so far
+        self.count = 0
+        self.buffer = []
+        self.last_write = 0.0
+        self.reported_count = None
+        self.line_shown = False
+
+    def __enter__(self):
+        self.write()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finish()
+        return False
+
+    def advance(self, detail=None, count=1):
+        """Count items as processed.
+
+        :param detail: (Optional) Message to show at verbosity 2
+        :param count: (Default: 1) Number of items processed
+        """
+        self.count += count
+        if detail is not None and self.verbosity >= 2:
+            self.buffer.append(cmd.COLORS[cmd.SUCCESS](detail))
+        self.update()
+
+    def warning(self, message):
+        """Show a warning (at verbosity 1 and above)."""
+        if self.verbosity >= 1:
+            self.buffer.append(cmd.COLORS[cmd.WARNING](message))
+        self.update()
+
+    def update(self):
+        """Write buffered output and progress if enough time has passed
+        since the last write."""
+        if time.monotonic() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        """Write buffered output followed by the progress, in one write."""
+        self.last_write = time.monotonic()
+        if self.verbosity < 1:
+            return
+        output = self.flush_buffer()
+        status = f'{self.label}... {self.count}/{self.total}'
+        if self.is_tty:
+            output.append(status)
+            self.line_shown = True
+        elif self.count != self.reported_count:
+            output.append(status + '\n')
+        self.reported_count = self.count
+        self.write_output(output)
+
+    def finish(self):
+        """Write buffered output and clear the progress line."""
+        if self.verbosity >= 1:
+            self.write_output(self.flush_buffer())
+
+    def flush_buffer(self):
+        """Empty the buffer.
+
+        :return: List of strings to write, starting with clearing the
+            progress line if it's shown
+        """
+        output = []
+        if self.line_shown:
+            output.append(CLEAR)
+            self.line_shown = False
+        output.extend(line + '\n' for line in self.buffer)
+        self.buffer = []
+        return output
+
+    def write_output(self, output):
+        if output:
+            self.stream.write(''.join(output))
+            self.stream.flush()
@@ -0,0 +1,172 @@
+"""Fast lookups in large ``packed-refs`` files.
+
+Git keeps ``packed-refs`` sorted by ref name, so instead of parsing the whole
+file, it is memory-mapped and binary-searched. Looking up a ref only touches a
+handful of pages regardless of how many refs the repository has. The mapping
+is reopened whenever the file's mtime, size or inode changes (e.g. after ``git
+pack-refs`` or a ref deletion).
+"""
+import mmap
+import os
+
+#: Header line written by git, followed by a list of traits
+HEADER_PREFIX = b'# pack-refs with:'
+
+
+class PackedRefs:
+    """Read-only index of a ``packed-refs`` file."""
+
+    def __init__(self, path):
+        """Constructor
+
+        :param path: Path to the packed-refs file
+        """
+        self.path = path
+        self._key = None
+        self._file = None
+        self._buffer = b''
+        self._start = 0
+        self._sorted = True
+        # Fallback for files without the 'sorted' trait
+        self._refs = None
+
+    def close(self):
+        """Release the memory map (if any)."""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._buffer = b''
+        self._key = None
+
+    def refresh(self):
+        """Reopen the file if it changed since it was last opened."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.close()
+            self._refs = None
+            return
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if key == self._key:
+            return
+        self.close()
+        self._refs = None
+        self._key = key
+        if not stat.st_size:
+            return
+        f = open(self.path, 'rb')
+        if os.name == 'nt':
+            # Mapped files can't be replaced on Windows, which would prevent
+            # git from rewriting packed-refs
+            with f:
+                self._buffer = f.read()
+        else:
+            self._file = f
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Parse header
+        self._start = 0
+        self._sorted = False
+        if self._buffer[:len(HEADER_PREFIX)] == HEADER_PREFIX:
+            header_end = self._line_end(0)
+            traits = self._buffer[len(HEADER_PREFIX):header_end].split()
+            self._sorted = b'sorted' in traits
+            self._start = min(header_end + 1, len(self._buffer))
+        if not self._sorted:
+            self._refs = dict(self._iter_records(self._start))
+
+    # Lookups
+
+    def get(self, ref):
+        """Get the SHA of a packed ref.
+
+        :param ref: Full name of the ref, e.g. ``refs/heads/main``
+
+        :return: SHA, or None if the ref isn't packed
+        """
+        self.refresh()
+        if self._refs is not None:
+            return self._refs.get(ref)
+        key = ref.encode()
+        position = self._find(key)
+        if position < len(self._buffer):
+            name, sha = self._read_record(position)
+            if name == key:
+                return sha.decode()
+        return None
+
+    def iter_prefix(self, prefix):
+        """Iterate over packed refs whose names start with prefix, in sorted
+        order.
+
+        :param prefix: Ref name prefix, e.g. ``refs/heads/``
+
+        :return: Generator that yields (ref name, SHA) tuples
+        """
+        self.refresh()
+        if self._refs is not None:
+            for name in sorted(self._refs):
+                if name.startswith(prefix):
+                    yield name, self._refs[name]
+            return
+        key = prefix.encode()
+        for name, sha in self._iter_records(self._find(key), raw=True):
+            if not name.startswith(key):
+                break
+            yield name.decode(), sha.decode()
+
+    # Helper Methods
+
+    def _line_end(self, position):
+        end = self._buffer.find(b'\n', position)
+        return len(self._buffer) if end == -1 else end
+
+    def _read_record(self, position):
+        """Returns the (name, sha) bytes of the record starting at position."""
+        end = self._line_end(position)
+        sha, _, name = self._buffer[position:end].partition(b' ')
+        return name.rstrip(b'\r'), sha
+
+    def _next_record(self, position):
+        """Returns the position of the record after the one at position,
+        skipping its peeled line (if any)."""
+        position = self._line_end(position) + 1
+        while position < len(self._buffer) and self._buffer[position:position + 1] == b'^':
+            position = self._line_end(position) + 1
+        return min(position, len(self._buffer))
+
+    def _find(self, key):
+        """Binary search for the first record with a name >= key.
+
+        :param key: Ref name (bytes)
+
+        :return: Position of the record, or the buffer length if there is none
+        """
+        low, high = self._start, len(self._buffer)
+        while low < high:
+            middle = (low + high) // 2
+            # Move back to the start of the record containing middle
+            position = self._buffer.rfind(b'\n', low, middle) + 1 or low
+            while position > low and self._buffer[position:position + 1] == b'^':
+                position = max(self._buffer.rfind(b'\n', low, position - 1) + 1, low)
+            name, _ = self._read_record(position)
+            if name < key:
+                low = self._next_record(position)
+            else:
+                high = position
+        return low
+
+    def _iter_records(self, position, raw=False):
+        """Iterate over records starting at position.
+
+        :return: Generator that yields (name, sha) tuples (bytes if raw,
+            otherwise str)
+        """
+        while position < len(self._buffer):
+            if self._buffer[position:position + 1] in (b'^', b'#', b'\n'):
+                position = self._line_end(position) + 1
+                continue
+            name, sha = self._read_record(position)
+            yield (name, sha) if raw else (name.decode(), sha.decode())
+            position = self._next_record(position)
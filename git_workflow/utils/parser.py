@@ -24,10 +24,15 @@ def get_generic_parent_parser():
     group.add_argument('-V', '--version', action='version',
                        version=f'{__package__}  {__version__}',
                        help='Show version number and exit')
-    # TODO: Implement verbose
-    # group.add_argument('-v', '--verbose', type=int, choices=range(0,3),
-    #                    nargs='?', default=1, const=2,
-    #                    help='Set verbosity level')
+    # Tracing. Defaults are suppressed so subcommand parsers don't override
+    # values passed before the subcommand
+    group.add_argument('--profile', metavar='<file>', default=argparse.SUPPRESS,
+                       help='Write a Chrome trace of where time was spent to <file>')
+    group.add_argument('--cprofile', action='store_true', default=argparse.SUPPRESS,
+                       help='With --profile, also write a cProfile dump to <file>.prof')
+    group.add_argument('-v', '--verbose', metavar='<level>', type=int, choices=range(0, 3),
+                       nargs='?', const=2, default=argparse.SUPPRESS,
+                       help='Set verbosity level: 0 (quiet), 1 (default) or 2 (details, same as -v)')
     return parser
 
 
@@ -0,0 +1,296 @@
+"""Detect branches whose changes already exist upstream by comparing patch IDs.
+
+Branches that were squash-merged or rebase-merged on the server are not
+ancestors of the base branch, so ``git branch -d`` and ``git for-each-ref
+--merged`` do not consider them merged. Comparing patch IDs (like ``git
+cherry`` does) detects these branches regardless of how their commits were
+rewritten.
+
+Patch IDs are persisted in a cache keyed by commit SHA, so repeated runs only
+need to compute patch IDs for commits that haven't been seen before.
+"""
+import json
+import os
+import subprocess
+import threading
+from .git_repo import GitCommandError
+
+
+class PatchIdCache:
+    """Persistent mapping of commit SHAs to patch IDs.
+
+    Commits with an empty diff (e.g. merge commits) are stored with an empty
+    string so they aren't recomputed.
+    """
+
+    #: Filename of the cache (relative to the repo's common git dir)
+    FILENAME = 'workflow_patch_ids'
+
+    def __init__(self, repo):
+        """Constructor
+
+        :param repo: Repo object
+        """
+        self.repo = repo
+        self.path = os.path.join(repo.common_dir, self.FILENAME)
+        self.patch_ids = {}
+        self.squash_patch_ids = {}
+        self.modified = False
+        self.load()
+
+    def load(self):
+        """Load cached patch IDs from disk. Unreadable caches are ignored."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.patch_ids = data.get('commits', {})
+            self.squash_patch_ids = data.get('squashes', {})
+        except (OSError, ValueError):
+            self.patch_ids = {}
+            self.squash_patch_ids = {}
+
+    def save(self):
+        """Write the cache to disk if it was modified. The cache file is
+        replaced atomically. Failures are ignored, since patch IDs can always
+        be computed again."""
+        if not self.modified:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'commits': self.patch_ids,
+                    'squashes': self.squash_patch_ids,
+                }, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self.modified = False
+
+    def get_patch_ids(self, shas):
+        """Get patch IDs for commits, computing any that aren't cached.
+
+        All uncached commits are computed with a single ``git diff-tree
+        --stdin | git patch-id --stable`` pipeline.
+
+        :param shas: Iterable of commit SHAs
+
+        :return: Dictionary mapping commit SHAs to patch IDs (or an empty
+            string if the commit has no diff)
+        """
+        shas = list(shas)
+        uncached = [sha for sha in shas if sha not in self.patch_ids]
+        if uncached:
+            computed = compute_patch_ids(self.repo, uncached)
+            for sha in uncached:
+                self.patch_ids[sha] = computed.get(sha, '')
+            self.modified = True
+        return {sha: self.patch_ids[sha] for sha in shas}
+
+    def get_squash_patch_id(self, tip, merge_base):
+        """Get the patch ID of all changes between merge_base and tip combined,
+        i.e. what the branch would look like as a single squashed commit.
+
+        :param tip: SHA of the branch tip
+        :param merge_base: SHA of the merge base with the base branch
+
+        :return: Patch ID of the combined diff, or an empty string if there
+            are no changes
+        """
+        key = f'{merge_base}..{tip}'
+        if key not in self.squash_patch_ids:
+            diff = self.repo.git.diff(merge_base, tip, stdout_as_string=False)
+            self.squash_patch_ids[key] = run_patch_id(self.repo, diff).split(' ')[0]
+            self.modified = True
+        return self.squash_patch_ids[key]
+
+
+def run_patch_id(repo, diff):
+    """Run ``git patch-id --stable`` on diff output.
+
+    :param repo: Repo object
+    :param diff: Diff output (bytes) to compute patch IDs for
+
+    :return: Output of git patch-id
+    """
+    return repo.git.patch_id(stable=True, input=diff).strip()
+
+
+def compute_patch_ids(repo, shas):
+    """Compute patch IDs for multiple commits using one pipeline.
+
+    :param repo: Repo object
+    :param shas: List of commit SHAs
+
+    :return: Dictionary mapping commit SHAs to patch IDs. Commits with no diff
+        are omitted
+    """
+    cwd = repo.working_tree_dir or repo.git_dir
+    diff_tree = subprocess.Popen(
+        ['git', 'diff-tree', '--stdin', '-p', '-r'], cwd=cwd,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    patch_id = subprocess.Popen(
+        ['git', 'patch-id', '--stable'], cwd=cwd,
+        stdin=diff_tree.stdout, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    # Allow diff-tree to receive SIGPIPE if patch-id exits early
+    diff_tree.stdout.close()
+
+    # Write input in a separate thread so a full output pipe can't deadlock
+    def write_input():
+        diff_tree.stdin.write(''.join(f'{sha}\n' for sha in shas).encode())
+        diff_tree.stdin.close()
+
+    writer = threading.Thread(target=write_input)
+    writer.start()
+    output = patch_id.communicate()[0].decode()
+    writer.join()
+    diff_tree.wait()
+    patch_ids = {}
+    for line in output.splitlines():
+        patch_id_sha, _, commit_sha = line.partition(' ')
+        patch_ids[commit_sha] = patch_id_sha
+    return patch_ids
+
+
+def is_merged_upstream(repo, branch, base, cache):
+    """Check if all changes on a branch already exist in base, e.g. because
+    it was squash-merged or rebase-merged.
+
+    :param repo: Repo object
+    :param branch: Branch to check
+    :param base: Branch to check against
+    :param cache: PatchIdCache instance
+
+    :return: True if the branch's changes already exist in base, False if not
+        or if either branch could not be found
+    """
+    try:
+        return branch in find_merged_upstream(repo, [branch], base, cache)
+    except GitCommandError:
+        return False
+
+
+def find_merged_upstream(repo, branches, base, cache):
+    """Find branches whose changes already exist in base.
+
+    A branch is considered merged if every commit on it has an equivalent
+    commit in base (rebase-merge), or if its combined changes match a single
+    commit in base (squash-merge). Branches whose commits all have empty
+    diffs are never considered merged, since there's nothing to compare.
+
+    Commits on either side of every branch are found with two ``git
+    rev-list`` queries in total (see get_ranges()) rather than one per branch.
+
+    :param repo: Repo object
+    :param branches: Iterable of branch names to check
+    :param base: Branch to check against
+    :param cache: PatchIdCache instance. Will be saved before returning
+
+    :return: Set of branch names whose changes exist in base
+    """
+    upstream_shas, ranges = get_ranges(repo, branches, base)
+    # Compute any missing patch IDs in a single pass
+    cache.get_patch_ids(
+        upstream_shas + [sha for branch_shas, _ in ranges.values() for sha in branch_shas]
+    )
+    upstream_patch_ids = set(cache.get_patch_ids(upstream_shas).values())
+    upstream_patch_ids.discard('')
+    merged = set()
+    for branch, (branch_shas, merge_base) in ranges.items():
+        if not branch_shas:
+            merged.add(branch)
+            continue
+        if not upstream_patch_ids:
+            continue
+        branch_patch_ids = [
+            patch_id for patch_id in cache.get_patch_ids(branch_shas).values()
+            if patch_id
+        ]
+        # Rebase-merged: every commit has an upstream equivalent
+        if branch_patch_ids and all(patch_id in upstream_patch_ids for patch_id in branch_patch_ids):
+            merged.add(branch)
+            continue
+        # Squash-merged: combined changes match a single upstream commit
+        if len(branch_shas) > 1:
+            tip = repo.read_ref(f'refs/heads/{branch}') or repo.git.rev_parse(branch)
+            if merge_base is None:
+                merge_base = repo.git.merge_base(base, branch)
+            if cache.get_squash_patch_id(tip, merge_base) in upstream_patch_ids:
+                merged.add(branch)
+    cache.save()
+    return merged
+
+
+def get_ranges(repo, branches, base):
+    """Find the commits unique to each branch and the commits in base they
+    may have been merged as, with two ``git rev-list`` queries in total.
+
+    Commits not in base are listed (with their parents) for all branches at
+    once, and each branch's commits are found by walking them from its tip.
+    Upstream commits are listed once for all branches, starting at the oldest
+    point any of them was branched off at. For more recent branches, this
+    also includes commits that are already in their history, so a branch
+    that only re-applies commits it already contains is considered merged.
+
+    :param repo: Repo object
+    :param branches: Iterable of branch names
+    :param base: Branch to check against
+
+    :return: Tuple of (list of upstream commit SHAs, dictionary mapping each
+        branch to a tuple of (list of SHAs of its non-merge commits that
+        aren't in base, SHA of its merge base with base or None if it
+        couldn't be determined from the listing))
+    """
+    tips = {branch: repo.read_ref(f'refs/heads/{branch}') or branch for branch in branches}
+    if not tips:
+        return [], {}
+    output = repo.git.rev_list('--parents', '--stdin',
+                               input=''.join(f'{tip}\n' for tip in set(tips.values()))
+                               + f'^{base}\n')
+    parents = {}
+    for line in output.splitlines():
+        sha, *commit_parents = line.split(' ')
+        parents[sha] = commit_parents
+    ranges = {}
+    fork_points = set()
+    for branch, tip in tips.items():
+        branch_shas = []
+        boundary = set()
+        stack = [tip] if tip in parents else []
+        seen = set(stack)
+        while stack:
+            sha = stack.pop()
+            if len(parents[sha]) <= 1:
+                branch_shas.append(sha)
+            for parent in parents[sha]:
+                if parent not in parents:
+                    boundary.add(parent)
+                elif parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        fork_points.update(boundary)
+        ranges[branch] = (branch_shas, next(iter(boundary)) if len(boundary) == 1 else None)
+    if not fork_points:
+        return [], ranges
+    # Fold in chunks to keep command lines short
+    fork_points = sorted(fork_points)
+    oldest = None
+    for index in range(0, len(fork_points), 500):
+        chunk = fork_points[index:index + 500] + ([oldest] if oldest else [])
+        try:
+            oldest = repo.git.merge_base('--octopus', *chunk)
+        except GitCommandError:
+            # No common ancestor (unrelated histories)
+            oldest = None
+            break
+    rev_list_args = ['--no-merges', base] + ([f'^{oldest}'] if oldest else [])
+    upstream_shas = repo.git.rev_list(*rev_list_args).split()
+    return upstream_shas, ranges
@@ -0,0 +1,369 @@
+"""Interactive fuzzy picker for choosing items from a long list (e.g. branch
+names).
+
+Candidates are loaded once and filtered as the user types. A candidate matches
+if it contains the characters of the query in order (case insensitive), and
+matches are ranked by how closely they match: consecutive characters and
+characters at the start of a word (after ``-``, ``_``, ``/`` or ``.``) score
+higher, gaps between characters score lower.
+
+To stay responsive with thousands of candidates:
+
+- Matching is done with a single compiled regular expression per query, so
+  non-matching candidates are rejected without any Python-level loops
+- Results are cached per query, and a query that extends a cached one only
+  searches that query's matches (typing narrows the results, backspacing
+  reuses them)
+- Only the visible rows are highlighted and drawn
+"""
+import os
+import re
+import shutil
+import sys
+from cmd_utils import cmd
+try:
+    import termios
+    import tty
+except ImportError:
+    # Not available on Windows
+    termios = None
+
+#: Characters that start a new word in a candidate
+WORD_SEPARATORS = '-_/.'
+#: Score added for a character that follows the previous matched character
+BONUS_CONSECUTIVE = 8
+#: Score added for a character at the start of a word
+BONUS_WORD_START = 6
+#: Score subtracted per unmatched character between the first and last match
+PENALTY_GAP = 1
+
+#: Splits terminal input into keys: escape sequences or single characters
+KEY_REGEX = re.compile(r'\x1b(?:\[[0-9;]*[A-Za-z~]|O[A-Za-z])?|.', re.DOTALL)
+#: Moves to the start of the prompt line and clears everything below it
+CLEAR = '\r\x1b[J'
+#: Maximum number of rows of results shown at once
+MAX_ROWS = 10
+
+
+def is_available():
+    """Returns True if the picker can be used, i.e. both stdin and stdout are
+    terminals that support it."""
+    return termios is not None and sys.stdin.isatty() and sys.stdout.isatty()
+
+
+def compile_query(query):
+    """Compile a regular expression that matches strings containing the
+    characters of query in order, with a group for each character. Lazy
+    matching between groups finds the earliest occurrence of each character.
+
+    :param query: Lowercase query
+
+    :return: Compiled pattern
+    """
+    return re.compile('.*?'.join(f'({re.escape(char)})' for char in query), re.DOTALL)
+
+
+def score_match(candidate, match):
+    """Score a match of a compiled query against a candidate.
+
+    :param candidate: Lowercase candidate
+    :param match: Match object returned by searching candidate with the query
+        pattern
+
+    :return: Score (higher is better)
+    """
+    score = 0
+    previous = -2
+    for position, _ in match.regs[1:]:
+        if position == previous + 1:
+            score += BONUS_CONSECUTIVE
+        elif position == 0 or candidate[position - 1] in WORD_SEPARATORS:
+            score += BONUS_WORD_START
+        previous = position
+    gaps = match.end() - match.start() - (len(match.regs) - 1)
+    return score - gaps * PENALTY_GAP
+
+
+class FuzzyMatcher:
+    """Filters and ranks candidates by a query."""
+
+    def __init__(self, candidates):
+        """Constructor
+
+        :param candidates: List of strings. Order is used to break ties
+            between equally good matches
+        """
+        self.candidates = list(candidates)
+        self._lowercase = [candidate.lower() for candidate in self.candidates]
+        # Query -> indexes of matching candidates, best match first
+        self._results = {'': list(range(len(self.candidates)))}
+
+    def match(self, query):
+        """Filter and rank candidates.
+
+        :param query: Query string. If empty, all candidates match in their
+            original order
+
+        :return: List of indexes of matching candidates, best match first
+        """
+        query = query.lower()
+        if query in self._results:
+            return self._results[query]
+        # Only search the matches of the longest cached prefix, since adding
+        # characters to a query can only remove matches
+        prefix = max((cached for cached in self._results if query.startswith(cached)), key=len)
+        search = compile_query(query).search
+        lowercase = self._lowercase
+        scored = []
+        for index in self._results[prefix]:
+            match = search(lowercase[index])
+            if match is not None:
+                scored.append((-score_match(lowercase[index], match), index))
+        scored.sort()
+        results = [index for _, index in scored]
+        # Forget queries that aren't prefixes of this one (e.g. after the user
+        # edits the middle of a query), so the cache doesn't grow unbounded
+        self._results = {
+            cached: cached_results for cached, cached_results in self._results.items()
+            if query.startswith(cached)
+        }
+        self._results[query] = results
+        return results
+
+    def get_match_positions(self, index, query):
+        """Returns the positions of the characters of query in a candidate
+        (used to highlight them)."""
+        if not query:
+            return []
+        match = compile_query(query.lower()).search(self._lowercase[index])
+        if match is None:
+            return []
+        return [position for position, _ in match.regs[1:]]
+
+
+class Picker:
+    """Interactive terminal UI around FuzzyMatcher.
+
+    - Type to filter, Backspace to delete, Ctrl-U to clear the query
+    - Up/Down (or Ctrl-P/Ctrl-N) to move
+    - Tab to select the current item (if multiple items can be picked), Ctrl-A
+      to select all matches
+    - Enter to confirm the selected items (or the current item if none are
+      selected)
+    - Esc or Ctrl-C to cancel
+    """
+
+    def __init__(self, candidates, prompt_text, multiple=False):
+        """Constructor
+
+        :param candidates: List of strings to pick from. The first one is
+            highlighted initially
+        :param prompt_text: Text to display next to the query
+        :param multiple: (Default: False) If True, allow picking multiple
+            items
+        """
+        self.matcher = FuzzyMatcher(candidates)
+        self.prompt_text = prompt_text
+        self.multiple = multiple
+        self.query = ''
+        self.results = self.matcher.match('')
+        self.cursor = 0
+        self.offset = 0
+        self.selected = set()
+
+    def run(self):
+        """Show the picker until the user confirms or cancels.
+
+        :return: List of picked candidates (in their original order), or an
+            empty list if cancelled
+        """
+        fd = sys.stdin.fileno()
+        old_attributes = termios.tcgetattr(fd)
+        picked = []
+        try:
+            tty.setcbreak(fd)
+            self.render()
+            while True:
+                keys = self.read_keys(fd)
+                if keys is None:
+                    break
+                done = False
+                for key in keys:
+                    done = self.handle_key(key)
+                    if done:
+                        break
+                if done == 'cancel':
+                    break
+                if done == 'confirm':
+                    # Nothing to confirm if there are no matches
+                    picked = self.get_picked()
+                    if picked:
+                        break
+                self.render()
+        except KeyboardInterrupt:
+            picked = []
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old_attributes)
+            self.clear()
+        prompt = cmd.COLORS[cmd.PROMPT](f'> {self.prompt_text}: ')
+        print(prompt + (', '.join(picked) if picked else '(cancelled)'))
+        print('')
+        return picked
+
+    # Input
+
+    @staticmethod
+    def read_keys(fd):
+        """Read pending input and split it into keys. Escape sequences (e.g.
+        arrow keys) are kept together, pasted text is split into characters.
+
+        :return: List of keys, or None at end of input
+        """
+        data = os.read(fd, 64)
+        if not data:
+            return None
+        while True:
+            try:
+                text = data.decode('utf-8')
+                break
+            except UnicodeDecodeError:
+                # Partial multibyte character, read the rest
+                chunk = os.read(fd, 64)
+                if not chunk:
+                    text = data.decode('utf-8', 'ignore')
+                    break
+                data += chunk
+        return [match.group() for match in KEY_REGEX.finditer(text)]
+
+    def handle_key(self, key):
+        """Update the picker's state for a key.
+
+        :return: 'confirm' or 'cancel' if the picker is done, otherwise None
+        """
+        if key in ('\n', '\r'):
+            return 'confirm'
+        if key in ('\x1b', '\x04'):
+            return 'cancel'
+        if key in ('\x1b[A', '\x1bOA', '\x10'):
+            self.move(-1)
+        elif key in ('\x1b[B', '\x1bOB', '\x0e'):
+            self.move(1)
+        elif key == '\t' and self.multiple:
+            self.toggle()
+            self.move(1)
+        elif key == '\x1b[Z' and self.multiple:
+            self.toggle()
+            self.move(-1)
+        elif key == '\x01' and self.multiple:
+            self.selected.update(self.results)
+        elif key in ('\x7f', '\x08'):
+            self.set_query(self.query[:-1])
+        elif key == '\x15':
+            self.set_query('')
+        elif key == '\x17':
+            self.set_query(re.sub(r'[^-_/.\s]*[-_/.\s]*$', '', self.query))
+        elif len(key) == 1 and key.isprintable():
+            self.set_query(self.query + key)
+        return None
+
+    def set_query(self, query):
+        """Filter results by a new query, and move to the best match."""
+        if query == self.query:
+            return
+        self.query = query
+        self.results = self.matcher.match(query)
+        self.cursor = 0
+        self.offset = 0
+
+    def move(self, delta):
+        """Move the cursor, wrapping around at either end."""
+        if self.results:
+            self.cursor = (self.cursor + delta) % len(self.results)
+
+    def toggle(self):
+        """Select or deselect the item under the cursor."""
+        if not self.results:
+            return
+        index = self.results[self.cursor]
+        if index in self.selected:
+            self.selected.remove(index)
+        else:
+            self.selected.add(index)
+
+    def get_picked(self):
+        """Returns the selected candidates, or the one under the cursor if
+        none are selected."""
+        if self.selected:
+            indexes = sorted(self.selected)
+        elif self.results:
+            indexes = [self.results[self.cursor]]
+        else:
+            indexes = []
+        return [self.matcher.candidates[index] for index in indexes]
+
+    # Output
+
+    def render(self):
+        """Redraw the prompt and visible results in place."""
+        columns, lines = shutil.get_terminal_size()
+        max_rows = max(1, min(MAX_ROWS, lines - 3))
+        # Scroll so the cursor is visible
+        if self.cursor < self.offset:
+            self.offset = self.cursor
+        elif self.cursor >= self.offset + max_rows:
+            self.offset = self.cursor - max_rows + 1
+        prompt = f'> {self.prompt_text}: '
+        hint = '(Tab to select, Enter to confirm) ' if self.multiple and not self.query else ''
+        lines_out = [cmd.COLORS[cmd.PROMPT](prompt) + hint + self.query]
+        status = f'{len(self.results)}/{len(self.matcher.candidates)}'
+        if self.selected:
+            status += f' ({len(self.selected)} selected)'
+        lines_out.append(cmd.INDENT + status)
+        for row, index in enumerate(self.results[self.offset:self.offset + max_rows]):
+            is_cursor = self.offset + row == self.cursor
+            marker = cmd.COLORS[cmd.SUCCESS]('*') if index in self.selected else ' '
+            pointer = cmd.COLORS[cmd.PROMPT]('>') if is_cursor else ' '
+            text = self.highlight(index, columns - len(cmd.INDENT) - 1)
+            lines_out.append(f'{pointer}{marker}{cmd.INDENT[2:]}{text}')
+        # Move back to the end of the prompt line, so the next render (and
+        # the terminal cursor) starts there
+        output = CLEAR + '\n'.join(lines_out) + f'\x1b[{len(lines_out) - 1}A'
+        output += f'\r\x1b[{len(prompt) + len(hint) + len(self.query)}C'
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+    def highlight(self, index, width):
+        """Returns a candidate truncated to width, with the characters
+        matching the query highlighted."""
+        candidate = self.matcher.candidates[index]
+        if len(candidate) > width:
+            candidate = candidate[:max(0, width - 3)] + '...'
+        positions = set(self.matcher.get_match_positions(index, self.query))
+        if not positions:
+            return candidate
+        return ''.join(
+            cmd.COLORS[cmd.INFO](char) if position in positions else char
+            for position, char in enumerate(candidate)
+        )
+
+    @staticmethod
+    def clear():
+        """Erase the picker from the terminal."""
+        sys.stdout.write(CLEAR)
+        sys.stdout.flush()
+
+
+def pick(candidates, prompt_text, multiple=False):
+    """Let the user pick from a list of candidates with the interactive
+    picker. Check is_available() first.
+
+    :param candidates: List of strings to pick from. The first one is
+        highlighted initially
+    :param prompt_text: Text to display next to the query
+    :param multiple: (Default: False) If True, allow picking multiple items
+
+    :return: List of picked candidates, or an empty list if cancelled
+    """
+    if not candidates:
+        return []
+    return Picker(candidates, prompt_text, multiple=multiple).run()
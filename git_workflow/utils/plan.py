@@ -0,0 +1,284 @@
+"""Plan changes to a repository, then make them with as few writes and git
+processes as possible.
+
+Commands describe the changes they'll make as a list of operations instead of
+making them one at a time. Executing a plan coalesces operations between steps
+(see Step):
+
+- Files are written first, so configs never point to missing files
+- Ref changes are made in a single ``git update-ref --stdin`` transaction, so
+  either all of them are made or none are
+- Config changes are applied to each file in memory and written once per file
+  (without running ``git config``). Changes to files that are deleted in the
+  same batch are skipped
+- Ticket registry changes are made in a single transaction per registry
+- Files are deleted last
+
+The same plan can be described instead of executed, which is used for
+``--dry-run``.
+"""
+from collections import namedtuple
+import os
+from .config_writer import ConfigEditor, write_config_file
+from .ticket_registry import TicketRegistry, get_repo_key
+
+#: Set a config value in a config file
+ConfigSet = namedtuple('ConfigSet', ['path', 'key', 'value'])
+#: Remove all values of a config from a config file
+ConfigUnset = namedtuple('ConfigUnset', ['path', 'key'])
+#: Remove a section (e.g. ``branch.main``) from a config file
+ConfigRemoveSection = namedtuple('ConfigRemoveSection', ['path', 'section'])
+#: Create or replace a file
+WriteFile = namedtuple('WriteFile', ['path', 'contents'])
+#: Delete a file (if it exists)
+DeleteFile = namedtuple('DeleteFile', ['path'])
+#: Point a ref to new_sha. Fails if it doesn't point to old_sha (use None to
+#: skip this check)
+UpdateRef = namedtuple('UpdateRef', ['ref', 'new_sha', 'old_sha'])
+#: Delete a ref. Fails if it doesn't point to old_sha
+DeleteRef = namedtuple('DeleteRef', ['ref', 'old_sha'])
+#: Record the ticket a branch's commit template is configured for in the
+#: ticket registry at path (see ticket_registry)
+RegisterTicket = namedtuple('RegisterTicket', ['path', 'ticket', 'branch', 'template'])
+#: Remove a branch from the ticket registry at path
+UnregisterTicket = namedtuple('UnregisterTicket', ['path', 'branch'])
+#: Operation that can't be coalesced (e.g. a checkout or fetch). Operations
+#: before a step are executed before it, and operations after it are executed
+#: after it. If function returns False, the rest of the plan is skipped. If it
+#: returns SKIP, only the operations between it and the next step are skipped
+Step = namedtuple('Step', ['description', 'function'])
+
+#: Return value of a Step's function that skips the operations following it
+SKIP = 'skip'
+
+#: Operations that edit config files
+CONFIG_OPERATIONS = (ConfigSet, ConfigUnset, ConfigRemoveSection)
+
+
+class Plan:
+    """List of changes to make to a repository."""
+
+    def __init__(self, repo):
+        """Constructor
+
+        :param repo: Repo object
+        """
+        self.repo = repo
+        self.operations = []
+
+    def __bool__(self):
+        return bool(self.operations)
+
+    def add(self, *operations):
+        """Add operations to the end of the plan."""
+        self.operations.extend(operations)
+
+    def get_batches(self):
+        """Split the plan at each step.
+
+        :return: List of steps and lists of operations between them
+        """
+        batches = []
+        batch = []
+        for operation in self.operations:
+            if isinstance(operation, Step):
+                if batch:
+                    batches.append(batch)
+                    batch = []
+                batches.append(operation)
+            else:
+                batch.append(operation)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    # Execution
+
+    def execute(self):
+        """Make all changes in the plan.
+
+        :return: True if the whole plan was executed, False if a step stopped
+            it early
+        """
+        skip = False
+        for batch in self.get_batches():
+            if isinstance(batch, Step):
+                result = batch.function()
+                if result is False:
+                    return False
+                skip = result == SKIP
+            elif skip:
+                skip = False
+            else:
+                self.execute_batch(batch)
+        return True
+
+    def execute_batch(self, operations):
+        """Make the changes in a batch of operations, coalescing them.
+
+        :param operations: List of operations (other than Steps)
+        """
+        deleted_paths = {
+            os.path.abspath(operation.path) for operation in operations
+            if isinstance(operation, DeleteFile)
+        }
+        for operation in operations:
+            if isinstance(operation, WriteFile):
+                with open(operation.path, 'w') as f:
+                    f.write(operation.contents)
+        transaction = self.get_ref_transaction(operations)
+        if transaction:
+            self.repo.git.update_ref('--stdin', input=transaction)
+        for path, config_operations in self.group_config_operations(operations).items():
+            if path not in deleted_paths:
+                self.apply_config_operations(path, config_operations)
+        for path, registry_operations in self.group_registry_operations(operations).items():
+            self.apply_registry_operations(path, registry_operations)
+        for operation in operations:
+            if isinstance(operation, DeleteFile) and os.path.exists(operation.path):
+                os.remove(operation.path)
+
+    @staticmethod
+    def group_config_operations(operations):
+        """Returns a dictionary mapping config file paths to the operations
+        on them, in order."""
+        grouped = {}
+        for operation in operations:
+            if isinstance(operation, CONFIG_OPERATIONS):
+                grouped.setdefault(os.path.abspath(operation.path), []).append(operation)
+        return grouped
+
+    @staticmethod
+    def apply_config_operations(path, operations, write=True):
+        """Apply operations to a config file and write it once (if anything
+        changed).
+
+        :param path: Path to the config file
+        :param operations: Config operations on the file
+        :param write: (Default: True) If False, only check if anything would
+            change
+
+        :return: True if the file changed
+        """
+        try:
+            with open(path) as f:
+                text = f.read()
+        except FileNotFoundError:
+            text = None
+        editor = ConfigEditor(text or '')
+        for operation in operations:
+            if isinstance(operation, ConfigSet):
+                editor.set(operation.key, operation.value)
+            elif isinstance(operation, ConfigUnset):
+                editor.unset(operation.key)
+            else:
+                editor.remove_section(operation.section)
+        changed = editor.text != (text or '') and (text is not None or bool(editor.text))
+        if changed and write:
+            write_config_file(path, editor.text)
+        return changed
+
+    @staticmethod
+    def group_registry_operations(operations):
+        """Returns a dictionary mapping ticket registry paths to the
+        operations on them, in order."""
+        grouped = {}
+        for operation in operations:
+            if isinstance(operation, (RegisterTicket, UnregisterTicket)):
+                grouped.setdefault(operation.path, []).append(operation)
+        return grouped
+
+    def apply_registry_operations(self, path, operations):
+        """Apply operations to a ticket registry in one transaction. Errors
+        are ignored, since the registry is only an index of the repo's own
+        branch metadata and shouldn't keep changes to the repo from being
+        made.
+
+        :param path: Path to the registry database
+        :param operations: RegisterTicket and UnregisterTicket operations
+        """
+        # Deferred, see TicketRegistry.connection
+        import sqlite3
+        repo_key = get_repo_key(self.repo)
+        register = []
+        unregister = []
+        for operation in operations:
+            # Registry.update() unregisters first, so only the last operation
+            # on each branch is kept
+            register = [entry for entry in register if entry[2] != operation.branch]
+            if isinstance(operation, RegisterTicket):
+                register.append((operation.ticket, repo_key, operation.branch, operation.template))
+            else:
+                unregister.append((repo_key, operation.branch))
+        registry = TicketRegistry(path)
+        try:
+            registry.update(register=register, unregister=unregister)
+        except (sqlite3.Error, OSError):
+            pass
+        finally:
+            registry.close()
+
+    @staticmethod
+    def get_ref_transaction(operations):
+        """Returns ``git update-ref --stdin`` input for the ref operations in
+        a batch (empty if there are none)."""
+        lines = []
+        for operation in operations:
+            if isinstance(operation, UpdateRef):
+                lines.append(f'update {operation.ref} {operation.new_sha} {operation.old_sha or ""}'.rstrip())
+            elif isinstance(operation, DeleteRef):
+                lines.append(f'delete {operation.ref} {operation.old_sha}')
+        return ''.join(line + '\n' for line in lines)
+
+    # Description
+
+    def describe(self):
+        """Describe the plan as it would be executed.
+
+        :return: List of lines
+        """
+        lines = []
+        for batch in self.get_batches():
+            if isinstance(batch, Step):
+                lines.append(batch.description)
+                continue
+            for operation in batch:
+                if isinstance(operation, WriteFile):
+                    lines.append(f'Write {self.format_path(operation.path)}')
+            transaction = self.get_ref_transaction(batch)
+            if transaction:
+                lines.append('Update refs (git update-ref --stdin):')
+                lines.extend('    ' + line for line in transaction.splitlines())
+            deleted_paths = {
+                os.path.abspath(operation.path) for operation in batch
+                if isinstance(operation, DeleteFile)
+            }
+            for path, config_operations in self.group_config_operations(batch).items():
+                if path in deleted_paths or not self.apply_config_operations(
+                        path, config_operations, write=False):
+                    continue
+                lines.append(f'Update {self.format_path(path)}:')
+                for operation in config_operations:
+                    if isinstance(operation, ConfigSet):
+                        lines.append(f'    set {operation.key} = {operation.value}')
+                    elif isinstance(operation, ConfigUnset):
+                        lines.append(f'    unset {operation.key}')
+                    else:
+                        lines.append(f'    remove section {operation.section}')
+            for path, registry_operations in self.group_registry_operations(batch).items():
+                lines.append(f'Update ticket registry {path}:')
+                for operation in registry_operations:
+                    if isinstance(operation, RegisterTicket):
+                        lines.append(f'    register {operation.ticket}: {operation.branch}')
+                    else:
+                        lines.append(f'    unregister {operation.branch}')
+            for operation in batch:
+                if isinstance(operation, DeleteFile) and os.path.exists(operation.path):
+                    lines.append(f'Delete {self.format_path(operation.path)}')
+        return lines
+
+    def format_path(self, path):
+        """Returns path relative to the working tree (if it's inside it)."""
+        base = self.repo.working_tree_dir or self.repo.git_dir
+        relative_path = os.path.relpath(path, base)
+        return path if relative_path.startswith('..') else relative_path
@@ -1,16 +1,20 @@
 """Utilities for common interactions with git repo."""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import os
-from git import GitCommandError, Head, Remote
-from git.cmd import Git as GitCmd
+import subprocess
+import time
 from git_workflow.__about__ import __min_git_version__
+from .branches import BRANCH_NAME_REGEX
+from .git_repo import Git, GitCommandError, TrackingInfo
 
 
 # Git Verification + Workflow Config Methods
 
 def verify_git_version(strict=True):
     """Returns True if minimum git version is met for advanced features"""
-    g = GitCmd()
-    major, minor, patch = g.version_info
+    g = Git()
+    major, minor = g.version_info[:2]
     version_float = float(f'{major}.{minor}')
     is_version_requirement_met = version_float >= __min_git_version__
     if strict and not is_version_requirement_met:
@@ -20,8 +24,12 @@ def verify_git_version(strict=True):
 
 
 def get_workflow_config_path(repo):
-    """Returns the full path for the git workflow config file."""
-    return os.path.join(repo.git_dir, 'config_workflow')
+    """Returns the full path for the git workflow config file.
+
+    Workflow files are stored in the common git dir so they are shared by all
+    worktrees of the repo.
+    """
+    return os.path.join(repo.common_dir, 'config_workflow')
 
 
 def verify_workflow_config_file(repo):
@@ -31,13 +39,92 @@ def verify_workflow_config_file(repo):
 
 def verify_workflow_config_include(repo):
     """Returns True if config_workflow is included in local git config."""
-    result = False
+    return ('include.path', 'config_workflow') in repo.get_config_entries()
+
+
+def get_branch_metadata_path(repo):
+    """Returns the full path for the workflow branch metadata file.
+
+    This file stores details about workflow branches (e.g. client and ticket
+    number) in git config format. Unlike config_workflow, it is not included
+    in the local git config, so it doesn't add overhead to other git commands.
+    """
+    return os.path.join(repo.common_dir, 'workflow_branches')
+
+
+def get_all_branch_metadata(repo):
+    """Read metadata for all workflow branches with a single git config call.
+
+    :param repo: Repo object
+
+    :return: Dictionary mapping branch names to dictionaries of metadata
+    """
+    metadata_path = get_branch_metadata_path(repo)
+    if not os.path.exists(metadata_path):
+        return {}
+    try:
+        output = repo.git.config(r'^branch\.', file=metadata_path,
+                                 get_regexp=True)
+    except GitCommandError:
+        return {}
+    metadata = {}
+    for line in output.splitlines():
+        key, _, value = line.partition(' ')
+        branch_name, _, name = key[len('branch.'):].rpartition('.')
+        metadata.setdefault(branch_name, {})[name] = value
+    return metadata
+
+
+def get_branch_config_files(repo):
+    """Get the config file of every branch with one configured (i.e. with a
+    commit template set by ``workflow set-template``), with a single pass over
+    the local config.
+
+    :param repo: Repo object
+
+    :return: Dictionary mapping branch names to their config filenames
+        (relative to the common git dir)
+    """
+    prefix = 'includeif.onbranch:'
+    return {
+        key[len(prefix):-len('.path')]: value
+        for key, value in repo.get_config_entries()
+        if key.startswith(prefix) and key.endswith('.path')
+    }
+
+
+def set_branch_metadata(repo, branch_name, name, value):
+    """Store a metadata value for a workflow branch.
+
+    :param repo: Repo object
+    :param branch_name: Name of the branch
+    :param name: Name of the metadata value (e.g. 'ticket')
+    :param value: Value to store
+    """
+    repo.git.config(f'branch.{branch_name}.{name}', value,
+                    file=get_branch_metadata_path(repo))
+
+
+def unset_branch_metadata(repo, branch_name, name=None):
+    """Remove metadata for a workflow branch.
+
+    :param repo: Repo object
+    :param branch_name: Name of the branch
+    :param name: (Optional) Name of the metadata value to remove. If not
+        specified, all metadata for the branch is removed
+    """
+    metadata_path = get_branch_metadata_path(repo)
+    if not os.path.exists(metadata_path):
+        return
     try:
-        included_paths = repo.git.config('include.path', get_all=True, local=True).split('\n')
-        result = 'config_workflow' in included_paths
+        if name is None:
+            repo.git.config(f'branch.{branch_name}', file=metadata_path,
+                            remove_section=True)
+        else:
+            repo.git.config(f'branch.{branch_name}.{name}', file=metadata_path,
+                            unset=True)
     except GitCommandError:
         pass
-    return result
 
 
 # Initialize
@@ -90,42 +177,626 @@ def initialize(repo):
     return workflow_config_file_exists and workflow_config_included
 
 
+# Fetch Freshness
+
+#: Stamp file touched after fetching tags (relative to the common git dir)
+FETCH_TAGS_STAMP = 'workflow_fetch_tags'
+
+
+def get_fetch_age(repo, tracking_info=None):
+    """Get the number of seconds since a remote branch (or tags) were last
+    fetched.
+
+    For branches, this checks FETCH_HEAD (if its last fetch included the
+    branch) and the remote-tracking ref. For tags, this checks the stamp file
+    written by fetch_tags().
+
+    :param repo: Repo object
+    :param tracking_info: (Optional) TrackingInfo for the branch to check. If
+        not specified, checks when tags were last fetched
+
+    :return: Age in seconds, or None if it can't be determined
+    """
+    mtimes = []
+    if tracking_info is None:
+        paths = [os.path.join(repo.common_dir, FETCH_TAGS_STAMP)]
+    else:
+        paths = [os.path.join(repo.common_dir, tracking_info.ref)]
+        branch_line = f"branch '{tracking_info.merge_ref[len('refs/heads/'):]}' of "
+        for git_dir in {repo.git_dir, repo.common_dir}:
+            fetch_head_path = os.path.join(git_dir, 'FETCH_HEAD')
+            try:
+                with open(fetch_head_path) as f:
+                    if branch_line in f.read():
+                        paths.append(fetch_head_path)
+            except OSError:
+                pass
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            pass
+    if not mtimes:
+        return None
+    return max(0, time.time() - max(mtimes))
+
+
+def is_fetch_fresh(repo, tracking_info=None, max_age=0, name='tags'):
+    """Check if a fetch can be skipped because it was fetched recently, and
+    print an explanation of the decision.
+
+    :param repo: Repo object
+    :param tracking_info: (Optional) TrackingInfo for the branch to check. If
+        not specified, checks when tags were last fetched
+    :param max_age: (Default: 0) Maximum age in seconds. If 0, always fetch
+    :param name: (Default: 'tags') What's being fetched, used in output
+
+    :return: True if the fetch can be skipped
+    """
+    if not max_age:
+        return False
+    age = get_fetch_age(repo, tracking_info)
+    if age is None:
+        print(f'No record of {name} being fetched, fetching.')
+        return False
+    if age > max_age:
+        print(f'{name} last fetched {int(age)}s ago (workflow.fetchMaxAge is {max_age}s), fetching.')
+        return False
+    print(f'Skipping fetch: {name} last fetched {int(age)}s ago (workflow.fetchMaxAge is {max_age}s).',
+          'Use --refresh to fetch anyway.')
+    return True
+
+
+# Local Mirrors
+
+#: Local mirror of a remote to fetch from before falling back to the remote.
+#: path may contain {repo} and {remote} placeholders, and max_age is the
+#: maximum number of seconds since the mirror was last fetched
+Mirror = namedtuple('Mirror', ['path', 'max_age'])
+
+
+def get_mirror_path(repo, mirror, remote_name):
+    """Resolve the path to the local mirror of a remote.
+
+    :param repo: Repo object
+    :param mirror: Mirror tuple
+    :param remote_name: Name of the remote being mirrored
+
+    :return: Absolute path to the mirror, or None if it doesn't exist
+    """
+    main_worktree_path = get_main_worktree_path(repo)
+    path = os.path.expanduser(mirror.path.format(
+        repo=os.path.basename(main_worktree_path), remote=remote_name
+    ))
+    path = os.path.abspath(os.path.join(main_worktree_path, path))
+    return path if os.path.isdir(path) else None
+
+
+def get_mirror_age(mirror_path, ref=None):
+    """Get the number of seconds since a mirror (or one of its refs) was last
+    updated, based on the modification times of its ``FETCH_HEAD`` and the
+    loose ref.
+
+    :param mirror_path: Path to the mirror repository
+    :param ref: (Optional) Full name of a ref to check
+
+    :return: Age in seconds, or None if it can't be determined
+    """
+    git_dir = mirror_path
+    if os.path.isdir(os.path.join(mirror_path, '.git')):
+        git_dir = os.path.join(mirror_path, '.git')
+    paths = [os.path.join(git_dir, 'FETCH_HEAD')]
+    if ref is not None:
+        paths.append(os.path.join(git_dir, ref))
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            pass
+    if not mtimes:
+        return None
+    return max(0, time.time() - max(mtimes))
+
+
+def fetch_from_mirror(repo, mirror, remote_name, refspec, name, ref=None):
+    """Try to fetch from the local mirror of a remote instead of the remote
+    itself.
+
+    The mirror is skipped if it doesn't exist or was last updated more than
+    mirror.max_age seconds ago. Refspecs are not forced, so a mirror that is
+    behind what was already fetched from the remote is rejected rather than
+    rewinding local refs.
+
+    :param repo: Repo object
+    :param mirror: Mirror tuple, or None if no mirror is configured
+    :param remote_name: Name of the remote being mirrored
+    :param refspec: Refspec to fetch from the mirror
+    :param name: What's being fetched, used in output
+    :param ref: (Optional) Full name of the ref being fetched, used to check
+        the mirror's age
+
+    :return: True if the fetch from the mirror succeeded, False if the remote
+        should be fetched instead
+    """
+    if mirror is None:
+        return False
+    mirror_path = get_mirror_path(repo, mirror, remote_name)
+    if mirror_path is None:
+        return False
+    age = get_mirror_age(mirror_path, ref)
+    if age is None or age > mirror.max_age:
+        age_description = 'unknown' if age is None else f'{int(age)}s'
+        print(f'Mirror {mirror_path} is stale (age: {age_description},',
+              f'workflow.mirrorMaxAge is {mirror.max_age}s), fetching {name} from {remote_name}.')
+        return False
+    try:
+        repo.git.fetch(mirror_path, refspec)
+    except GitCommandError:
+        print(f'Unable to fetch {name} from mirror {mirror_path}, fetching from {remote_name}.')
+        return False
+    print(f'Fetched {name} from mirror {mirror_path}.')
+    return True
+
+
+def fetch_from_mirror_tracking(repo, mirror, tracking_info, branch_name):
+    """Try to update a remote-tracking branch from the local mirror of its
+    remote.
+
+    :param repo: Repo object
+    :param mirror: Mirror tuple, or None if no mirror is configured
+    :param tracking_info: TrackingInfo for the branch
+    :param branch_name: Name of the local branch, used in output
+
+    :return: True if the remote-tracking branch was updated from the mirror
+    """
+    return fetch_from_mirror(
+        repo, mirror, tracking_info.remote_name,
+        f'{tracking_info.merge_ref}:{tracking_info.ref}', branch_name,
+        ref=tracking_info.merge_ref
+    )
+
+
 # Common Git Actions
 
-def checkout_branch(repo, branch_name, no_pull=False):
+def get_active_branch_name(repo):
+    """Returns the name of the branch checked out in the repo's working tree,
+    or None if HEAD is detached."""
+    try:
+        return repo.active_branch_name
+    except TypeError:
+        return None
+
+
+def checkout_branch(repo, branch_name, no_pull=False, max_age=0, mirror=None):
     """Checkout a branch and optionally pull updates.
 
     :param repo: Repo object
     :param branch_name: Name of the branch to checkout
     :param no_pull: (Default: False) If True, don't pull changes to branch
-
-    :return: Head object for the checked out branch
+    :param max_age: (Default: 0) If the branch was fetched less than this many
+        seconds ago, skip fetching and merge the remote-tracking branch
+        instead. If 0, always fetch
+    :param mirror: (Optional) Mirror tuple for a local mirror to try fetching
+        from before the remote
     """
-    base_head = Head(repo, f'refs/heads/{branch_name}')
-    if repo.active_branch != base_head:
+    if get_active_branch_name(repo) != branch_name:
         print(f'Checking out {branch_name}.')
-        base_head.checkout()
-    if not no_pull and base_head.tracking_branch():
-        print(f'Pulling updates to {branch_name}...')
-        remote_name = base_head.tracking_branch().remote_name
-        remote = Remote(repo, remote_name)
-        base_commit = base_head.commit
-        for fetch_info in remote.pull():
-            if fetch_info.ref == base_head.tracking_branch():
-                if fetch_info.commit != base_commit:
-                    print(f'Updated {branch_name} to {fetch_info.commit.hexsha}')
-                else:
-                    print(f'{branch_name} already up to date.')
+        repo.git.checkout(branch_name)
+    tracking_info = None if no_pull else repo.get_tracking_info(branch_name)
+    if tracking_info is not None:
+        old_sha = repo.read_ref('HEAD')
+        if (is_fetch_fresh(repo, tracking_info, max_age, name=branch_name)
+                or fetch_from_mirror_tracking(repo, mirror, tracking_info, branch_name)):
+            print(f'Merging {tracking_info.ref} into {branch_name}...')
+            repo.git.merge(tracking_info.ref)
+        else:
+            print(f'Pulling updates to {branch_name}...')
+            # Only fetch the tracking branch instead of every branch on the remote
+            repo.git.pull(tracking_info.remote_name, tracking_info.merge_ref)
+        new_sha = repo.read_ref('HEAD')
+        if new_sha != old_sha:
+            print(f'Updated {branch_name} to {new_sha}')
+        else:
+            print(f'{branch_name} already up to date.')
         print('')
-    return base_head
 
 
-def fetch_tags(repo):
-    """Shorthand for git fetch --all --tags
+def update_branch(repo, branch_name, no_pull=False, max_age=0, mirror=None):
+    """Fetch updates to a branch and fast-forward it without checking it out.
+
+    If the branch is checked out in the current worktree, it's updated with
+    ``git merge --ff-only``. If it's checked out in a different worktree, it's
+    left alone and the updated remote-tracking branch is returned instead.
 
     :param repo: Repo object
+    :param branch_name: Name of the branch to update
+    :param no_pull: (Default: False) If True, don't fetch changes to branch
+    :param max_age: (Default: 0) If the branch was fetched less than this many
+        seconds ago, skip fetching and fast-forward to the remote-tracking
+        branch. If 0, always fetch
+    :param mirror: (Optional) Mirror tuple for a local mirror to try fetching
+        from before the remote
+
+    :return: Name of the updated ref to use as a base for new branches
     """
-    if repo.remotes:
+    old_sha = repo.read_ref(f'refs/heads/{branch_name}')
+    if old_sha is None:
+        raise Exception(f'Unable to update {branch_name}: branch not found.')
+    tracking_info = None if no_pull else repo.get_tracking_info(branch_name)
+    if tracking_info is None:
+        return branch_name
+    if not (is_fetch_fresh(repo, tracking_info, max_age, name=branch_name)
+            or fetch_from_mirror_tracking(repo, mirror, tracking_info, branch_name)):
+        print(f'Fetching updates to {branch_name}...')
+        repo.git.fetch(tracking_info.remote_name, tracking_info.merge_ref)
+    new_sha = repo.read_ref(tracking_info.ref)
+    if new_sha is None:
+        raise Exception(f'Unable to update {branch_name}: {tracking_info.ref} not found.')
+    if old_sha == new_sha:
+        print(f'{branch_name} already up to date.')
+        print('')
+        return branch_name
+    worktree_path = get_worktrees(repo).get(branch_name)
+    if worktree_path is not None and not is_current_worktree(repo, worktree_path):
+        print(f'{branch_name} is checked out in {worktree_path}, using {tracking_info.ref} instead.')
+        print('')
+        return tracking_info.ref
+    if not is_ancestor(repo, old_sha, new_sha):
+        raise Exception(f'Unable to update {branch_name}: {tracking_info.ref} is not a fast-forward.')
+    if worktree_path is not None:
+        repo.git.merge(new_sha, ff_only=True)
+    else:
+        repo.git.update_ref(f'refs/heads/{branch_name}', new_sha, old_sha)
+    print(f'Updated {branch_name} to {new_sha}')
+    print('')
+    return branch_name
+
+
+def is_ancestor(repo, ancestor, descendant):
+    """Returns True if ancestor is an ancestor of (or the same commit as)
+    descendant.
+    """
+    try:
+        repo.git.merge_base(ancestor, descendant, is_ancestor=True)
+    except GitCommandError:
+        return False
+    return True
+
+
+def fetch_tags(repo, max_age=0, jobs=4, mirror=None):
+    """Fetch tags from all remotes, equivalent to git fetch --all --tags.
+
+    Remotes are fetched concurrently. A failure to fetch from one remote does
+    not prevent fetching from the others.
+
+    :param repo: Repo object
+    :param max_age: (Default: 0) If tags were fetched less than this many
+        seconds ago, skip fetching. If 0, always fetch
+    :param jobs: (Default: 4) Maximum number of remotes to fetch at once
+    :param mirror: (Optional) Mirror tuple for local mirrors to try fetching
+        tags from before the remotes
+    """
+    remote_names = repo.remote_names
+    if remote_names:
+        if is_fetch_fresh(repo, max_age=max_age):
+            print('')
+            return
         print('Fetching tags from remote...')
+        mirrored = {
+            remote_name for remote_name in remote_names
+            if fetch_from_mirror(repo, mirror, remote_name, 'refs/tags/*:refs/tags/*',
+                                 f'tags for {remote_name}')
+        }
+        errors = fetch_remotes(
+            repo, [remote_name for remote_name in remote_names if remote_name not in mirrored],
+            jobs=jobs, tags=True
+        )
+        for remote_name in remote_names:
+            if remote_name in mirrored:
+                continue
+            if remote_name in errors:
+                print(f'Unable to fetch from {remote_name}: {errors[remote_name]}')
+            else:
+                print(f'Fetched {remote_name}.')
         print('')
-        repo.git.fetch(all=True, tags=True)
+        # Record fetch time for is_fetch_fresh() (unless something failed, so
+        # the next run tries again)
+        if not errors:
+            with open(os.path.join(repo.common_dir, FETCH_TAGS_STAMP), 'w'):
+                pass
+
+
+def fetch_remotes(repo, remote_names, jobs=4, **fetch_kwargs):
+    """Run ``git fetch`` for multiple remotes concurrently.
+
+    Every fetch writes ``FETCH_HEAD``, so it's truncated once up front and the
+    fetches run with ``--append`` instead of overwriting each other's entries.
+
+    :param repo: Repo object
+    :param remote_names: Names of remotes to fetch
+    :param jobs: (Default: 4) Maximum number of remotes to fetch at once
+    :param **fetch_kwargs: Keyword arguments to pass to repo.git.fetch()
+
+    :return: Dictionary mapping names of remotes that failed to fetch to their
+        error messages
+    """
+    if not remote_names:
+        return {}
+    try:
+        with open(os.path.join(repo.git_dir, 'FETCH_HEAD'), 'w'):
+            pass
+    except OSError:
+        pass
+    fetch_kwargs['append'] = True
+
+    def fetch(remote_name):
+        try:
+            repo.git.fetch(remote_name, **fetch_kwargs)
+        except GitCommandError as e:
+            stderr = e.stderr.strip()
+            return stderr.splitlines()[0] if stderr else str(e)
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = executor.map(fetch, remote_names)
+        return {
+            remote_name: error for remote_name, error in zip(remote_names, results)
+            if error is not None
+        }
+
+
+# CI Mode
+
+def is_shallow(repo):
+    """Returns True if the repo is a shallow clone (e.g. ``git clone
+    --depth 1``)."""
+    return os.path.exists(os.path.join(repo.common_dir, 'shallow'))
+
+
+def get_branch_remote(repo, branch_name):
+    """Get the remote branch a branch is updated from. Unlike
+    repo.get_tracking_info(), this doesn't require a local branch (e.g. in a
+    clone of a different branch), in which case the branch of the same name
+    on ``origin`` (or the first remote) is used.
+
+    :param repo: Repo object
+    :param branch_name: Name of the branch
+
+    :return: TrackingInfo, or None if the repo has no remotes
+    """
+    if repo.ref_exists(f'refs/heads/{branch_name}'):
+        tracking_info = repo.get_tracking_info(branch_name)
+        if tracking_info is not None:
+            return tracking_info
+    remote_names = repo.remote_names
+    if not remote_names:
+        return None
+    remote_name = 'origin' if 'origin' in remote_names else remote_names[0]
+    return TrackingInfo(remote_name, f'refs/heads/{branch_name}',
+                        f'refs/remotes/{remote_name}/{branch_name}')
+
+
+def fetch_minimal(repo, remote_name, ref, local_ref, shallow_since=None):
+    """Fetch a single ref, transferring as few objects as possible and
+    avoiding anything that walks history (used by CI mode):
+
+    - Tags aren't fetched, so neither is the history they point to
+    - In a shallow clone, only the fetched commit is (``--depth 1``), unless
+      shallow_since is specified
+    - Partial clones (e.g. ``git clone --filter=blob:none``) fetch with the
+      filter they were cloned with, so only commits and trees are fetched
+    - local_ref is force-updated, so git doesn't check for a fast-forward
+    - Automatic gc is skipped, since it repacks the whole repo
+
+    :param repo: Repo object
+    :param remote_name: Name of the remote to fetch from
+    :param ref: Full name of the ref on the remote
+    :param local_ref: Full name of the ref to store it in
+    :param shallow_since: (Optional) In a shallow clone, deepen history back
+        to this date (e.g. to check if a commit is an ancestor of ref)
+
+    :return: SHA of the fetched commit
+    """
+    options = ['--no-tags', '--no-auto-gc', '--no-recurse-submodules']
+    if is_shallow(repo):
+        options.append(f'--shallow-since={shallow_since}' if shallow_since else '--depth=1')
+    repo.git.fetch(*options, remote_name, f'+{ref}:{local_ref}')
+    sha = repo.read_ref(local_ref)
+    if sha is None:
+        raise Exception(f'Unable to fetch {ref} from {remote_name}.')
+    return sha
+
+
+# Branch Queries + Bulk Operations
+
+def get_branches(repo, merged=None):
+    """Get local branches. Read directly from the repo's refs, unless merged
+    is specified, in which case a single ``git for-each-ref`` query is used.
+
+    :param repo: Repo object
+    :param merged: (Optional) Only include branches merged into this branch or
+        commit
+
+    :return: Dictionary mapping branch names to the SHA of their tips
+    """
+    if merged is None:
+        return repo.get_refs('refs/heads/')
+    output = repo.git.for_each_ref('refs/heads/',
+                                   format='%(refname:short) %(objectname)',
+                                   merged=merged)
+    branches = {}
+    for line in output.splitlines():
+        branch_name, _, sha = line.rpartition(' ')
+        branches[branch_name] = sha
+    return branches
+
+
+def iter_refs(repo, fields, pattern='refs/heads/', merged=None):
+    """Stream ``git for-each-ref`` output without buffering it all in memory.
+
+    Fields are separated by NUL characters, so values can safely contain
+    spaces.
+
+    :param repo: Repo object
+    :param fields: List of ``for-each-ref`` format atoms, e.g.
+        ``['%(refname:short)', '%(objectname)']``
+    :param pattern: (Default: 'refs/heads/') Only list refs matching this
+        pattern
+    :param merged: (Optional) Only list refs merged into this branch or commit
+
+    :return: Generator that yields a tuple of field values for each ref
+    """
+    command = ['git', 'for-each-ref', '--format=' + '%00'.join(fields)]
+    if merged is not None:
+        command.append(f'--merged={merged}')
+    command.append(pattern)
+    process = subprocess.Popen(
+        command, cwd=repo.working_tree_dir or repo.git_dir,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    try:
+        for line in process.stdout:
+            yield tuple(line.rstrip(b'\n').decode().split('\0'))
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise GitCommandError(command, process.returncode, stderr)
+
+
+def get_merged_branches(repo, base):
+    """Get all local branches that are merged into base using a single
+    ``git for-each-ref --merged`` query.
+
+    :param repo: Repo object
+    :param base: Branch or commit to check against
+
+    :return: Dictionary mapping branch names to the SHA of their tips
+    """
+    return get_branches(repo, merged=base)
+
+
+def get_commit_dates(repo, commits):
+    """Get the committer dates of multiple commits with a single ``git log
+    --no-walk --stdin`` query.
+
+    :param repo: Repo object
+    :param commits: Iterable of commit SHAs
+
+    :return: Dictionary mapping SHAs to their (local) committer dates in
+        ``yyyymmdd`` format
+    """
+    commits = set(commits)
+    if not commits:
+        return {}
+    # Subcommand options have to follow the subcommand
+    output = repo.git.log('--no-walk=unsorted', '--format=%H %cd',
+                          '--date=format-local:%Y%m%d', '--stdin',
+                          input=''.join(f'{sha}\n' for sha in commits))
+    return dict(line.split(' ', 1) for line in output.splitlines() if line)
+
+
+def get_branch_dates(repo, branches):
+    """Get the dates of branches from the ``<yyyymmdd>`` stamp in their names.
+    Only branches that don't follow the ``workflow start`` naming scheme fall
+    back to the committer date of their tip, which is looked up for all of
+    them at once (see get_commit_dates()).
+
+    :param repo: Repo object
+    :param branches: Dictionary mapping branch names to the SHA of their tips
+
+    :return: Dictionary mapping branch names to dates in ``yyyymmdd`` format
+    """
+    dates = {}
+    unstamped = {}
+    for branch_name, sha in branches.items():
+        match = BRANCH_NAME_REGEX.match(branch_name)
+        if match is not None:
+            dates[branch_name] = match.group('date')
+        else:
+            unstamped[branch_name] = sha
+    commit_dates = get_commit_dates(repo, unstamped.values())
+    for branch_name, sha in unstamped.items():
+        if sha in commit_dates:
+            dates[branch_name] = commit_dates[sha]
+    return dates
+
+
+def get_worktrees(repo):
+    """Get branches that are checked out in a worktree.
+
+    :param repo: Repo object
+
+    :return: Dictionary mapping branch names to the path of the worktree they
+        are checked out in
+    """
+    output = repo.git.worktree('list', '--porcelain')
+    worktrees = {}
+    worktree_path = None
+    for line in output.splitlines():
+        if line.startswith('worktree '):
+            worktree_path = line[len('worktree '):]
+        elif line.startswith('branch refs/heads/'):
+            worktrees[line[len('branch refs/heads/'):]] = worktree_path
+    return worktrees
+
+
+def is_current_worktree(repo, worktree_path):
+    """Returns True if worktree_path is the repo's current working tree."""
+    return os.path.realpath(worktree_path) == os.path.realpath(repo.working_tree_dir)
+
+
+def get_main_worktree_path(repo):
+    """Returns the path of the repo's main worktree."""
+    return os.path.dirname(repo.common_dir)
+
+
+def remove_worktree(repo, worktree_path, force=False):
+    """Remove a linked worktree. Fails if the worktree has uncommitted changes
+    (unless force is True).
+
+    :param repo: Repo object
+    :param worktree_path: Path of the worktree to remove
+    :param force: (Default: False) If True, remove the worktree even if it has
+        uncommitted changes
+
+    :return: True if the worktree was removed
+    """
+    # Subcommand options have to follow the subcommand
+    args = ['remove', '--force', worktree_path] if force else ['remove', worktree_path]
+    try:
+        repo.git.worktree(*args)
+    except GitCommandError:
+        return False
+    return True
+
+
+def delete_branches(repo, branches):
+    """Delete multiple branches in a single ``git update-ref --stdin``
+    transaction. Either all branches are deleted or none are.
+
+    Also removes the ``branch.<name>`` config section for any deleted branches
+    that have one (e.g. tracking info), as ``git branch -d`` would.
+
+    :param repo: Repo object
+    :param branches: Dictionary mapping branch names to the SHA they are
+        expected to point to. Transaction will fail if any branch has moved
+    """
+    if not branches:
+        return
+    transaction = ''.join(
+        f'delete refs/heads/{branch_name} {sha}\n'
+        for branch_name, sha in branches.items()
+    )
+    repo.git.update_ref('--stdin', input=transaction)
+    # Only remove config sections that actually exist
+    configured_branches = {
+        key[len('branch.'):].rpartition('.')[0]
+        for key, _ in repo.get_config_entries() if key.startswith('branch.')
+    }
+    for branch_name in branches:
+        if branch_name in configured_branches:
+            repo.git.config(f'branch.{branch_name}', local=True,
+                            remove_section=True)
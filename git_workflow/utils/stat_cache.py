@@ -0,0 +1,106 @@
+"""On-disk caches of values derived from files.
+
+Values are stored with the stat info (mtime, size and inode) of every file they
+were derived from, so checking whether a cached value is still valid only
+takes one ``stat`` call per file. Caches are written with marshal, so values
+are limited to builtin types.
+"""
+import marshal
+import os
+import time
+
+#: Files modified less than this many seconds before a value is stored may be
+#: modified again without their stat info changing (e.g. on filesystems with
+#: coarse timestamps), so values derived from them aren't stored
+RACY_WINDOW = 2
+
+
+def stat_files(paths):
+    """Get the stat info of multiple files.
+
+    :param paths: Paths of the files
+
+    :return: Tuple of (path, mtime, size, inode) tuples. mtime, size and inode
+        are None if the file doesn't exist
+    """
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((path, stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            stamp.append((path, None, None, None))
+    return tuple(stamp)
+
+
+def load(cache_path, key):
+    """Load a cached value if none of the files it was derived from changed.
+
+    :param cache_path: Path to the cache file
+    :param key: Additional value that must match the one the value was stored
+        with (e.g. a version number). Must be a builtin type
+
+    :return: The cached value, or None if there is no valid cached value
+    """
+    value, stamp = load_stale(cache_path, key)
+    if value is None:
+        return None
+    try:
+        if stat_files([entry[0] for entry in stamp]) != stamp:
+            return None
+    except (TypeError, IndexError):
+        return None
+    return value
+
+
+def load_stale(cache_path, key):
+    """Load a cached value without checking whether the files it was derived
+    from changed (e.g. to update it incrementally).
+
+    :param cache_path: Path to the cache file
+    :param key: See load()
+
+    :return: Tuple of the cached value and the stamp it was stored with, or
+        (None, None) if there is no cached value
+    """
+    try:
+        # Reading the whole file first is much faster than marshal.load(),
+        # which reads large caches in small chunks
+        with open(cache_path, 'rb') as f:
+            cache = marshal.loads(f.read())
+        if cache['key'] != key:
+            return None, None
+        return cache['value'], cache['stamp']
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        return None, None
+
+
+def store(cache_path, key, stamp, value):
+    """Store a value along with the stat info of the files it was derived
+    from. The cache file is replaced atomically. Failures are ignored, since
+    the value can always be derived again.
+
+    :param cache_path: Path to the cache file
+    :param key: See load()
+    :param stamp: Result of stat_files() for every file the value was derived
+        from, taken *before* deriving it so changes made in the meantime
+        invalidate the value
+    :param value: Value to store. Must be a builtin type
+
+    :return: True if the value was stored
+    """
+    racy_mtime = (time.time() - RACY_WINDOW) * 1e9
+    if any(mtime is not None and mtime > racy_mtime for _, mtime, _, _ in stamp):
+        return False
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            marshal.dump({'key': key, 'stamp': stamp, 'value': value}, f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,233 @@
+"""Per-user registry of the tickets that branches are configured for, across
+all repositories.
+
+Each repo only knows the tickets of its own branches (in its branch metadata),
+so finding the branch for a ticket would mean searching every clone. Commands
+that configure or remove commit templates record them in this registry, which
+is an SQLite database in the user cache directory with tickets indexed (case
+insensitively), so looking up a ticket is a single index query no matter how
+many repos and branches there are.
+
+The database uses write-ahead logging and waits for other writers instead of
+failing, so commands running in several repos at once can update it safely.
+It's only an index: entries are keyed by repo and branch, and can always be
+recreated from the repos themselves.
+"""
+from collections import namedtuple
+import os
+import sys
+import time
+from .git_repo import Git, GitCommandError
+
+#: Filename of the registry database in the user cache directory
+REGISTRY_FILENAME = 'tickets.sqlite3'
+#: Bump when the schema changes. Registries with an older schema are
+#: recreated, since they only hold data that can be registered again
+SCHEMA_VERSION = 1
+#: Seconds to wait for other processes writing to the registry
+BUSY_TIMEOUT = 10
+
+#: Branch configured for a ticket. repo is the repo's common git dir (shared
+#: by all of its worktrees), template is the full path of the commit template
+#: and updated is the time it was registered (seconds since the epoch)
+TicketEntry = namedtuple('TicketEntry', ['ticket', 'repo', 'branch', 'template', 'updated'])
+
+
+def get_cache_dir():
+    """Returns the git-workflow directory in the user cache directory."""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser(r'~\AppData\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'git-workflow')
+
+
+def get_registry_path(configured_path=None):
+    """Get the path of the registry database.
+
+    :param configured_path: (Optional) Value of workflow.ticketRegistryPath
+
+    :return: Full path, or None if the registry is disabled (configured_path
+        is an empty string)
+    """
+    if configured_path is None:
+        return os.path.join(get_cache_dir(), REGISTRY_FILENAME)
+    if not configured_path:
+        return None
+    return os.path.abspath(os.path.expanduser(configured_path))
+
+
+def get_global_registry_path():
+    """Get the path of the registry database from the global git config (for
+    commands run outside of a repo).
+
+    :return: See get_registry_path()
+    """
+    try:
+        configured_path = Git().config('--global', '--get', 'workflow.ticketRegistryPath')
+    except GitCommandError:
+        # Not configured
+        configured_path = None
+    return get_registry_path(configured_path)
+
+
+def get_repo_key(repo):
+    """Returns the path a repo is registered under (its common git dir, so
+    all worktrees of a repo share entries)."""
+    return os.path.realpath(repo.common_dir)
+
+
+def get_repo_display_path(repo_key):
+    """Returns the path to show for a registered repo: its main working tree
+    if it isn't bare, otherwise its git dir."""
+    if os.path.basename(repo_key) == '.git':
+        return os.path.dirname(repo_key)
+    return repo_key
+
+
+class TicketRegistry:
+    """Connection to the registry database."""
+
+    def __init__(self, path):
+        """Constructor. The database (and its directory) is created the first
+        time it's used.
+
+        :param path: Path of the registry database (see get_registry_path())
+        """
+        self.path = path
+        self._connection = None
+
+    @property
+    def connection(self):
+        """sqlite3 connection, opened (and the schema created) on first
+        access."""
+        if self._connection is None:
+            # Imported here since it's slow to import and most commands don't
+            # use the registry
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Transactions are started explicitly (see update())
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            try:
+                self._initialize(connection)
+            except BaseException:
+                connection.close()
+                raise
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def _initialize(connection):
+        """Create the schema if needed, recreating it if it's outdated."""
+        connection.execute('PRAGMA journal_mode=WAL')
+        if connection.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Check again now that other writers are locked out
+            if connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                connection.execute('DROP TABLE IF EXISTS tickets')
+                connection.execute(
+                    'CREATE TABLE tickets ('
+                    ' ticket TEXT NOT NULL COLLATE NOCASE,'
+                    ' repo TEXT NOT NULL,'
+                    ' branch TEXT NOT NULL,'
+                    ' template TEXT,'
+                    ' updated REAL NOT NULL,'
+                    ' PRIMARY KEY (repo, branch))'
+                )
+                connection.execute('CREATE INDEX tickets_by_ticket ON tickets (ticket)')
+                connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def close(self):
+        """Close the connection (if open)."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    # Queries
+
+    def find(self, ticket):
+        """Find the branches configured for a ticket (case insensitive).
+
+        :param ticket: Ticket number
+
+        :return: List of TicketEntry tuples, most recently registered first
+        """
+        rows = self.connection.execute(
+            'SELECT ticket, repo, branch, template, updated FROM tickets'
+            ' WHERE ticket = ? ORDER BY updated DESC',
+            (ticket,)
+        )
+        return [TicketEntry(*row) for row in rows]
+
+    # Updates
+
+    def update(self, register=(), unregister=()):
+        """Register and unregister branches in a single transaction.
+
+        :param register: Iterable of (ticket, repo, branch, template) tuples.
+            Replaces any existing entry for the same repo and branch
+        :param unregister: Iterable of (repo, branch) tuples to remove
+        """
+        now = time.time()
+        connection = self.connection
+        # Take the write lock up front, so this waits for other writers
+        # instead of failing when upgrading a read lock
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'DELETE FROM tickets WHERE repo = ? AND branch = ?', unregister
+            )
+            connection.executemany(
+                'INSERT OR REPLACE INTO tickets (ticket, repo, branch, template, updated)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                [entry + (now,) for entry in register]
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def prune(self, entries):
+        """Remove entries (e.g. ones whose repo no longer exists).
+
+        :param entries: Iterable of TicketEntry tuples
+        """
+        self.update(unregister=[(entry.repo, entry.branch) for entry in entries])
+
+    def find_existing(self, ticket):
+        """Like find(), but entries for repos that no longer exist are
+        removed from the registry instead of being returned.
+
+        :param ticket: Ticket number
+
+        :return: List of TicketEntry tuples, most recently registered first
+        """
+        entries = self.find(ticket)
+        missing = [entry for entry in entries if not os.path.isdir(entry.repo)]
+        if missing:
+            self.prune(missing)
+        return [entry for entry in entries if entry not in missing]
+
+
+def find_ticket(path, ticket):
+    """Look up a ticket in a registry (see TicketRegistry.find_existing()),
+    opening and closing it.
+
+    :param path: Path of the registry database
+    :param ticket: Ticket number
+
+    :return: List of TicketEntry tuples, most recently registered first
+    """
+    registry = TicketRegistry(path)
+    try:
+        return registry.find_existing(ticket)
+    finally:
+        registry.close()
@@ -0,0 +1,245 @@
+"""Opt-in timing traces for workflow commands.
+
+When enabled, phases of each command (loading configs, prompts, running the
+command), helpers in :mod:`git_workflow.utils.repository`, and every git
+command run through :class:`~git_workflow.utils.git_repo.Git` are recorded as
+spans. Spans are written to a
+`Chrome trace event <https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU>`__
+JSON file, which can be opened in ``chrome://tracing``, Perfetto, or
+`speedscope <https://www.speedscope.app/>`__. A cProfile dump can optionally be
+written alongside it.
+
+Instrumentation is only installed when tracing is enabled, so there is no
+overhead when it isn't.
+"""
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+#: Environment variable that enables tracing (set to output file path)
+TRACE_ENV_VAR = 'WORKFLOW_PROFILE'
+#: Environment variable that enables cProfile dumps when tracing
+CPROFILE_ENV_VAR = 'WORKFLOW_CPROFILE'
+
+#: Active Tracer instance, or None if tracing is disabled
+_tracer = None
+
+
+class _NullSpan:
+    """No-op context manager returned by span() when tracing is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Records spans and writes them as Chrome trace events."""
+
+    def __init__(self, path, cprofile=False):
+        """Constructor
+
+        :param path: Path to write trace file to
+        :param cprofile: (Default: False) If True, also record a cProfile dump
+            and write it to ``<path>.prof``
+        """
+        self.path = path
+        self.events = []
+        self.start_time = time.perf_counter()
+        self.pid = os.getpid()
+        self.profiler = None
+        if cprofile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def record(self, name, category, start, end, args=None):
+        """Record a completed span.
+
+        :param name: Span name
+        :param category: Span category
+        :param start: perf_counter() value when span started
+        :param end: perf_counter() value when span ended
+        :param args: (Optional) Dictionary of details to include with the span
+        """
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.start_time) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def write(self):
+        """Write recorded spans (and cProfile stats, if enabled) to disk."""
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.path + '.prof')
+        with open(self.path, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+class _Span:
+    """Context manager that records a span on the active tracer."""
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _tracer.record(self.name, self.category, self.start,
+                       time.perf_counter(), self.args)
+        return False
+
+
+def span(name, category='workflow', args=None):
+    """Context manager that records the enclosed block as a span if tracing is
+    enabled.
+
+    :param name: Span name
+    :param category: (Default: 'workflow') Span category
+    :param args: (Optional) Dictionary of details to include with the span
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def is_enabled():
+    """Returns True if tracing is enabled."""
+    return _tracer is not None
+
+
+def traced(func, name=None, category='workflow'):
+    """Wrap a function so calls to it are recorded as spans.
+
+    :param func: Function to wrap
+    :param name: (Default: func.__qualname__) Span name
+    :param category: (Default: 'workflow') Span category
+
+    :return: Wrapped function
+    """
+    name = name or func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name, category):
+            return func(*args, **kwargs)
+    wrapper.__wrapped_by_tracing__ = True
+    return wrapper
+
+
+def instrument_module(module, category):
+    """Wrap every function defined in a module with traced(). References to
+    those functions imported into other git_workflow modules are replaced too.
+
+    :param module: Module to instrument
+    :param category: Span category
+    """
+    originals = {
+        name: func for name, func in vars(module).items()
+        if callable(func) and getattr(func, '__module__', None) == module.__name__
+        and not isinstance(func, type)
+    }
+    wrappers = {
+        name: traced(func, name=f'{module.__name__.rpartition(".")[2]}.{name}', category=category)
+        for name, func in originals.items()
+    }
+    for other_module in list(sys.modules.values()):
+        if other_module is None or not getattr(other_module, '__name__', '').startswith('git_workflow'):
+            continue
+        for name, func in originals.items():
+            for attr, value in list(vars(other_module).items()):
+                if value is func:
+                    setattr(other_module, attr, wrappers[name])
+
+
+def instrument_class(cls, method_names, category):
+    """Wrap methods of a class with traced().
+
+    :param cls: Class to instrument
+    :param method_names: Names of methods to wrap. Methods that aren't defined
+        are skipped
+    :param category: Span category
+    """
+    for method_name in method_names:
+        method = cls.__dict__.get(method_name)
+        if method is None or getattr(method, '__wrapped_by_tracing__', False):
+            continue
+        setattr(cls, method_name, traced(method, name=f'{cls.__name__}.{method_name}',
+                                         category=category))
+
+
+def _instrument_git_commands():
+    """Record every git command run through Git.execute() as a span."""
+    from git_workflow.utils.git_repo import Git
+    execute = Git.execute
+
+    @functools.wraps(execute)
+    def traced_execute(self, command, *args, **kwargs):
+        name = ' '.join(command[:2]) if isinstance(command, (list, tuple)) else str(command)
+        with span(name, 'git', {'command': ' '.join(map(str, command))}):
+            return execute(self, command, *args, **kwargs)
+    Git.execute = traced_execute
+
+
+def enable(path=None, cprofile=None):
+    """Enable tracing and install instrumentation.
+
+    :param path: (Optional) Path to write trace file to. Defaults to the value
+        of the WORKFLOW_PROFILE environment variable
+    :param cprofile: (Optional) If True, also write a cProfile dump. Defaults
+        to True if the WORKFLOW_CPROFILE environment variable is set
+
+    :return: True if tracing was enabled
+    """
+    global _tracer
+    path = path or os.environ.get(TRACE_ENV_VAR)
+    if not path or _tracer is not None:
+        return _tracer is not None
+    if cprofile is None:
+        cprofile = bool(os.environ.get(CPROFILE_ENV_VAR))
+    _tracer = Tracer(path, cprofile=cprofile)
+    # Deferred to avoid import cycles
+    from git_workflow.utils import configs, repository
+    from git_workflow.workflow import commands
+    from git_workflow.workflow.base import WorkflowBase
+    instrument_module(repository, 'repository')
+    instrument_class(configs.Configs, ['__init__'], 'configs')
+    instrument_class(WorkflowBase, ['__init__'], 'command')
+    for command_class in commands.values():
+        instrument_class(command_class, ['get_args', 'run'], 'command')
+    _instrument_git_commands()
+    return True
+
+
+def finish():
+    """Write trace to disk (if tracing is enabled) and disable tracing.
+
+    :return: Path of the written trace file, or None if tracing was disabled
+    """
+    global _tracer
+    if _tracer is None:
+        return None
+    tracer, _tracer = _tracer, None
+    tracer.write()
+    return tracer.path
@@ -4,6 +4,12 @@ from .set_template import SetTemplate
 from .unset_template import UnsetTemplate
 from .finish_branch import FinishBranch
 from .cleanup import Cleanup
+from .list_branches import ListBranches
+from .sync import Sync
+from .doctor import Doctor
+from .where import Where
+from .checkout_ticket import CheckoutTicket
+from .hook import Hook
 
 #: Maps command names to WorkflowBase subclasses
 commands = {
@@ -12,6 +18,12 @@ commands = {
     SetTemplate.command: SetTemplate,
     UnsetTemplate.command: UnsetTemplate,
     Cleanup.command: Cleanup,
+    ListBranches.command: ListBranches,
+    Sync.command: Sync,
+    Doctor.command: Doctor,
+    Where.command: Where,
+    CheckoutTicket.command: CheckoutTicket,
+    Hook.command: Hook,
 }
 
 
@@ -41,5 +53,6 @@ def run_command(repo, parser, parsed_args=None):
         # exit_code = 1 # TODO implement? or raise specific exception
         parser.print_help()
     else:
-        command = command_class(repo, parser, parsed_args=parsed_args)
+        command = command_class(repo, parser, parsed_args=parsed_args,
+                                verbosity=getattr(parsed_args, 'verbose', 1))
         command.run()
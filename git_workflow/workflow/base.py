@@ -1,7 +1,12 @@
 """Base class for workflow scripts."""
 from abc import ABC, abstractmethod
+import argparse
 from cmd_utils import cmd
+from git_workflow.utils import picker
+from git_workflow.utils.branches import parse_branch_name, parse_duration
 from git_workflow.utils.configs import Configs
+from git_workflow.utils.output import Progress
+from git_workflow.utils.repository import Mirror, get_active_branch_name, get_branches
 
 
 class WorkflowBase(ABC):
@@ -10,7 +15,9 @@ class WorkflowBase(ABC):
                  parsed_args=None, verbosity=1):
         """Constructor
 
-        :param repo: git.Repo instance for the repository
+        :param repo: Repo instance for the repository. May be None for
+            commands that don't require one (see requires_repo), in which case
+            configs is None too
         :param parser: ArgumentParser instance
         :param parsed_args: (Optional) Parsed args object
         :param verbosity: (Default: 1) Output verbosity level
@@ -19,10 +26,12 @@ class WorkflowBase(ABC):
         self.parser = parser
         self.parsed_args = parsed_args
         self.verbosity = verbosity
-        self.configs = Configs(self.repo)
+        self.configs = Configs(self.repo) if self.repo is not None else None
 
     #: Names of git configs used in this command
     configs_used = []
+    #: If False, the command can also run outside of a git repo
+    requires_repo = True
 
     @classmethod
     def _add_base_subparser(cls, subparsers, generic_parent_parser):
@@ -39,6 +48,40 @@ class WorkflowBase(ABC):
             parents=[generic_parent_parser], add_help=False
         )
 
+    @staticmethod
+    def _add_dry_run_argument(subparser):
+        """Add --dry-run argument to a subparser (for commands that use
+        run_plan()).
+
+        :param subparser: Subparser object
+        """
+        dry_run_args = subparser.add_argument_group(
+            'Dry Run Arguments'
+        )
+        dry_run_args.add_argument(
+            '-n', '--dry-run', help='Show what would be done without changing anything',
+            action='store_true', default=False
+        )
+
+    @staticmethod
+    def _add_older_than_argument(argument_group, help_text):
+        """Add --older-than argument to an argument group. It's parsed into a
+        number of days (see parse_duration()).
+
+        :param argument_group: Argument group object
+        :param help_text: Help text for the argument
+        """
+        def duration(value):
+            try:
+                return parse_duration(value)
+            except ValueError as e:
+                raise argparse.ArgumentTypeError(str(e))
+
+        argument_group.add_argument(
+            '--older-than', metavar='<duration>', help=help_text,
+            type=duration, default=None
+        )
+
     # Abstract Properties and Methods
 
     @property
@@ -99,3 +142,67 @@ class WorkflowBase(ABC):
     def print_info(self, *lines, required_verbosity=1):
         if self.verbosity >= required_verbosity:
             cmd.print_info(*lines)
+
+    def progress(self, label, total):
+        """Returns a Progress to report an operation on many items with,
+        instead of printing a line per item (see utils.output).
+
+        :param label: Description of the operation
+        :param total: Number of items that will be processed
+        """
+        return Progress(label, total, verbosity=self.verbosity)
+
+    def run_plan(self, plan, dry_run=False):
+        """Execute a Plan, or if dry_run is True, print what it would do.
+
+        :param plan: Plan to execute
+        :param dry_run: (Default: False) If True, only print the plan
+
+        :return: True if the whole plan was executed
+        """
+        if dry_run:
+            self.print_info('Dry run, the following changes would be made:')
+            self.print(*(plan.describe() or ['Nothing to do.']), indent_first_line=True)
+            self.print('')
+            return False
+        return plan.execute()
+
+    def get_mirror(self):
+        """Returns a Mirror tuple for workflow.mirrorPath, or None if it isn't
+        configured."""
+        if not self.configs.MIRROR_PATH:
+            return None
+        return Mirror(self.configs.MIRROR_PATH, self.configs.MIRROR_MAX_AGE)
+
+    def get_branches_arg(self, prompt_text, exclude=()):
+        """Get the branches passed as positional arguments. If there aren't
+        any, let the user pick branches with the interactive branch picker
+        (see workflow.branchPicker), or default to the current branch if it
+        can't be used.
+
+        :param prompt_text: Text to show in the branch picker
+        :param exclude: (Optional) Names of branches that can't be picked
+
+        :return: List of branch names (empty if the user cancelled)
+        """
+        if self.parsed_args.branches:
+            return self.parsed_args.branches
+        if not (self.configs.BRANCH_PICKER and picker.is_available()):
+            return [self.repo.active_branch_name]
+        # Current branch first, then workflow branches from newest to oldest
+        current_branch = get_active_branch_name(self.repo)
+        branch_names = sorted(
+            branch_name for branch_name in get_branches(self.repo)
+            if branch_name != current_branch and branch_name not in exclude
+        )
+        branch_names.sort(key=self._get_branch_date, reverse=True)
+        if current_branch is not None and current_branch not in exclude:
+            branch_names.insert(0, current_branch)
+        return picker.pick(branch_names, prompt_text, multiple=True)
+
+    @staticmethod
+    def _get_branch_date(branch_name):
+        """Returns the date stamp of a workflow branch, or an empty string for
+        other branches (used to sort branches)."""
+        parsed_name = parse_branch_name(branch_name)
+        return parsed_name.date if parsed_name is not None else ''
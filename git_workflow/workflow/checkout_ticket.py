@@ -0,0 +1,104 @@
+from cmd_utils import cmd
+from git_workflow.utils import picker
+from git_workflow.utils.repository import (
+    get_active_branch_name, get_all_branch_metadata, get_branches, get_worktrees,
+    is_current_worktree
+)
+from git_workflow.utils.ticket_registry import find_ticket, get_repo_display_path, get_repo_key
+from .base import WorkflowBase
+
+
+class CheckoutTicket(WorkflowBase):
+    """\
+    Check out the branch configured for a ticket.
+
+    The branch is looked up in the ticket registry (see ``workflow where``).
+    Branches configured before the registry existed (or with the registry
+    disabled) are found in this repo's branch metadata instead.
+
+    - If the ticket's branches are in a different repo, their paths are shown
+      instead
+    - If the branch is checked out in a linked worktree, the worktree's path
+      is shown instead, since a branch can only be checked out in one
+      worktree
+    - If multiple branches in this repo are configured for the ticket, one
+      can be picked interactively (in a terminal). Otherwise they are listed
+      and nothing is checked out
+    """
+
+    command = 'checkout'
+    description = 'Check out the branch configured for a ticket.'
+    configs_used = ['ticketRegistryPath']
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        checkout_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        positional_args = checkout_subparser.add_argument_group(
+            'Positional Arguments'
+        )
+        positional_args.add_argument(
+            'ticket', metavar='<ticket>', help='Ticket number to check out the branch for'
+        )
+
+    def run(self):
+        ticket = self.parsed_args.ticket.strip()
+        entries = []
+        if self.configs.TICKET_REGISTRY_PATH:
+            entries = find_ticket(self.configs.TICKET_REGISTRY_PATH, ticket)
+        repo_key = get_repo_key(self.repo)
+        branch_names = self.find_branches(ticket, [
+            entry.branch for entry in entries if entry.repo == repo_key
+        ])
+        if not branch_names:
+            other_repos = [
+                f'{cmd.INDENT}{entry.branch} in {get_repo_display_path(entry.repo)}'
+                for entry in entries if entry.repo != repo_key
+            ]
+            if other_repos:
+                raise Exception('\n'.join(
+                    [f'Ticket {ticket} is only configured in other repos:'] + other_repos
+                ))
+            raise Exception(f'No branches found for ticket {ticket}.')
+        if len(branch_names) > 1:
+            if not picker.is_available():
+                raise Exception('\n'.join(
+                    [f'Multiple branches are configured for ticket {ticket}:']
+                    + [cmd.INDENT + branch_name for branch_name in branch_names]
+                ))
+            branch_names = picker.pick(branch_names, f'Branch for {ticket}')
+            if not branch_names:
+                return
+        branch_name = branch_names[0]
+        # Branches can only be checked out in one worktree
+        worktree_path = get_worktrees(self.repo).get(branch_name)
+        if worktree_path is not None and not is_current_worktree(self.repo, worktree_path):
+            self.print(f'{branch_name} is checked out in {worktree_path}.')
+            return
+        if get_active_branch_name(self.repo) == branch_name:
+            self.print(f'Already on {branch_name}.')
+            return
+        self.repo.git.checkout(branch_name)
+        self.print_success(f'Switched to branch {branch_name}.')
+
+    # Helper Methods
+
+    def find_branches(self, ticket, registered_branches):
+        """Get the existing branches in this repo configured for a ticket.
+
+        :param ticket: Ticket number
+        :param registered_branches: Branches in this repo the ticket registry
+            has for the ticket, most recent first. If empty, branch metadata
+            is searched instead
+
+        :return: List of branch names
+        """
+        if not registered_branches:
+            registered_branches = sorted(
+                branch_name for branch_name, metadata in get_all_branch_metadata(self.repo).items()
+                if metadata.get('ticket', '').lower() == ticket.lower()
+            )
+        existing_branches = get_branches(self.repo)
+        return [
+            branch_name for branch_name in registered_branches
+            if branch_name in existing_branches
+        ]
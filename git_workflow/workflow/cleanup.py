@@ -1,11 +1,54 @@
 import glob
+from itertools import islice
+import json
 import os
-import re
+import time
 from cmd_utils import cmd
+from git_workflow.utils import branches, repository
+from git_workflow.utils.git_repo import parse_config
+from git_workflow.utils.output import pluralize
+from git_workflow.utils.patch_ids import PatchIdCache, find_merged_upstream
+from git_workflow.utils.plan import ConfigRemoveSection, DeleteRef, Plan
 from .base import WorkflowBase
 from .unset_template import UnsetTemplate
 
 
+class Budget:
+    """Limits how much work is done in one run (see --max-time and
+    --max-items)."""
+
+    def __init__(self, max_time=None, max_items=None):
+        """Constructor
+
+        :param max_time: (Optional) Seconds from now to stop starting new
+            work after
+        :param max_items: (Optional) Maximum number of items to process
+        """
+        self.deadline = None if max_time is None else time.monotonic() + max_time
+        self.items_left = max_items
+
+    @property
+    def is_limited(self):
+        """True if there's a time or item limit."""
+        return self.deadline is not None or self.items_left is not None
+
+    def __bool__(self):
+        """True while there's budget left."""
+        if self.items_left is not None and self.items_left <= 0:
+            return False
+        return self.deadline is None or time.monotonic() < self.deadline
+
+    def take(self, count):
+        """Count up to count items as processed.
+
+        :return: Number of items that fit in the budget
+        """
+        if self.items_left is not None:
+            count = min(count, self.items_left)
+            self.items_left -= count
+        return count
+
+
 class Cleanup(WorkflowBase):
     """\
     Tidy up workflow-related files and configs.
@@ -19,11 +62,63 @@ class Cleanup(WorkflowBase):
 
     By default, the current branch is omitted from cleanup unless
     ``--include-current-branch`` is specified.
+
+    If ``--merged`` is specified, this command will instead delete every
+    workflow branch that has been merged into the base branch (or the branch
+    specified with ``--into``) and unset their commit templates. Merged
+    branches are found with a single ``git for-each-ref --merged`` query and
+    deleted together in one ``git update-ref --stdin`` transaction (unless
+    ``--max-time`` or ``--max-items`` is specified, see below). If a
+    merged branch is checked out in a linked worktree (e.g. one created with
+    ``workflow start --worktree``), the worktree is removed as well. Branches
+    checked out in the current or main worktree are never deleted.
+
+    Branches that were squash-merged or rebase-merged are detected by comparing
+    patch IDs against the base branch (similar to ``git cherry``). Patch IDs
+    are cached in ``.git/workflow_patch_ids``, so subsequent runs only need to
+    process new commits. Use ``--no-patch-id`` to skip this check.
+
+    If ``--older-than`` is specified, this command will instead delete every
+    workflow branch older than the given duration (e.g. ``90d``, ``12w``,
+    ``6m`` or ``1y``), whether it has been merged or not, which allows
+    enforcing a branch retention policy. Since unmerged work is lost, only
+    branches created by workflow are deleted this way (ones with a commit
+    template or branch metadata, or with initials matching
+    ``workflow.initials``), and the tip SHA of each deleted branch is shown so
+    it can be recovered. Other branches that merely match the naming scheme
+    are listed and kept. Combined with ``--merged``, only
+    branches that are both merged and expired are deleted. Branch ages come
+    from the ``<yyyymmdd>`` date in branch names, so no commits have to be
+    read. Only branches that don't follow the naming scheme (but have a commit
+    template) are dated by the committer date of their tip, which is looked up
+    for all of them in a single git command. Expired branches are deleted the
+    same way as merged ones.
+
+    Branches and orphans left to clean up are saved to
+    ``.git/workflow_cleanup_cursor``. If cleanup is interrupted, or stops
+    early because of ``--max-time`` or ``--max-items``, the next run resumes
+    from there without finding targets again or asking for confirmation (use
+    ``--restart`` to start over). With ``--max-time`` or ``--max-items``,
+    branches are processed in chunks of 100 instead, each deleted in its own
+    ``git update-ref --stdin`` transaction, and the cursor is saved after
+    each chunk. If a chunk fails, branches in earlier chunks stay deleted and
+    the failed chunk is retried by the next run. This allows cleaning
+    up a large backlog in small slices, e.g. with ``workflow cleanup --force
+    --max-time 2`` in a ``post-checkout`` hook or cron job. Targets created
+    after a cleanup started are found once it's finished.
     """
 
     command = 'cleanup'
     description = 'Tidy up workflow-related files and configs.'
-    configs_used = ['cleanupConfirmationPrompt']
+    configs_used = ['baseBranch', 'cleanupConfirmationPrompt', 'initials']
+
+    #: Filename of the cursor file (in the git dir)
+    CURSOR_FILENAME = 'workflow_cleanup_cursor'
+    #: Bump when the cursor format changes
+    CURSOR_VERSION = 1
+    #: Number of branches or orphans to process between saving the cursor
+    #: (with --max-time or --max-items)
+    CHUNK_SIZE = 100
 
     @classmethod
     def add_subparser(cls, subparsers, generic_parent_parser):
@@ -36,10 +131,45 @@ class Cleanup(WorkflowBase):
             '-B', '--include-current-branch', help='Unset template for current branch too',
             action='store_true', default=False
         )
-        cleanup_args.add_argument(
+        scope_group = cleanup_args.add_mutually_exclusive_group()
+        scope_group.add_argument(
             '-o', '--orphans-only', help='Only clean up templates without a branch',
             action='store_true', default=False
         )
+        scope_group.add_argument(
+            '-m', '--merged', help='Delete merged workflow branches and unset their templates',
+            action='store_true', default=False
+        )
+        cls._add_older_than_argument(
+            cleanup_args, 'Delete workflow branches older than this, e.g. 90d, 12w, 6m or 1y '
+                          '(with --merged, only merged ones) and unset their templates'
+        )
+        cleanup_args.add_argument(
+            '--no-patch-id', help='With --merged, skip detection of squash-merged and rebase-merged branches',
+            dest='patch_id', action='store_false', default=True
+        )
+        cleanup_args.add_argument(
+            '--into', metavar='<base>',
+            help='Branch to check for merged branches against (default: workflow.baseBranch)',
+            default=None
+        )
+        # Budget
+        budget_args = cleanup_subparser.add_argument_group(
+            'Budget Arguments',
+            'Stop early and resume on the next run.'
+        )
+        budget_args.add_argument(
+            '--max-time', metavar='<seconds>', type=float, default=None,
+            help='Stop after this many seconds (checked between chunks)'
+        )
+        budget_args.add_argument(
+            '--max-items', metavar='<n>', type=int, default=None,
+            help='Stop after cleaning up this many branches and orphans'
+        )
+        budget_args.add_argument(
+            '--restart', help='Discard progress saved by a previous run and start over',
+            action='store_true', default=False
+        )
         # Confirmation prompt
         confirmation_args = cleanup_subparser.add_argument_group(
             'Confirmation Prompt Arguments',
@@ -59,6 +189,15 @@ class Cleanup(WorkflowBase):
         args = {}
         args['include_current_branch'] = self.parsed_args.include_current_branch
         args['orphans_only'] = self.parsed_args.orphans_only
+        args['merged'] = self.parsed_args.merged
+        args['older_than'] = self.parsed_args.older_than
+        if args['orphans_only'] and args['older_than'] is not None:
+            raise Exception("--older-than can't be used with --orphans-only.")
+        args['into'] = self.parsed_args.into or self.configs.BASE_BRANCH
+        args['patch_id'] = self.parsed_args.patch_id
+        args['max_time'] = self.parsed_args.max_time
+        args['max_items'] = self.parsed_args.max_items
+        args['restart'] = self.parsed_args.restart
         # Default to config value unless otherwise specified
         args['confirm'] = (self.configs.CLEANUP_CONFIRMATION_PROMPT
                            if self.parsed_args.confirm is None else
@@ -67,14 +206,22 @@ class Cleanup(WorkflowBase):
 
     def run(self):
         args = self.get_args()
+        # Resume a previous run
+        cursor = self.load_cursor(args)
+        if cursor is not None:
+            self.print(f'Resuming cleanup, {self.format_remaining(cursor)} left.', '')
+            self.process_cursor(args, cursor)
+            return
+        if self.is_deleting_branches(args):
+            return self.run_delete(args)
         targets = self.find_cleanup_targets()
         orphans = targets.pop('orphans', [])
         # Pop current branch's configs if we shouldn't include it
         if not args['include_current_branch']:
-            current_branch = targets.pop(self.repo.active_branch.name, None)
+            current_branch = targets.pop(self.repo.active_branch_name, None)
         # Otherwise keep track of it for messaging
         else:
-            current_branch = targets.get(self.repo.active_branch.name, None)
+            current_branch = targets.get(self.repo.active_branch_name, None)
         # Output: Configured Templates (unless --orphans-only)
         if not args['orphans_only']:
             # Case 1: We have branches to clean
@@ -110,36 +257,359 @@ class Cleanup(WorkflowBase):
             )
             if not confirmation:
                 return
-        # Unset Configured Templates
-        if not args['orphans_only'] and targets:
-            self.print('Unsetting configured templates...')
-            for branch_name in targets.keys():
-                unset_template_parsed_args = self.parser.parse_args([UnsetTemplate.command, branch_name, '--force'])
-                unset_template = UnsetTemplate(self.repo, self.parser,
-                                               parsed_args=unset_template_parsed_args,
-                                               # TODO match verbosity if > 1?
-                                               verbosity=0)
-                unset_template.run()
-                self.print_success(f'{branch_name} template unset.')
-            self.print('')
-        # Delete Orphans
+        # Unset Configured Templates and Delete Orphans
+        cursor = self.create_cursor(args, {} if args['orphans_only'] else dict.fromkeys(targets),
+                                    orphans)
+        self.process_cursor(args, cursor)
+
+    def run_delete(self, args):
+        """Delete all workflow branches merged into args['into'] and/or older
+        than args['older_than'], and unset their commit templates.
+
+        :param args: get_args() result
+        """
+        base = args['into']
+        targets = self.find_cleanup_targets()
+        orphans = targets.pop('orphans', [])
+        expired_branches = self.find_workflow_branches(base, targets)
+        reasons = []
+        # Filter by age first, since it doesn't read any commits
+        if args['older_than'] is not None:
+            expired_branches = self.find_older_branches(expired_branches, args['older_than'])
+        if args['merged']:
+            expired_branches = self.find_merged_branches(base, expired_branches,
+                                                         patch_id=args['patch_id'])
+            reasons.append(f'have been merged into {base}')
+        if args['older_than'] is not None:
+            reasons.append(f'are older than {pluralize(args["older_than"], "day")}')
+        # Unmerged branches are only deleted if workflow created them, since
+        # other branches can match the naming scheme by accident
+        unowned_branches = []
+        if not args['merged']:
+            owned_branches = self.find_owned_branches(expired_branches, targets)
+            unowned_branches = [
+                branch_name for branch_name in expired_branches if branch_name not in owned_branches
+            ]
+            expired_branches = owned_branches
+        # Output: Expired branches
+        if expired_branches:
+            self.print(f'The following branches {" and ".join(reasons)} and will be deleted:',
+                       '',
+                       *(expired_branches.keys() if args['merged'] else
+                         [f'{branch_name} ({sha})' for branch_name, sha in expired_branches.items()]),
+                       '')
+            if not args['merged']:
+                self.print_warning('Branches are deleted whether they have been merged or not!',
+                                   'To only delete merged branches, use --merged argument.',
+                                   '')
+        # Output: Branches that weren't created by workflow
+        if unowned_branches:
+            self.print(f'The following branches {" and ".join(reasons)} but were not created by workflow '
+                       'and will be kept (use --merged argument to delete them if they have been merged):',
+                       '',
+                       *unowned_branches,
+                       '')
+        # Output: Orphans
         if orphans:
-            self.print('Removing orphan templates...')
-            repo_root_dir = os.path.dirname(self.repo.git_dir)
-            for orphan in orphans:
-                orphan_path = os.path.join(repo_root_dir, orphan)
-                # NOTE: Probably don't need this exists() check since find_cleanup_targets()
-                # builds this list based on the files it finds, but doing it just to be safe
-                if os.path.exists(orphan_path):
-                    os.remove(orphan_path)
-                    if not os.path.exists(orphan_path):
-                        self.print_success(f'Deleted {orphan}.')
-                    else:
-                        self.print_warning(f'Unable to delete {orphan}.')
-            self.print('')
+            self.print('The following commit templates do not have an associated branch and will be deleted:',
+                       '',
+                       *orphans,
+                       '')
+        # Output: Nothing to clean up
+        if not expired_branches and not orphans:
+            self.print('Nothing to clean up.')
+            return
+        # Confirmation
+        if args['confirm']:
+            confirmation = cmd.prompt(
+                'Confirm (y/n)',
+                'Would you like to continue?',
+                default_val='n', validate_function=cmd.validate_yn
+            )
+            if not confirmation:
+                return
+        # Delete expired branches and orphans
+        cursor = self.create_cursor(args, expired_branches, orphans)
+        self.process_cursor(args, cursor)
 
     # Helper Methods
 
+    def process_cursor(self, args, cursor):
+        """Clean up the branches and orphans left in a cursor in chunks,
+        saving the cursor after each one, until everything is cleaned up (and
+        the cursor is deleted) or the budget runs out.
+
+        :param args: get_args() result
+        :param cursor: Result of create_cursor() or load_cursor()
+        """
+        budget = Budget(args['max_time'], args['max_items'])
+        remaining_branches = cursor['branches']
+        if remaining_branches and budget:
+            deleting = self.is_deleting_branches(args)
+            noun = 'merged branch' if args['merged'] else 'expired branch'
+            label = f'Deleting {noun}es' if deleting else 'Unsetting configured templates'
+            with self.progress(label, len(remaining_branches)) as progress:
+                while remaining_branches and budget:
+                    chunk_size = budget.take(self.get_chunk_size(budget, remaining_branches))
+                    chunk = dict(islice(remaining_branches.items(), chunk_size))
+                    if deleting:
+                        self.delete_branches(dict(chunk), progress, unmerged=not args['merged'])
+                    else:
+                        self.unset_templates(chunk, progress, args['include_current_branch'])
+                    for branch_name in chunk:
+                        del remaining_branches[branch_name]
+                    self.save_cursor(cursor)
+            if deleting:
+                self.print_success(f'Deleted {pluralize(progress.count, noun, noun + "es")}.', '')
+            else:
+                self.print_success(f'Unset {pluralize(progress.count, "commit template")}.', '')
+        remaining_orphans = cursor['orphans']
+        if remaining_orphans and budget:
+            with self.progress('Removing orphan templates', len(remaining_orphans)) as progress:
+                while remaining_orphans and budget:
+                    chunk_size = budget.take(self.get_chunk_size(budget, remaining_orphans))
+                    self.delete_orphans(remaining_orphans[:chunk_size], progress)
+                    del remaining_orphans[:chunk_size]
+                    self.save_cursor(cursor)
+            self.print_success(f'Deleted {pluralize(progress.count, "orphan template")}.', '')
+        if remaining_branches or remaining_orphans:
+            self.print_info(f'Stopped with {self.format_remaining(cursor)} left. '
+                            'Run this command again to continue.')
+        else:
+            self.delete_cursor()
+
+    def get_chunk_size(self, budget, remaining):
+        """Returns the number of items to process in the next chunk: all of
+        them (so branches are deleted in a single transaction) unless the
+        budget is limited.
+
+        :param budget: Budget instance
+        :param remaining: Items left to process
+        """
+        if budget.is_limited:
+            return min(self.CHUNK_SIZE, len(remaining))
+        return len(remaining)
+
+    def get_unset_template(self):
+        """Returns an UnsetTemplate instance to plan unsetting templates
+        with."""
+        unset_template_parsed_args = self.parser.parse_args([UnsetTemplate.command, '--force'])
+        return UnsetTemplate(self.repo, self.parser,
+                             parsed_args=unset_template_parsed_args,
+                             # TODO match verbosity if > 1?
+                             verbosity=0)
+
+    def unset_templates(self, branch_names, progress, include_current_branch=False):
+        """Unset commit templates for the specified branches. Config changes
+        for all branches are coalesced, so each config file is only written
+        once.
+
+        :param branch_names: Names of branches to unset templates for
+        :param progress: Progress to report unset templates to
+        :param include_current_branch: (Default: False) If False, the current
+            branch is skipped (in case it was checked out after cleanup
+            started)
+        """
+        if not include_current_branch:
+            current_branch = repository.get_active_branch_name(self.repo)
+            branch_names = [
+                branch_name for branch_name in branch_names if branch_name != current_branch
+            ]
+        plan = Plan(self.repo)
+        self.get_unset_template().plan_unset_templates(plan, branch_names)
+        plan.execute()
+        for branch_name in branch_names:
+            progress.advance(f'{branch_name} template unset.')
+
+    def delete_branches(self, expired_branches, progress, unmerged=False):
+        """Delete merged or expired branches along with their configs,
+        metadata and commit templates, coalescing all changes into a single
+        plan. Branches that moved since cleanup found them, or that are now
+        checked out in the current or main worktree, are skipped.
+
+        :param expired_branches: Dictionary mapping branch names to the SHAs
+            they had when cleanup found them. Modified in place
+        :param progress: Progress to report deleted branches to
+        :param unmerged: (Default: False) If True, branches may not have been
+            merged, so their tip SHAs are always shown so they can be
+            recovered
+        """
+        current_shas = repository.get_branches(self.repo)
+        protected_branches = self.get_protected_branches()
+        for branch_name, sha in list(expired_branches.items()):
+            if branch_name in protected_branches:
+                progress.warning(f'{branch_name} is checked out, skipping.')
+            elif current_shas.get(branch_name) != sha:
+                progress.warning(f'{branch_name} was moved or deleted since cleanup started, skipping.')
+            else:
+                continue
+            del expired_branches[branch_name]
+        self.remove_worktrees(expired_branches, progress)
+        if not expired_branches:
+            return
+        plan = Plan(self.repo)
+        self.get_unset_template().plan_unset_templates(plan, expired_branches)
+        local_config_path = os.path.join(self.repo.common_dir, 'config')
+        metadata_path = repository.get_branch_metadata_path(self.repo)
+        for branch_name, sha in expired_branches.items():
+            plan.add(
+                DeleteRef(f'refs/heads/{branch_name}', sha),
+                ConfigRemoveSection(local_config_path, f'branch.{branch_name}'),
+                ConfigRemoveSection(metadata_path, f'branch.{branch_name}'),
+            )
+        plan.execute()
+        for branch_name in expired_branches:
+            if unmerged:
+                progress.warning(f'Deleted {branch_name} (was {expired_branches[branch_name]}).')
+                progress.advance()
+            else:
+                progress.advance(f'Deleted {branch_name}.')
+
+    def remove_worktrees(self, expired_branches, progress):
+        """Remove linked worktrees that branches to delete are checked out in.
+        Branches whose worktree can't be removed (e.g. because it has
+        uncommitted changes) are removed from expired_branches.
+
+        :param expired_branches: Dictionary mapping names of branches to
+            delete to their SHAs. Modified in place
+        :param progress: Progress to report removed worktrees to
+        """
+        worktrees = repository.get_worktrees(self.repo)
+        for branch_name in list(expired_branches):
+            worktree_path = worktrees.get(branch_name)
+            if worktree_path is None:
+                continue
+            if repository.remove_worktree(self.repo, worktree_path):
+                progress.advance(f'Removed worktree {worktree_path}.', count=0)
+            else:
+                progress.warning(f'Unable to remove worktree {worktree_path}, skipping {branch_name}.')
+                del expired_branches[branch_name]
+
+    def delete_orphans(self, orphans, progress):
+        """Delete orphaned commit template files.
+
+        :param orphans: List of orphaned commit template filenames
+        :param progress: Progress to report deleted orphans to
+        """
+        repo_root_dir = self.repo.working_tree_dir
+        for orphan in orphans:
+            orphan_path = os.path.join(repo_root_dir, orphan)
+            # Orphans may have been deleted since cleanup started
+            if os.path.exists(orphan_path):
+                os.remove(orphan_path)
+                if not os.path.exists(orphan_path):
+                    progress.advance(f'Deleted {orphan}.')
+                else:
+                    progress.warning(f'Unable to delete {orphan}.')
+
+    @staticmethod
+    def is_deleting_branches(args):
+        """Returns True if branches are deleted (with --merged or
+        --older-than) rather than just having their templates unset."""
+        return args['merged'] or args['older_than'] is not None
+
+    def get_protected_branches(self):
+        """Returns the set of branches checked out in the current or main
+        worktree, which are never deleted."""
+        main_worktree_path = os.path.realpath(repository.get_main_worktree_path(self.repo))
+        return {
+            branch_name
+            for branch_name, worktree_path in repository.get_worktrees(self.repo).items()
+            if repository.is_current_worktree(self.repo, worktree_path)
+            or os.path.realpath(worktree_path) == main_worktree_path
+        }
+
+    def find_workflow_branches(self, base, targets):
+        """Get workflow branches that may be deleted.
+
+        A branch is considered a workflow branch if it follows the ``workflow
+        start`` naming scheme or has a commit template configured. The base
+        branch itself and any branches checked out in the current or main
+        worktree are omitted.
+
+        :param base: Base branch
+        :param targets: Result of find_cleanup_targets()
+
+        :return: Dictionary mapping branch names to their tip SHAs
+        """
+        excluded_branches = self.get_protected_branches()
+        excluded_branches.add(base)
+        return {
+            branch_name: sha
+            for branch_name, sha in repository.get_branches(self.repo).items()
+            if branch_name not in excluded_branches
+            and (branch_name in targets or branches.is_workflow_branch(branch_name))
+        }
+
+    def find_older_branches(self, workflow_branches, days):
+        """Get the branches that are older than a number of days (see
+        repository.get_branch_dates()).
+
+        :param workflow_branches: Dictionary mapping branch names to their tip
+            SHAs (e.g. find_workflow_branches() result)
+        :param days: Number of days
+
+        :return: Dictionary mapping expired branch names to their tip SHAs
+        """
+        cutoff = branches.get_cutoff_date(days)
+        dates = repository.get_branch_dates(self.repo, workflow_branches)
+        return {
+            branch_name: sha for branch_name, sha in workflow_branches.items()
+            if branch_name in dates and dates[branch_name] < cutoff
+        }
+
+    def find_owned_branches(self, workflow_branches, targets):
+        """Get the branches that were created by workflow: ones with a commit
+        template or branch metadata (e.g. a client recorded by ``workflow
+        start``), or whose initials match workflow.initials.
+
+        :param workflow_branches: Dictionary mapping branch names to their tip
+            SHAs (e.g. find_workflow_branches() result)
+        :param targets: Result of find_cleanup_targets()
+
+        :return: Dictionary mapping owned branch names to their tip SHAs
+        """
+        metadata = repository.get_all_branch_metadata(self.repo)
+        initials = self.configs.INITIALS
+        owned_branches = {}
+        for branch_name, sha in workflow_branches.items():
+            branch_name_parts = branches.parse_branch_name(branch_name)
+            if (branch_name in targets or branch_name in metadata
+                    or (initials and branch_name_parts is not None
+                        and branch_name_parts.initials == initials.lower())):
+                owned_branches[branch_name] = sha
+        return owned_branches
+
+    def find_merged_branches(self, base, workflow_branches, patch_id=True):
+        """Get the branches that have been merged into base.
+
+        :param base: Branch to check against
+        :param workflow_branches: Dictionary mapping branch names to their tip
+            SHAs (e.g. find_workflow_branches() result)
+        :param patch_id: (Default: True) If True, also check unmerged branches
+            for squash-merges and rebase-merges by comparing patch IDs
+
+        :return: Dictionary mapping merged branch names to their tip SHAs
+        """
+        merged_branches = {
+            branch_name: workflow_branches[branch_name]
+            for branch_name in repository.get_merged_branches(self.repo, base)
+            if branch_name in workflow_branches
+        }
+        if patch_id:
+            unmerged_branches = [
+                branch_name for branch_name in workflow_branches
+                if branch_name not in merged_branches
+            ]
+            if unmerged_branches:
+                merged_upstream = find_merged_upstream(
+                    self.repo, unmerged_branches, base, PatchIdCache(self.repo)
+                )
+                for branch_name in unmerged_branches:
+                    if branch_name in merged_upstream:
+                        merged_branches[branch_name] = workflow_branches[branch_name]
+        return merged_branches
+
     def find_cleanup_targets(self):
         """Get configured and orphaned commit templates.
 
@@ -149,35 +619,25 @@ class Cleanup(WorkflowBase):
             templates, there will also be a key 'orphans' that's mapped to a
             list of orphaned commit templates.
         """
-        # Get all branch-specific config paths
-        config_expr = 'includeif\.onbranch:(.*)\.path'
-        config_matches = self.configs.call_config_command(
-            config_expr, file=self.configs.CONFIG_PATH, get_regexp=True
-        )
-        if config_matches is not None:
-            config_matches = config_matches.split('\n')
-        else:
-            config_matches = []
         # Map branch names to their config files and configured templates
-        expr = r'includeif\.onbranch:(.*)\.path (.*)'
         targets = {}
         # Used to keep track of all configured commit templates so orphaned ones can be determined
-        configured_commit_templates = []
-        for line in config_matches:
-            match = re.match(expr, line)
-            if match:
-                branch_name = match.group(1)
-                branch_config_file = match.group(2)
-                branch_commit_template = self.configs.get_config(
-                    'commit.template', file=os.path.join(self.repo.git_dir, branch_config_file)
-                )
-                targets[branch_name] = {
-                    'config': branch_config_file,
-                    'template': branch_commit_template,
-                }
-                configured_commit_templates.append(branch_commit_template)
+        configured_commit_templates = set()
+        for branch_name, branch_config_file in repository.get_branch_config_files(self.repo).items():
+            branch_config = self.repo.read_cached(
+                os.path.join(self.repo.common_dir, branch_config_file), parse_config
+            ) or []
+            branch_commit_template = None
+            for key, value in branch_config:
+                if key == 'commit.template':
+                    branch_commit_template = value
+            targets[branch_name] = {
+                'config': branch_config_file,
+                'template': branch_commit_template,
+            }
+            configured_commit_templates.add(branch_commit_template)
         # Find orphaned templates
-        repo_root_dir = os.path.dirname(self.repo.git_dir)
+        repo_root_dir = self.repo.working_tree_dir
         all_commit_templates = [
             os.path.basename(path)
             for path in glob.glob(os.path.join(repo_root_dir, '.gitmessage_local*'))
@@ -189,3 +649,91 @@ class Cleanup(WorkflowBase):
         if orphan_commit_templates:
             targets['orphans'] = orphan_commit_templates
         return targets
+
+    # Cursor
+
+    def get_cursor_path(self):
+        """Returns the path of the cursor file."""
+        return os.path.join(self.repo.common_dir, self.CURSOR_FILENAME)
+
+    @staticmethod
+    def get_cursor_key(args):
+        """Returns the arguments that identify a cleanup, so a cursor is only
+        resumed by the same kind of cleanup."""
+        if args['merged']:
+            key = ['merged', args['into'], args['patch_id']]
+        elif args['older_than'] is not None:
+            key = ['expired', args['into']]
+        else:
+            return ['templates', args['orphans_only']]
+        if args['older_than'] is not None:
+            key.append(args['older_than'])
+        return key
+
+    def create_cursor(self, args, branch_names, orphans):
+        """Create a cursor for a new cleanup and save it.
+
+        :param args: get_args() result
+        :param branch_names: Dictionary mapping branches to clean up to their
+            SHAs (with --merged or --older-than) or None
+        :param orphans: List of orphaned commit template filenames
+
+        :return: Cursor dictionary
+        """
+        cursor = {
+            'version': self.CURSOR_VERSION,
+            'key': self.get_cursor_key(args),
+            'branches': dict(branch_names),
+            'orphans': list(orphans),
+        }
+        self.save_cursor(cursor)
+        return cursor
+
+    def load_cursor(self, args):
+        """Load the cursor saved by a previous cleanup, unless --restart was
+        specified.
+
+        :param args: get_args() result
+
+        :return: Cursor dictionary, or None if there's no cursor for this kind
+            of cleanup (or it can't be read)
+        """
+        if args['restart']:
+            self.delete_cursor()
+            return None
+        try:
+            with open(self.get_cursor_path()) as f:
+                cursor = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (not isinstance(cursor, dict)
+                or cursor.get('version') != self.CURSOR_VERSION
+                or cursor.get('key') != self.get_cursor_key(args)):
+            return None
+        return cursor
+
+    def save_cursor(self, cursor):
+        """Write the cursor to disk atomically, so an interrupted write never
+        leaves a partial cursor behind."""
+        path = self.get_cursor_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cursor, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def delete_cursor(self):
+        """Delete the cursor file (if it exists)."""
+        try:
+            os.remove(self.get_cursor_path())
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def format_remaining(cursor):
+        """Returns a description of what's left to clean up in a cursor."""
+        remaining = []
+        if cursor['branches']:
+            remaining.append(pluralize(len(cursor['branches']), 'branch', 'branches'))
+        if cursor['orphans']:
+            remaining.append(pluralize(len(cursor['orphans']), 'orphan'))
+        return ' and '.join(remaining) or 'nothing'
@@ -0,0 +1,436 @@
+from collections import namedtuple
+import glob
+import os
+import re
+import tempfile
+import time
+from git_workflow.utils.git_repo import GitCommandError, parse_config
+from git_workflow.utils.plan import Plan
+from git_workflow.utils.repository import (
+    get_all_branch_metadata, get_branches, get_workflow_config_path, set_branch_metadata
+)
+from .base import WorkflowBase
+from .unset_template import UnsetTemplate
+
+#: Problem found by ``workflow doctor``. description explains the problem,
+#: remedy explains what --fix does about it, and fix is a function that
+#: performs the remedy
+Issue = namedtuple('Issue', ['description', 'remedy', 'fix'])
+
+
+class Doctor(WorkflowBase):
+    """\
+    Diagnose repo state that slows down workflow commands and git.
+
+    Workflow state accumulates over time, and some of it is read by every git
+    command (``config_workflow`` is included in the local git config, so each
+    ``includeIf.onbranch`` entry is evaluated on every config read). This
+    command reports:
+
+    - The number of commit templates configured in ``config_workflow`` and how
+      many of them belong to branches that no longer exist
+    - Orphan ``config_<branch>`` files in ``.git`` that aren't included anywhere
+    - ``.gitmessage_local*`` files in the working tree and how many are orphans
+    - Commit templates without a ticket number recorded in
+      ``.git/workflow_branches`` (created by older versions, so ``workflow
+      list`` and ``workflow hook`` can't see their ticket)
+    - Loose vs packed refs
+    - Remote-tracking refs, and with ``--remotes``, how many are stale (this
+      contacts each remote)
+    - Timings of ``git config`` and ``git status`` with and without the
+      workflow include, to show the overhead attributable to workflow state.
+      ``git status`` is timed without the include by pointing
+      ``GIT_COMMON_DIR`` at a temporary copy of the local config without it
+      (with every other file symlinked), so the repo itself isn't modified
+
+    With ``--fix``, every issue found is remedied in one go: templates of
+    deleted branches are unset, orphan files are deleted, missing ticket
+    numbers are read back from template files, refs are packed with ``git
+    pack-refs``, and stale remote-tracking refs are pruned (with
+    ``--remotes``).
+
+    Apart from the timings (which can be skipped with ``--no-timings``), state
+    is read directly from files in ``.git``, so this is cheap enough to run in
+    CI. Use ``--check`` to exit with an error if any issues are found.
+    """
+
+    command = 'doctor'
+    description = 'Diagnose repo state that slows down workflow commands and git.'
+    configs_used = ['ticketInputFormatRegex']
+
+    #: Report loose refs once there are more than this many
+    LOOSE_REFS_THRESHOLD = 100
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        doctor_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        doctor_args = doctor_subparser.add_argument_group(
+            'Doctor Options'
+        )
+        doctor_args.add_argument(
+            '--fix', help='Remedy all issues found',
+            action='store_true', default=False
+        )
+        doctor_args.add_argument(
+            '--check', help='Exit with an error if any issues are found (e.g. in CI)',
+            action='store_true', default=False
+        )
+        doctor_args.add_argument(
+            '--remotes', help='Check remotes for stale remote-tracking refs (contacts each remote)',
+            action='store_true', default=False
+        )
+        doctor_args.add_argument(
+            '--no-timings', help='Skip timing git commands',
+            dest='timings', action='store_false', default=True
+        )
+        doctor_args.add_argument(
+            '--runs', metavar='<n>', type=int, default=3,
+            help='Number of times to run each timed command, best time is reported (default: 3)'
+        )
+
+    def get_args(self):
+        """Parse command line arguments.
+
+        :return: A dictionary with the following keys:
+            fix, check, remotes, timings, runs
+        """
+        args = {}
+        args['fix'] = self.parsed_args.fix
+        args['check'] = self.parsed_args.check
+        args['remotes'] = self.parsed_args.remotes
+        args['timings'] = self.parsed_args.timings
+        args['runs'] = max(1, self.parsed_args.runs)
+        return args
+
+    def run(self):
+        args = self.get_args()
+        issues = []
+        self.check_templates(issues)
+        self.check_refs(issues, remotes=args['remotes'])
+        if args['timings']:
+            self.print_timings(args['runs'])
+        if not issues:
+            self.print_success('No issues found.')
+            return
+        self.print_warning(f'Found {len(issues)} issues:')
+        for issue in issues:
+            self.print(f'- {issue.description}', f'Fix: {issue.remedy}')
+        self.print('')
+        if args['fix']:
+            for issue in issues:
+                issue.fix()
+            self.print_success('Fixed all issues.')
+        elif args['check']:
+            raise Exception('Repo has issues, run workflow doctor --fix to remedy them.')
+        else:
+            self.print('Run with --fix to remedy these issues.')
+
+    # Checks
+
+    def check_templates(self, issues):
+        """Report on commit templates and related files.
+
+        :param issues: List to append Issues to
+        """
+        templates = self.get_configured_templates()
+        branches = get_branches(self.repo)
+        # Templates of deleted branches
+        deleted_branches = [branch_name for branch_name in templates if branch_name not in branches]
+        # Branch config files that aren't included
+        included_configs = {config_file for config_file, _ in templates.values()}
+        orphan_configs = sorted(
+            os.path.basename(path)
+            for path in glob.glob(os.path.join(self.repo.common_dir, 'config_*'))
+            if os.path.basename(path) not in included_configs
+            and path != get_workflow_config_path(self.repo)
+        )
+        # Template files that aren't configured
+        repo_root_dir = self.repo.working_tree_dir
+        configured_template_files = {template_file for _, template_file in templates.values()}
+        template_files = [
+            os.path.basename(path)
+            for path in glob.glob(os.path.join(repo_root_dir, '.gitmessage_local*'))
+        ]
+        orphan_template_files = sorted(
+            template_file for template_file in template_files
+            if template_file not in configured_template_files
+        )
+        # Templates without a ticket number in branch metadata
+        metadata = get_all_branch_metadata(self.repo)
+        missing_tickets = {}
+        for branch_name, (_, template_file) in templates.items():
+            if branch_name in deleted_branches or metadata.get(branch_name, {}).get('ticket'):
+                continue
+            ticket = self.read_template_ticket(template_file)
+            if ticket:
+                missing_tickets[branch_name] = ticket
+        self.print('Workflow state:',
+                   f'Commit templates in config_workflow: {len(templates)} '
+                   f'({len(deleted_branches)} for deleted branches)',
+                   f'Orphan branch configs in .git: {len(orphan_configs)}',
+                   f'Commit template files: {len(template_files)} '
+                   f'({len(orphan_template_files)} orphans)',
+                   f'Templates without ticket metadata: {len(missing_tickets)}',
+                   '')
+        if deleted_branches:
+            issues.append(Issue(
+                f'{len(deleted_branches)} commit templates are configured for branches that no '
+                'longer exist, adding overhead to every git command',
+                'unset their templates',
+                lambda: self.unset_templates(deleted_branches)
+            ))
+        if orphan_configs:
+            issues.append(Issue(
+                f'{len(orphan_configs)} branch config files in .git are not included by config_workflow',
+                'delete them',
+                lambda: self.delete_files(self.repo.common_dir, orphan_configs)
+            ))
+        if orphan_template_files:
+            issues.append(Issue(
+                f'{len(orphan_template_files)} commit template files have no associated branch',
+                'delete them',
+                lambda: self.delete_files(repo_root_dir, orphan_template_files)
+            ))
+        if missing_tickets:
+            issues.append(Issue(
+                f'{len(missing_tickets)} commit templates have no ticket number recorded',
+                'record ticket numbers from their template files',
+                lambda: self.record_tickets(missing_tickets)
+            ))
+
+    def check_refs(self, issues, remotes=False):
+        """Report on loose, packed and remote-tracking refs.
+
+        :param issues: List to append Issues to
+        :param remotes: (Default: False) If True, check each remote for stale
+            remote-tracking refs
+        """
+        packed_count = sum(1 for _ in self.repo.packed_refs.iter_prefix('refs/'))
+        loose_count = 0
+        refs_dir = os.path.join(self.repo.common_dir, 'refs')
+        for _, _, file_names in os.walk(refs_dir):
+            loose_count += sum(1 for file_name in file_names if not file_name.endswith('.lock'))
+        remote_count = len(self.repo.get_refs('refs/remotes/'))
+        lines = [f'Loose refs: {loose_count}', f'Packed refs: {packed_count}',
+                 f'Remote-tracking refs: {remote_count}']
+        stale_refs = {}
+        if remotes:
+            for remote_name in self.repo.remote_names:
+                stale_refs[remote_name] = self.get_stale_refs(remote_name)
+            lines.append(f'Stale remote-tracking refs: {sum(map(len, stale_refs.values()))}')
+        self.print('Refs:', *lines, '')
+        if loose_count > self.LOOSE_REFS_THRESHOLD:
+            issues.append(Issue(
+                f'{loose_count} refs are loose files, which slows down commands that list refs',
+                'pack them with git pack-refs --all',
+                self.pack_refs
+            ))
+        stale_remotes = [remote_name for remote_name, refs in stale_refs.items() if refs]
+        if stale_remotes:
+            issues.append(Issue(
+                f'{sum(map(len, stale_refs.values()))} remote-tracking refs no longer exist on '
+                f'their remote ({", ".join(stale_remotes)})',
+                'prune them with git remote prune',
+                lambda: self.prune_remotes(stale_remotes)
+            ))
+
+    def print_timings(self, runs):
+        """Time git commands with and without workflow configs and print the
+        results.
+
+        :param runs: Number of times to run each command
+        """
+        local_config_path = os.path.join(self.repo.common_dir, 'config')
+        with_include = self.time_call(
+            lambda: self.repo.git.config(list=True, file=local_config_path, includes=True), runs
+        )
+        without_include = self.time_call(
+            lambda: self.repo.git.config(list=True, file=local_config_path, no_includes=True), runs
+        )
+        status = self.time_call(lambda: self.repo.git.status(porcelain=True), runs)
+        status_without_include = None
+        with tempfile.TemporaryDirectory() as common_dir:
+            try:
+                env = self.create_common_dir_without_include(common_dir)
+            except OSError:
+                # E.g. symlinks aren't permitted
+                env = None
+            if env is not None:
+                status_without_include = self.time_call(
+                    lambda: self.repo.git.status(porcelain=True, env=env), runs
+                )
+        overhead = max(0, with_include - without_include)
+        lines = [
+            f'Timings (best of {runs}):',
+            f'git config --list (local, with includes): {with_include * 1000:.1f}ms',
+            f'git config --list (local, without includes): {without_include * 1000:.1f}ms',
+            f'Workflow include overhead per config read: {overhead * 1000:.1f}ms',
+            f'git status (with workflow include): {status * 1000:.1f}ms',
+        ]
+        if status_without_include is not None:
+            status_overhead = max(0, status - status_without_include)
+            lines += [
+                f'git status (without workflow include): {status_without_include * 1000:.1f}ms',
+                f'Workflow include overhead per git status: {status_overhead * 1000:.1f}ms',
+            ]
+        self.print(*lines, '')
+
+    def create_common_dir_without_include(self, common_dir):
+        """Set up a stand-in for the repo's common git dir whose local config
+        doesn't include config_workflow, so git commands can be timed without
+        the include. Every other file is symlinked to the real one, and the
+        repo's own git dir is still used for per-worktree files (e.g. HEAD
+        and the index).
+
+        :param common_dir: Path of an empty directory to set up
+
+        :return: Dictionary of environment variables that make git use the
+            stand-in (see Git.execute())
+        """
+        for name in os.listdir(self.repo.common_dir):
+            if name != 'config':
+                os.symlink(os.path.join(self.repo.common_dir, name), os.path.join(common_dir, name))
+        config_path = os.path.join(common_dir, 'config')
+        with open(os.path.join(self.repo.common_dir, 'config'), 'rb') as f:
+            config = f.read()
+        with open(config_path, 'wb') as f:
+            f.write(config)
+        try:
+            # Subcommand options have to follow the subcommand
+            self.repo.git.config('--file', config_path, '--unset-all', 'include.path',
+                                 f'^{os.path.basename(get_workflow_config_path(self.repo))}$')
+        except GitCommandError:
+            # Not included
+            pass
+        return {
+            'GIT_DIR': self.repo.git_dir,
+            'GIT_COMMON_DIR': common_dir,
+            'GIT_WORK_TREE': self.repo.working_tree_dir,
+        }
+
+    # Fixes
+
+    def unset_templates(self, branch_names):
+        """Unset commit templates for the specified branches.
+
+        :param branch_names: Names of branches to unset templates for
+        """
+        self.print('Unsetting templates of deleted branches...')
+        unset_template_parsed_args = self.parser.parse_args([UnsetTemplate.command, '--force'])
+        unset_template = UnsetTemplate(self.repo, self.parser,
+                                       parsed_args=unset_template_parsed_args,
+                                       verbosity=0)
+        plan = Plan(self.repo)
+        unset_template.plan_unset_templates(plan, branch_names)
+        plan.execute()
+        self.print_success(f'Unset {len(branch_names)} templates.', '')
+
+    def delete_files(self, directory, filenames):
+        """Delete files from a directory.
+
+        :param directory: Directory containing the files
+        :param filenames: Names of the files to delete
+        """
+        self.print(f'Deleting {len(filenames)} files from {directory}...')
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.exists(path):
+                os.remove(path)
+        self.print_success('Files deleted.', '')
+
+    def record_tickets(self, tickets):
+        """Record ticket numbers in branch metadata.
+
+        :param tickets: Dictionary mapping branch names to ticket numbers
+        """
+        self.print('Recording ticket numbers...')
+        for branch_name, ticket in tickets.items():
+            set_branch_metadata(self.repo, branch_name, 'ticket', ticket)
+        self.print_success(f'Recorded {len(tickets)} ticket numbers.', '')
+
+    def pack_refs(self):
+        self.print('Packing refs...')
+        self.repo.git.pack_refs(all=True, prune=True)
+        self.print_success('Refs packed.', '')
+
+    def prune_remotes(self, remote_names):
+        """Delete stale remote-tracking refs.
+
+        :param remote_names: Names of remotes to prune
+        """
+        for remote_name in remote_names:
+            self.print(f'Pruning {remote_name}...')
+            self.repo.git.remote('prune', remote_name)
+        self.print_success('Remote-tracking refs pruned.', '')
+
+    # Helper Methods
+
+    def get_configured_templates(self):
+        """Read commit template configs directly from workflow config files.
+
+        :return: Dictionary mapping branch names to (config file, template
+            file) tuples. Template file is None if the branch config doesn't
+            exist or doesn't configure one
+        """
+        entries = self.repo.read_cached(get_workflow_config_path(self.repo), parse_config) or []
+        expr = re.compile(r'includeif\.onbranch:(.*)\.path')
+        templates = {}
+        for key, value in entries:
+            match = expr.fullmatch(key)
+            if match is None or not value:
+                continue
+            branch_config_path = os.path.join(self.repo.common_dir, value)
+            template_file = None
+            for config_key, config_value in self.repo.read_cached(branch_config_path, parse_config) or []:
+                if config_key == 'commit.template':
+                    template_file = config_value
+            templates[match.group(1)] = (value, template_file)
+        return templates
+
+    def read_template_ticket(self, template_file):
+        """Find the ticket number in a commit template file.
+
+        :param template_file: Name of the template file (relative to the
+            working tree)
+
+        :return: Ticket number, or None if the file doesn't exist or doesn't
+            contain one
+        """
+        if not template_file:
+            return None
+        template_path = os.path.join(self.repo.working_tree_dir, template_file)
+        try:
+            with open(template_path, encoding='utf-8', errors='replace') as f:
+                template = f.read()
+        except OSError:
+            return None
+        match = re.search(self.configs.TICKET_INPUT_FORMAT_REGEX, template)
+        return match.group(0) if match else None
+
+    def get_stale_refs(self, remote_name):
+        """Get remote-tracking refs that no longer exist on their remote.
+
+        :param remote_name: Name of the remote to check
+
+        :return: List of stale ref names
+        """
+        try:
+            output = self.repo.git.remote('prune', '--dry-run', remote_name)
+        except GitCommandError as e:
+            self.print_warning(f'Unable to check {remote_name}: {e.stderr.strip()}')
+            return []
+        return [
+            line.split(']', 1)[1].strip() for line in output.splitlines()
+            if '[would prune]' in line
+        ]
+
+    @staticmethod
+    def time_call(function, runs):
+        """Returns the best time in seconds of calling function runs times."""
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
@@ -1,6 +1,12 @@
-from git import GitCommandError
+import os
 from cmd_utils import cmd
-from git_workflow.utils.repository import checkout_branch
+from git_workflow.utils.patch_ids import PatchIdCache, is_merged_upstream
+from git_workflow.utils.plan import SKIP, ConfigRemoveSection, DeleteRef, Plan, Step
+from git_workflow.utils.repository import (
+    checkout_branch, fetch_minimal, get_active_branch_name, get_branch_metadata_path,
+    get_branch_remote, get_worktrees, is_ancestor, is_current_worktree, remove_worktree,
+    update_branch
+)
 from .base import WorkflowBase
 from .unset_template import UnsetTemplate
 
@@ -13,14 +19,37 @@ class FinishBranch(WorkflowBase):
     specified. Once confirmed, this command will:
 
     - Unset the commit template of the project branch
-    - Checkout the base branch and pull latest updates
-    - Attempt to delete the project branch using ``git branch -d``, which may
-      fail if the project branch has not been fully merged
+    - If the project branch is checked out in a linked worktree (e.g. one
+      created with ``workflow start --worktree``), remove the worktree
+    - Checkout the base branch and pull latest updates. If ``--in-place`` is
+      specified (or ``workflow.updateBaseInPlace`` is ``true``), the base
+      branch is fast-forwarded without being checked out instead, and is only
+      checked out if the project branch is the current branch
+    - Attempt to delete the project branch (and its config) if it is merged
+      into the base branch or ``HEAD``, as ``git branch -d`` would. If the
+      project branch was squash-merged or rebase-merged, its patch IDs are
+      compared against the base branch instead. If all of its changes exist in
+      the base branch, it is deleted
+
+    If ``--ci`` is specified (or ``workflow.ciMode`` is ``true``), only the tip
+    of the base branch is fetched (deepening shallow clones just enough to
+    check if the branches were merged). Branches are checked against the
+    remote-tracking branch, without updating the local base branch or
+    comparing patch IDs. If the current branch is being finished, the
+    remote-tracking branch is checked out (detached) instead of the base
+    branch.
+
+    Multiple branches can be finished at once. If no branch is specified and
+    this command is run in a terminal, branches can be picked interactively
+    (see ``workflow.branchPicker``).
+
+    With ``--dry-run``, these steps are printed instead of being run.
     """
 
     command = 'finish'
     description = 'Finish a project branch.'
-    configs_used = ['baseBranch', 'finishBranchConfirmationPrompt']
+    configs_used = ['baseBranch', 'updateBaseInPlace', 'fetchMaxAge', 'mirrorPath', 'mirrorMaxAge',
+                    'ciMode', 'finishBranchConfirmationPrompt', 'branchPicker']
 
     @classmethod
     def add_subparser(cls, subparsers, generic_parent_parser):
@@ -31,9 +60,29 @@ class FinishBranch(WorkflowBase):
             'Positional Arguments'
         )
         positional_args.add_argument(
-            'branch', metavar='<branch>', nargs='?',
-            help='Branch to finish (default: current)',
-            default=None
+            'branches', metavar='<branch>', nargs='*',
+            help='Branches to finish (default: pick interactively, or current)'
+        )
+        # Base branch
+        base_branch_args = finish_subparser.add_argument_group(
+            'Base Branch Arguments'
+        )
+        in_place_group = base_branch_args.add_mutually_exclusive_group()
+        in_place_group.add_argument(
+            '-I', '--in-place', help='Fast-forward base branch without checking it out (overrides workflow.updateBaseInPlace)',
+            dest='in_place', action='store_true', default=None
+        )
+        in_place_group.add_argument(
+            '--checkout-base', help='Checkout and pull base branch before deleting (overrides workflow.updateBaseInPlace)',
+            dest='in_place', action='store_false', default=None
+        )
+        base_branch_args.add_argument(
+            '--refresh', help='Fetch changes to base branch from the remote even if recently fetched (overrides workflow.fetchMaxAge and workflow.mirrorPath)',
+            action='store_true', default=False
+        )
+        base_branch_args.add_argument(
+            '--ci', help='Only fetch the tip of the base branch, e.g. in a shallow or partial clone (overrides workflow.ciMode)',
+            action='store_true', default=None
         )
         # Confirmation prompt
         confirmation_args = finish_subparser.add_argument_group(
@@ -49,43 +98,184 @@ class FinishBranch(WorkflowBase):
             '-c', '--confirmation', help='Prompt for confirmation before deleting',
             dest='confirm', action='store_true', default=None
         )
+        cls._add_dry_run_argument(finish_subparser)
 
     def get_args(self):
         args = {}
-        args['branch'] = (self.parsed_args.branch
-                          if self.parsed_args.branch is not None else
-                          self.repo.active_branch.name)
-        # Default to config value unless otherwise specified
+        args['branches'] = self.get_branches_arg('Branches to finish',
+                                                 exclude=[self.configs.BASE_BRANCH])
+        args['max_age'] = 0 if self.parsed_args.refresh else self.configs.FETCH_MAX_AGE
+        args['mirror'] = None if self.parsed_args.refresh else self.get_mirror()
+        # Default to config values unless otherwise specified
+        args['in_place'] = (self.configs.UPDATE_BASE_IN_PLACE
+                            if self.parsed_args.in_place is None else
+                            self.parsed_args.in_place)
         args['confirm'] = (self.configs.FINISH_BRANCH_CONFIRMATION_PROMPT
                            if self.parsed_args.confirm is None else
                            self.parsed_args.confirm)
+        args['ci'] = self.parsed_args.ci or self.configs.CI_MODE
+        args['dry_run'] = self.parsed_args.dry_run
         return args
 
     def run(self):
         args = self.get_args()
-        branch = args['branch']
+        branches = args['branches']
+        if not branches:
+            return
+        base_branch = self.configs.BASE_BRANCH
+        worktrees = get_worktrees(self.repo)
+        shas = {}
+        for branch in branches:
+            shas[branch] = self.repo.read_ref(f'refs/heads/{branch}')
+            if shas[branch] is None:
+                raise Exception(f'Branch {branch} not found.')
+            if branch == base_branch:
+                raise Exception(f'{branch} is the base branch and can\'t be finished.')
+            worktree_path = worktrees.get(branch)
+            if (worktree_path is not None and is_current_worktree(self.repo, worktree_path)
+                    and self.repo.git_dir != self.repo.common_dir):
+                raise Exception(f'{branch} is checked out in the current linked worktree. '
+                                'Run this command from a different worktree so this one can be removed.')
         # Confirmation prompt
-        if args['confirm']:
+        if args['confirm'] and not args['dry_run']:
             confirmation = cmd.prompt(
                 'Delete Branch? (y/n)',
-                f'Delete branch {branch}?',
+                f'Delete branch {", ".join(branches)}?',
                 default_val='n', validate_function=cmd.validate_yn
             )
             if not confirmation:
                 return
-        # Unset template
-        unset_template_parsed_args = self.parser.parse_args([UnsetTemplate.command, branch, '--force'])
+        plan = Plan(self.repo)
+        # Unset templates
+        unset_template_parsed_args = self.parser.parse_args([UnsetTemplate.command, '--force'])
         unset_template = UnsetTemplate(self.repo, self.parser,
                                        parsed_args=unset_template_parsed_args,
                                        verbosity=self.verbosity)
-        unset_template.run()
-        # Checkout base_branch
-        base_branch = self.configs.BASE_BRANCH
-        base_head = checkout_branch(self.repo, base_branch)
-        # Finish branch
-        self.print(f'Attempting to delete {branch}...')
-        try:
-            self.repo.git.branch('-d', branch)
+        unset_template.plan_unset_templates(plan, branches)
+        # Remove linked worktrees
+        for branch in branches:
+            worktree_path = worktrees.get(branch)
+            if worktree_path is not None and not is_current_worktree(self.repo, worktree_path):
+                plan.add(Step(f'Remove worktree {worktree_path}',
+                              lambda worktree_path=worktree_path: self.remove_branch_worktree(worktree_path)))
+        # Update base_branch. In CI mode, branches are checked against the
+        # remote-tracking branch instead
+        merged_into = base_branch
+        tracking_info = get_branch_remote(self.repo, base_branch) if args['ci'] else None
+        if tracking_info is not None and tracking_info.remote_name != '.':
+            merged_into = tracking_info.ref
+            update_description = f'Fetch {tracking_info.merge_ref} from {tracking_info.remote_name}'
+            if get_active_branch_name(self.repo) in branches:
+                update_description += f', then check out {merged_into}'
+        elif not args['in_place']:
+            update_description = f'Check out {base_branch} and pull updates'
+        elif get_active_branch_name(self.repo) in branches:
+            update_description = f'Fetch and fast-forward {base_branch}, then check it out'
+        else:
+            update_description = f'Fetch and fast-forward {base_branch}'
+        plan.add(Step(update_description,
+                      lambda: self.update_base_branch(branches, base_branch, args, tracking_info)))
+        # Finish branches
+        deleted_branches = []
+        for branch in branches:
+            plan.add(
+                Step(f'If {branch} is merged into {merged_into}:',
+                     lambda branch=branch: self.check_merged(branch, merged_into, deleted_branches,
+                                                             patch_id=not args['ci'])),
+                DeleteRef(f'refs/heads/{branch}', shas[branch]),
+                ConfigRemoveSection(os.path.join(self.repo.common_dir, 'config'), f'branch.{branch}'),
+                ConfigRemoveSection(get_branch_metadata_path(self.repo), f'branch.{branch}'),
+            )
+        if not self.run_plan(plan, dry_run=args['dry_run']) or not deleted_branches:
+            return
+        if len(deleted_branches) == 1:
             self.print_success('Deletion successful.')
-        except GitCommandError:
-            self.print_warning(f'Unable to delete {branch}. You will need to delete it manually.')
+        else:
+            self.print_success(f'Deleted {len(deleted_branches)} branches:', *deleted_branches)
+
+    # Helper Methods
+
+    def remove_branch_worktree(self, worktree_path):
+        """Remove the linked worktree a branch is checked out in. If it can't
+        be removed, the branch won't be deleted either (see check_merged()).
+
+        :param worktree_path: Path of the worktree
+        """
+        self.print(f'Removing worktree {worktree_path}...')
+        if not remove_worktree(self.repo, worktree_path):
+            self.print_warning(f'Unable to remove worktree {worktree_path}. It may have uncommitted changes.')
+            return
+        self.print_success('Worktree removed.', '')
+
+    def update_base_branch(self, branches, base_branch, args, tracking_info=None):
+        """Update the base branch, and make sure none of the branches being
+        finished are checked out.
+
+        :param branches: Names of the branches being finished
+        :param base_branch: Name of the base branch
+        :param args: get_args() result
+        :param tracking_info: (Optional) In CI mode, the remote branch to
+            fetch instead of updating the base branch
+        """
+        if tracking_info is not None and tracking_info.remote_name != '.':
+            self.fetch_base_branch(branches, tracking_info)
+            if get_active_branch_name(self.repo) in branches:
+                self.print(f'Checking out {tracking_info.ref}.')
+                self.repo.git.checkout(tracking_info.ref, detach=True)
+        elif args['in_place']:
+            update_branch(self.repo, base_branch, max_age=args['max_age'], mirror=args['mirror'])
+            # Only need to leave the branch if it's checked out
+            if get_active_branch_name(self.repo) in branches:
+                self.print(f'Checking out {base_branch}.')
+                self.repo.git.checkout(base_branch)
+        else:
+            checkout_branch(self.repo, base_branch, max_age=args['max_age'], mirror=args['mirror'])
+
+    def fetch_base_branch(self, branches, tracking_info):
+        """Fetch only the tip of the base branch (for CI mode). Shallow
+        clones are deepened back to the oldest tip of the branches being
+        finished, which is as far as checking if they're merged needs.
+
+        :param branches: Names of the branches being finished
+        :param tracking_info: TrackingInfo of the remote base branch
+        """
+        # Committer timestamps of the branch tips
+        timestamps = self.repo.git.show(
+            '-s', '--format=%ct', *[f'refs/heads/{branch}' for branch in branches]
+        ).split()
+        # Allow for clock skew between committers
+        shallow_since = min(int(timestamp) for timestamp in timestamps) - 24 * 60 * 60
+        self.print(f'Fetching {tracking_info.merge_ref} from {tracking_info.remote_name}...')
+        sha = fetch_minimal(self.repo, tracking_info.remote_name, tracking_info.merge_ref,
+                            tracking_info.ref, shallow_since=shallow_since)
+        self.print(f'{tracking_info.ref} is at {sha}', '')
+
+    def check_merged(self, branch, base_branch, deleted_branches, patch_id=True):
+        """Check if a branch can be deleted safely, i.e. it's merged into the
+        base branch or HEAD (as ``git branch -d`` would), or all of its
+        changes exist in the base branch (squash-merged or rebase-merged).
+
+        :param branch: Name of the branch being finished
+        :param base_branch: Name of the base branch
+        :param deleted_branches: List to append the branch to if it can be
+            deleted
+        :param patch_id: (Default: True) If False, skip checking for
+            squash-merges and rebase-merges
+
+        :return: SKIP if the branch can't be deleted
+        """
+        self.print(f'Attempting to delete {branch}...')
+        worktree_path = get_worktrees(self.repo).get(branch)
+        if worktree_path is not None:
+            self.print_warning(f'Unable to delete {branch}: it is checked out in {worktree_path}.')
+            return SKIP
+        if is_ancestor(self.repo, branch, base_branch) or is_ancestor(self.repo, branch, 'HEAD'):
+            deleted_branches.append(branch)
+            return
+        # Check for squash-merges and rebase-merges
+        if patch_id and is_merged_upstream(self.repo, branch, base_branch, PatchIdCache(self.repo)):
+            self.print(f'All changes in {branch} exist in {base_branch} (squash-merged or rebase-merged).')
+            deleted_branches.append(branch)
+            return
+        self.print_warning(f'Unable to delete {branch}. You will need to delete it manually.')
+        return SKIP
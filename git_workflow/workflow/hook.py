@@ -0,0 +1,67 @@
+from git_workflow.utils import hooks
+from .base import WorkflowBase
+
+
+class Hook(WorkflowBase):
+    """\
+    Run or install git hooks that enforce workflow conventions.
+
+    The ``commit-msg`` hook rejects commits on branches with a ticket number
+    (set via ``workflow start -t`` or ``workflow set-template``) unless the
+    message starts with the prefix from ``workflow.commitTemplateFormat``,
+    where ``{ticket}`` can be anything matching
+    ``workflow.ticketInputFormatRegex``. Merge, revert, fixup and squash
+    commits are allowed. To install it in the current repo:
+
+    ::
+
+        workflow hook --install
+
+    The installed hook caches the patterns it checks against and only reloads
+    configs when a config file changes, so it doesn't noticeably slow down
+    commits.
+    """
+
+    command = 'hook'
+    description = 'Run or install workflow git hooks.'
+    configs_used = ['commitTemplateFormat', 'ticketInputFormatRegex', 'initials']
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        hook_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        positional_args = hook_subparser.add_argument_group(
+            'Positional Arguments'
+        )
+        positional_args.add_argument(
+            'hook', metavar='<hook>', nargs='?', choices=hooks.HOOKS, default='commit-msg',
+            help=f'Hook to run or install (choices: {", ".join(hooks.HOOKS)}; default: commit-msg)'
+        )
+        positional_args.add_argument(
+            'hook_args', metavar='<args>', nargs='*',
+            help='Arguments passed to the hook by git (e.g. the commit message file)'
+        )
+        install_args = hook_subparser.add_argument_group(
+            'Install Arguments'
+        )
+        install_args.add_argument(
+            '--install', help='Install the hook in the repo instead of running it',
+            action='store_true', default=False
+        )
+        install_args.add_argument(
+            '-f', '--force', help='With --install, replace an existing hook',
+            action='store_true', default=False
+        )
+
+    def run(self):
+        hook = self.parsed_args.hook
+        if self.parsed_args.install:
+            hook_path = hooks.install_hook(self.repo, hook, force=self.parsed_args.force)
+            self.print_success(f'Installed {hook} hook at {hook_path}')
+            return
+        if not self.parsed_args.hook_args:
+            raise Exception(f'Usage: workflow hook {hook} <commit message file>')
+        with open(self.parsed_args.hook_args[0], encoding='utf-8', errors='replace') as f:
+            message = f.read()
+        error = hooks.check_commit_msg(self.repo, message)
+        if error is not None:
+            raise Exception(error)
@@ -0,0 +1,260 @@
+from collections import namedtuple
+from git_workflow.utils import branches, repository
+from .base import WorkflowBase
+
+#: Details about a workflow branch. Stored as a tuple to keep memory usage low
+#: when listing a large number of branches
+BranchInfo = namedtuple('BranchInfo', [
+    'name', 'client', 'description', 'date', 'initials', 'ticket',
+    'template', 'merged', 'track',
+])
+
+
+class ListBranches(WorkflowBase):
+    """\
+    List workflow branches.
+
+    Shows every branch that follows the ``workflow start`` naming scheme (or
+    has a commit template configured) along with its ticket number, client,
+    date, initials, and whether it has a commit template configured. With
+    ``--merged`` or ``--no-merged``, whether it has been merged into the base
+    branch is shown as well (if the base branch doesn't exist, merged status
+    is unknown and a warning is shown instead).
+
+    Branches are read from a single streamed ``git for-each-ref`` pass and
+    joined with workflow configs in memory, so this stays fast in repos with a
+    large number of branches. Results can be filtered and sorted with the
+    arguments below.
+
+    ``--older-than`` compares the ``<yyyymmdd>`` date in branch names against
+    the cutoff without reading any commits. Branches that have a commit
+    template but don't follow the naming scheme are dated by the committer
+    date of their tip instead, which is looked up for all of them in a single
+    git command.
+    """
+
+    command = 'list'
+    description = 'List workflow branches.'
+    configs_used = ['baseBranch']
+
+    #: Possible values for --sort
+    SORT_KEYS = ['name', 'date', 'client', 'ticket']
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        list_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        # Filters
+        filter_args = list_subparser.add_argument_group(
+            'Filter Arguments'
+        )
+        filter_args.add_argument(
+            '-c', '--client', metavar='<client>', help='Only list branches for this client'
+        )
+        filter_args.add_argument(
+            '-t', '--ticket', metavar='<ticket#>', help='Only list branches for this ticket number'
+        )
+        filter_args.add_argument(
+            '-i', '--initials', metavar='<initials>', help='Only list branches with these initials'
+        )
+        filter_args.add_argument(
+            '-T', '--templates-only', help='Only list branches with a commit template configured',
+            action='store_true', default=False
+        )
+        merged_group = filter_args.add_mutually_exclusive_group()
+        merged_group.add_argument(
+            '-m', '--merged', help='Only list branches merged into the base branch',
+            dest='merged', action='store_true', default=None
+        )
+        merged_group.add_argument(
+            '-M', '--no-merged', help='Only list branches not merged into the base branch',
+            dest='merged', action='store_false', default=None
+        )
+        cls._add_older_than_argument(
+            filter_args, 'Only list branches older than this, e.g. 90d, 12w, 6m or 1y'
+        )
+        filter_args.add_argument(
+            '-b', '--base-branch', metavar='<branch>',
+            help='Branch to check for merged branches against (default: workflow.baseBranch)'
+        )
+        # Output
+        output_args = list_subparser.add_argument_group(
+            'Output Arguments'
+        )
+        output_args.add_argument(
+            '-s', '--sort', choices=cls.SORT_KEYS, default='name',
+            help='Field to sort branches by (default: name)'
+        )
+        output_args.add_argument(
+            '-r', '--reverse', help='Reverse sort order',
+            action='store_true', default=False
+        )
+        output_args.add_argument(
+            '-a', '--ahead-behind', help='Show ahead/behind counts relative to upstream branches (slower)',
+            action='store_true', default=False
+        )
+
+    def get_args(self):
+        """Parse command line arguments.
+
+        :return: A dictionary with the following keys:
+            client, ticket, initials, templates_only, merged, older_than,
+            base_branch, sort, reverse, ahead_behind. older_than is a cutoff
+            date in ``yyyymmdd`` format (or None)
+        """
+        args = {}
+        args['client'] = self.parsed_args.client
+        args['ticket'] = self.parsed_args.ticket
+        args['initials'] = self.parsed_args.initials
+        args['templates_only'] = self.parsed_args.templates_only
+        args['merged'] = self.parsed_args.merged
+        args['older_than'] = (None if self.parsed_args.older_than is None else
+                              branches.get_cutoff_date(self.parsed_args.older_than))
+        args['base_branch'] = self.parsed_args.base_branch or self.configs.BASE_BRANCH
+        args['sort'] = self.parsed_args.sort
+        args['reverse'] = self.parsed_args.reverse
+        args['ahead_behind'] = self.parsed_args.ahead_behind
+        return args
+
+    def run(self):
+        args = self.get_args()
+        # Only check merged status if it's filtered on, since the base branch
+        # may not exist (e.g. in a repo that uses a different default branch)
+        merged_base = None
+        if args['merged'] is not None:
+            if self.base_exists(args['base_branch']):
+                merged_base = args['base_branch']
+            else:
+                self.print_warning(f'Base branch {args["base_branch"]} not found, merged status is unknown.',
+                                   '')
+        branch_infos = filter(
+            lambda branch_info: self.matches_filters(branch_info, args),
+            self.iter_branch_infos(merged_base,
+                                   ahead_behind=args['ahead_behind'],
+                                   commit_dates=args['older_than'] is not None)
+        )
+        # for-each-ref output is already sorted by name, so only collect
+        # results in memory if a different order was requested
+        if args['sort'] != 'name' or args['reverse']:
+            branch_infos = sorted(
+                branch_infos,
+                key=lambda branch_info: getattr(branch_info, args['sort']) or '',
+                reverse=args['reverse']
+            )
+        count = 0
+        for branch_info in branch_infos:
+            self.print(self.format_branch_info(branch_info))
+            count += 1
+        if not count:
+            self.print('No matching branches found.')
+
+    # Helper Methods
+
+    def iter_branch_infos(self, base_branch, ahead_behind=False, commit_dates=False):
+        """Stream details about all workflow branches.
+
+        :param base_branch: Branch to check for merged branches against. If
+            None, merged status isn't checked (and is None)
+        :param ahead_behind: (Default: False) If True, include ahead/behind
+            counts relative to upstream branches
+        :param commit_dates: (Default: False) If True, branches that don't
+            follow the naming scheme are dated by the committer date of their
+            tip (otherwise their date is None)
+
+        :return: Generator that yields a BranchInfo for each workflow branch
+        """
+        templates = repository.get_branch_config_files(self.repo)
+        unstamped_dates = {}
+        if commit_dates:
+            unstamped_dates = repository.get_branch_dates(self.repo, {
+                branch_name: sha for branch_name, sha in repository.get_branches(self.repo).items()
+                if branch_name in templates and not branches.is_workflow_branch(branch_name)
+            })
+        metadata = repository.get_all_branch_metadata(self.repo)
+        merged = None
+        if base_branch is not None:
+            merged = {
+                fields[0] for fields in
+                repository.iter_refs(self.repo, ['%(refname:short)'], merged=base_branch)
+            }
+        fields = ['%(refname:short)']
+        if ahead_behind:
+            fields.append('%(upstream:track,nobracket)')
+        for ref_fields in repository.iter_refs(self.repo, fields):
+            branch_name = ref_fields[0]
+            branch_metadata = metadata.get(branch_name, {})
+            branch_name_parts = branches.parse_branch_name(
+                branch_name, client=branch_metadata.get('client')
+            )
+            has_template = branch_name in templates
+            if branch_name_parts is None:
+                # Skip branches that have nothing to do with workflow
+                if not has_template:
+                    continue
+                branch_name_parts = branches.BranchName(
+                    None, None, unstamped_dates.get(branch_name), None
+                )
+            yield BranchInfo(
+                branch_name, *branch_name_parts,
+                ticket=branch_metadata.get('ticket'),
+                template=has_template,
+                merged=None if merged is None else branch_name in merged,
+                track=ref_fields[1] if ahead_behind else None,
+            )
+
+    def base_exists(self, base_branch):
+        """Returns True if base_branch is an existing branch (or full ref
+        name)."""
+        return any(
+            self.repo.ref_exists(ref)
+            for ref in [f'refs/heads/{base_branch}', f'refs/remotes/{base_branch}', base_branch]
+        )
+
+    @staticmethod
+    def matches_filters(branch_info, args):
+        """Returns True if branch_info passes all filters in args.
+
+        :param branch_info: BranchInfo to check
+        :param args: get_args() result
+        """
+        if args['client'] is not None and branch_info.client != args['client']:
+            return False
+        if args['ticket'] is not None and (branch_info.ticket or '').upper() != args['ticket'].upper():
+            return False
+        if args['initials'] is not None and branch_info.initials != args['initials']:
+            return False
+        if args['templates_only'] and not branch_info.template:
+            return False
+        if args['merged'] is not None and branch_info.merged != args['merged']:
+            return False
+        if args['older_than'] is not None and not (branch_info.date and branch_info.date < args['older_than']):
+            return False
+        return True
+
+    @staticmethod
+    def format_branch_info(branch_info):
+        """Format a BranchInfo as a line of output.
+
+        :param branch_info: BranchInfo to format
+
+        :return: Formatted string
+        """
+        details = []
+        if branch_info.ticket:
+            details.append(branch_info.ticket)
+        if branch_info.client:
+            details.append(f'client: {branch_info.client}')
+        if branch_info.date:
+            date = branch_info.date
+            details.append(f'{date[:4]}-{date[4:6]}-{date[6:]}')
+        if branch_info.initials:
+            details.append(branch_info.initials)
+        if branch_info.template:
+            details.append('template')
+        if branch_info.merged:
+            details.append('merged')
+        if branch_info.track:
+            details.append(branch_info.track)
+        line = branch_info.name
+        if details:
+            line += f'  ({", ".join(details)})'
+        return line
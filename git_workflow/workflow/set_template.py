@@ -1,6 +1,8 @@
 import os
 from cmd_utils import cmd
 from git_workflow.utils import files
+from git_workflow.utils.plan import ConfigSet, Plan, RegisterTicket, WriteFile
+from git_workflow.utils.repository import get_branch_metadata_path
 from .base import WorkflowBase
 
 
@@ -35,6 +37,7 @@ class SetTemplate(WorkflowBase):
         'ticketFormatCapitalize',
         'ticketInputFormatRegex',
         'initials',
+        'ticketRegistryPath',
     ]
 
     @classmethod
@@ -47,6 +50,7 @@ class SetTemplate(WorkflowBase):
             'ticket', metavar='<ticket>', nargs='?', help='Ticket number to use in commit template',
             default=None
         )
+        cls._add_dry_run_argument(commit_template_subparser)
 
     def get_args(self):
         """Parse command line arguments and prompt for any missing values.
@@ -56,15 +60,12 @@ class SetTemplate(WorkflowBase):
         """
         args = {}
 
-        validate_ticket_number = cmd.generate_validate_regex_function(
-            self.configs.TICKET_INPUT_FORMAT_REGEX
-        )
         ticket = cmd.prompt(
             'Ticket Number',
             'Enter ticket number to use in commit messages.',
             invalid_msg='Invalid ticket number formatting.',
             initial_input=self.parsed_args.ticket,
-            validate_function=validate_ticket_number,
+            validate_function=self.get_validate_ticket_function(),
             format_function=self.format_ticket_number,
         )
         args['ticket'] = ticket
@@ -73,42 +74,71 @@ class SetTemplate(WorkflowBase):
 
     def run(self):
         args = self.get_args()
-        repo_root_dir = os.path.dirname(self.repo.git_dir)
-        branch_name = self.repo.active_branch.name
-        # Create commit template
-        format_kwargs = self.get_format_kwargs(args, branch_name)
-        # NOTE: filenames will always begin with '.gitmessage_local_'
-        commit_template_file = files.sanitize_filename(
-            '.gitmessage_local_' + self.configs.COMMIT_TEMPLATE_FILENAME_FORMAT.format(**format_kwargs)
-        )
-        commit_template_path = os.path.join(repo_root_dir, commit_template_file)
-        self.print('Creating commit template file...')
-        commit_template_body = self.configs.COMMIT_TEMPLATE_FORMAT.format(**format_kwargs)
-        with open(commit_template_path, 'w') as f:
-            f.write(commit_template_body)
-        if not os.path.exists(commit_template_path):
-            raise Exception('Unable to create commit template at path ' + commit_template_path)
+        branch_name = self.repo.active_branch_name
+        plan = Plan(self.repo)
+        commit_template_path, branch_config_file = self.plan_set_template(plan, branch_name, args)
+        if not self.run_plan(plan, dry_run=self.parsed_args.dry_run):
+            return
         self.print_success('Template file created.', commit_template_path, '')
-        # Configure commit template
-        # TODO REPHRASE OUTPUT. Current output would be fine for --verbose but is too much otherwise
-        branch_config_file = files.sanitize_filename(f'config_{branch_name}')
-        branch_config_path = os.path.join(self.repo.git_dir, branch_config_file)
-        # Branch config
-        self.print(f'Configuring commit.template for branch {branch_name}...')
-        self.repo.git.config('commit.template', commit_template_file,
-                             file=branch_config_path)
         self.print_success(f'commit.template configured in .git/{branch_config_file}.', '')
-        # Add includeIf for branch config to local config
-        self.print('Configuring local repo...')
-        self.repo.git.config(f'includeIf.onbranch:{branch_name}.path', branch_config_file,
-                             file=self.configs.CONFIG_PATH)
         self.print_success('Local repo configured.',
                            f'Will include branch config .git/{branch_config_file}',
                            f'when branch {branch_name} is checked out.',
                            '')
 
+    def plan_set_template(self, plan, branch_name, args):
+        """Add operations that create and configure a branch's commit template
+        to a plan: the template file, commit.template in the branch config,
+        the branch config include in config_workflow, and the ticket number in
+        branch metadata and the ticket registry.
+
+        :param plan: Plan to add operations to
+        :param branch_name: Name of the branch
+        :param args: get_args() result
+
+        :return: Tuple of (commit template path, branch config filename)
+        """
+        format_kwargs = self.get_format_kwargs(args, branch_name)
+        commit_template_file = self.get_commit_template_file(format_kwargs)
+        commit_template_path = os.path.join(self.repo.working_tree_dir, commit_template_file)
+        commit_template_body = self.configs.COMMIT_TEMPLATE_FORMAT.format(**format_kwargs)
+        branch_config_file = files.sanitize_filename(f'config_{branch_name}')
+        plan.add(
+            WriteFile(commit_template_path, commit_template_body),
+            ConfigSet(os.path.join(self.repo.common_dir, branch_config_file),
+                      'commit.template', commit_template_file),
+            ConfigSet(self.configs.CONFIG_PATH,
+                      f'includeIf.onbranch:{branch_name}.path', branch_config_file),
+            ConfigSet(get_branch_metadata_path(self.repo),
+                      f'branch.{branch_name}.ticket', args['ticket']),
+        )
+        if self.configs.TICKET_REGISTRY_PATH:
+            plan.add(RegisterTicket(self.configs.TICKET_REGISTRY_PATH, args['ticket'],
+                                    branch_name, commit_template_path))
+        return commit_template_path, branch_config_file
+
     # Helper Methods
 
+    def get_validate_ticket_function(self):
+        """Returns a function that validates a ticket number against
+        workflow.ticketInputFormatRegex (for cmd.prompt())."""
+        return cmd.generate_validate_regex_function(self.configs.TICKET_INPUT_FORMAT_REGEX)
+
+    def get_commit_template_file(self, format_kwargs):
+        """Get the (sanitized) filename of a commit template.
+
+        :param format_kwargs: get_format_kwargs() result
+
+        :return: Filename, relative to the root of the working tree
+
+        :raises KeyError: If workflow.commitTemplateFilenameFormat has an
+            unknown placeholder
+        """
+        # NOTE: filenames will always begin with '.gitmessage_local_'
+        return files.sanitize_filename(
+            '.gitmessage_local_' + self.configs.COMMIT_TEMPLATE_FILENAME_FORMAT.format(**format_kwargs)
+        )
+
     def format_ticket_number(self, val):
         """Format ticket number input based on configs.
 
@@ -1,7 +1,16 @@
 import datetime
+import os
 import re
 from cmd_utils import cmd
-from git_workflow.utils.repository import checkout_branch, fetch_tags
+from git_workflow.utils.completion import (
+    client_completer, complete_client, complete_description, description_completer, load_trie,
+    prompt_completion
+)
+from git_workflow.utils.git_repo import Repo
+from git_workflow.utils.repository import (
+    checkout_branch, fetch_minimal, fetch_tags, get_branch_remote, get_main_worktree_path,
+    set_branch_metadata, update_branch
+)
 from .base import WorkflowBase
 from .set_template import SetTemplate
 
@@ -22,12 +31,46 @@ class StartBranch(WorkflowBase):
     - ``<initials>`` - Engineer's initials
 
     Script will prompt for details and format appropriately (i.e. no
-    spaces/underscores, all lowercase).
+    spaces/underscores, all lowercase). Clients and descriptions can be
+    completed with Tab, both in the prompts and in ``--client`` and
+    ``--description`` (with argcomplete), from the names of existing local and
+    remote branches, one hyphen-separated segment at a time.
+
+    If ``--worktree`` is specified, the new branch is created in a new linked
+    worktree (see ``git worktree``) instead of the current one. The base
+    branch is fast-forwarded without being checked out, so the current
+    working tree is left untouched. The worktree path can be specified as an
+    argument or configured with ``workflow.worktreePath``.
+
+    If ``--in-place`` is specified (or ``workflow.updateBaseInPlace`` is
+    ``true``), the base branch is fast-forwarded without being checked out and
+    the new branch is created from it with a single checkout.
+
+    If ``--ci`` is specified (or ``workflow.ciMode`` is ``true``), only the tip
+    of the base branch (or the tag passed to ``--base-release``) is fetched,
+    and the new branch is created from the remote-tracking branch without
+    updating the local base branch. This works in shallow and partial clones
+    without deepening them (see ``workflow.ciMode``).
+
+    Before anything is fetched or checked out, the new branch is validated
+    without changing the repo: its name against
+    ``workflow.badBranchNamePatterns``, that it (and its worktree) doesn't exist
+    yet, that the base branch or tag exists, that there are no uncommitted
+    changes in the working tree it will be created in, and that the ticket
+    number and the commit template's filename and body can be formatted. All
+    problems found are reported at once, so a bad ticket number no longer
+    leaves a half set up branch behind.
     """
 
     command = 'start'
     description = 'Create a new branch.'
-    configs_used = ['initials', 'baseBranch', 'badBranchNamePatterns']
+    #: Trie of existing branch names used for completion, loaded on first use
+    _completion_trie = None
+
+    configs_used = ['initials', 'baseBranch', 'updateBaseInPlace', 'badBranchNamePatterns',
+                    'fetchMaxAge', 'fetchJobs', 'mirrorPath', 'mirrorMaxAge', 'ciMode', 'worktreePath',
+                    'ticketInputFormatRegex', 'ticketFormatCapitalize', 'commitTemplateFilenameFormat',
+                    'commitTemplateFormat']
 
     @classmethod
     def add_subparser(cls, subparsers, generic_parent_parser):
@@ -39,14 +82,14 @@ class StartBranch(WorkflowBase):
         client_group = branch_name_args.add_mutually_exclusive_group()
         client_group.add_argument(
             '-c', '--client', metavar='<client>', help='Specify client name'
-        )
+        ).completer = client_completer
         client_group.add_argument(
             '-C', '--no-client', help='No client name (skips prompt)',
             action='store_true', default=False
         )
         branch_name_args.add_argument(
             '-d', '--description', metavar='<description>', help='Specify branch description'
-        )
+        ).completer = description_completer
         branch_name_args.add_argument(
             '-i', '--initials', metavar='<initials>', help='Specify developer initials'
         )
@@ -85,24 +128,47 @@ class StartBranch(WorkflowBase):
             '-P', '--no-pull', help='Skip pulling changes to base branch',
             action='store_true', default=False
         )
+        branching_args.add_argument(
+            '--refresh', help='Fetch changes to base branch from the remote even if recently fetched (overrides workflow.fetchMaxAge and workflow.mirrorPath)',
+            action='store_true', default=False
+        )
+        in_place_group = branching_args.add_mutually_exclusive_group()
+        in_place_group.add_argument(
+            '-I', '--in-place', help='Fast-forward base branch without checking it out (overrides workflow.updateBaseInPlace)',
+            dest='in_place', action='store_true', default=None
+        )
+        in_place_group.add_argument(
+            '--checkout-base', help='Checkout and pull base branch before branching (overrides workflow.updateBaseInPlace)',
+            dest='in_place', action='store_false', default=None
+        )
+        branching_args.add_argument(
+            '-w', '--worktree', metavar='<path>', nargs='?', const='', default=None,
+            help='Create branch in a new worktree (default path: workflow.worktreePath)'
+        )
+        branching_args.add_argument(
+            '--ci', help='Only fetch the commit to branch from, e.g. in a shallow or partial clone (overrides workflow.ciMode)',
+            action='store_true', default=None
+        )
 
     def get_args(self):
         """Parse command line arguments and prompt for any missing values.
 
         :return: A dictionary with the following keys:
             client, description, initials, ticket, timestamp, base_branch,
+            base_release, no_pull, max_age, mirror, in_place, worktree, ci,
             skip_bad_name_check
         """
         args = {}
         client = None
         if not self.parsed_args.no_client:
-            client = cmd.prompt(
-                'Client',
-                '(Optional) Enter the name of the affected client.',
-                initial_input=self.parsed_args.client,
-                validate_function=cmd.validate_optional_prompt,
-                format_function=self.format_branch_name,
-            )
+            with prompt_completion(lambda text: complete_client(self.get_completion_trie(), text)):
+                client = cmd.prompt(
+                    'Client',
+                    '(Optional) Enter the name of the affected client.',
+                    initial_input=self.parsed_args.client,
+                    validate_function=cmd.validate_optional_prompt,
+                    format_function=self.format_branch_name,
+                )
         # Append hyphen if client is not empty
         if client:
             client += '-'
@@ -110,13 +176,16 @@ class StartBranch(WorkflowBase):
             client = ''
         args['client'] = client
 
-        description = cmd.prompt(
-            'Description',
-            'Enter a brief description for the branch.',
-            invalid_msg='Description must not be blank.',
-            initial_input=self.parsed_args.description,
-            format_function=self.format_branch_name,
-        )
+        client = client.rstrip('-')
+        with prompt_completion(lambda text: complete_description(self.get_completion_trie(), text,
+                                                                 client=client)):
+            description = cmd.prompt(
+                'Description',
+                'Enter a brief description for the branch.',
+                invalid_msg='Description must not be blank.',
+                initial_input=self.parsed_args.description,
+                format_function=self.format_branch_name,
+            )
         description += '-'
         args['description'] = description
 
@@ -145,13 +214,26 @@ class StartBranch(WorkflowBase):
 
         base_branch = self.parsed_args.base_branch or self.configs.BASE_BRANCH
         if self.parsed_args.branch_from_current:
-            base_branch = self.repo.active_branch.name
+            base_branch = self.repo.active_branch_name
         args['base_branch'] = base_branch
 
         args['base_release'] = self.parsed_args.base_release
 
         args['no_pull'] = self.parsed_args.no_pull
 
+        args['max_age'] = 0 if self.parsed_args.refresh else self.configs.FETCH_MAX_AGE
+
+        args['mirror'] = None if self.parsed_args.refresh else self.get_mirror()
+
+        # Default to config value unless otherwise specified
+        args['in_place'] = (self.configs.UPDATE_BASE_IN_PLACE
+                            if self.parsed_args.in_place is None else
+                            self.parsed_args.in_place)
+
+        args['worktree'] = self.parsed_args.worktree
+
+        args['ci'] = self.parsed_args.ci or self.configs.CI_MODE
+
         args['skip_bad_name_check'] = self.parsed_args.skip_bad_name_check
 
         return args
@@ -159,47 +241,148 @@ class StartBranch(WorkflowBase):
     def run(self):
         args = self.get_args()
         branch_name = args['client'] + args['description'] + args['timestamp'] + args['initials']
-        if self.configs.BAD_BRANCH_NAME_PATTERNS:
-            if args['skip_bad_name_check']:
-                self.print_warning('workflow.badBranchNamePatterns is configured, but -s argument was specified.',
-                                   'Skipping bad branch name check.')
-            else:
-                # Will raise exception if name doesn't check out
-                self.check_branch_name(branch_name)
+        if self.configs.BAD_BRANCH_NAME_PATTERNS and args['skip_bad_name_check']:
+            self.print_warning('workflow.badBranchNamePatterns is configured, but -s argument was specified.',
+                               'Skipping bad branch name check.')
+        # Validate everything before fetching or checking out anything
+        problems = self.preflight(branch_name, args)
+        if problems:
+            raise Exception('\n'.join(
+                [f'Unable to create branch {branch_name}:']
+                + [cmd.INDENT + '- ' + problem for problem in problems]
+            ))
         # Checkout base branch or tag
         base_branch = args['base_branch']
         base_release = args['base_release']
         new_active_branch = None
+        # Repo the new branch is checked out in (differs from self.repo if
+        # a worktree is created)
+        branch_repo = self.repo
+        if args['worktree'] is not None:
+            branch_repo = self.create_worktree(branch_name, args)
+            new_active_branch = branch_repo.active_branch_name
+        elif args['ci']:
+            base_ref = self.fetch_base_ref(args)
+            self.print(f'Creating new branch {branch_name} based on {base_ref}...')
+            self.repo.git.checkout(base_ref, b=branch_name, no_track=True)
+            new_active_branch = self.repo.active_branch_name
         # base_release will only be set if the --base-release arg is specified, overrides base branch
-        if base_release is None:
-            base_head = checkout_branch(self.repo, base_branch, no_pull=args['no_pull'])
+        elif base_release is None and args['in_place']:
+            base_ref = update_branch(self.repo, base_branch, no_pull=args['no_pull'],
+                                     max_age=args['max_age'], mirror=args['mirror'])
+            # Create and checkout new branch in one step
+            self.print(f'Creating new branch {branch_name} based on {base_ref}...')
+            self.repo.git.checkout(base_ref, b=branch_name, no_track=True)
+            new_active_branch = self.repo.active_branch_name
+        elif base_release is None:
+            checkout_branch(self.repo, base_branch, no_pull=args['no_pull'],
+                            max_age=args['max_age'], mirror=args['mirror'])
             # Checkout new branch
             self.print(f'Creating new branch {branch_name}...')
-            new_active_branch = base_head.checkout(b=branch_name)
+            self.repo.git.checkout(b=branch_name)
+            new_active_branch = self.repo.active_branch_name
         else:
             # Update
             if not args['no_pull']:
-                fetch_tags(self.repo)
+                fetch_tags(self.repo, max_age=args['max_age'], jobs=self.configs.FETCH_JOBS,
+                           mirror=args['mirror'])
             self.print(f'Creating new branch {branch_name} based on tag {base_release}...')
             self.repo.git.checkout(base_release, b=branch_name)
-            new_active_branch = self.repo.active_branch
+            new_active_branch = self.repo.active_branch_name
         # Verify branch
-        if new_active_branch is not None and new_active_branch.name == branch_name:
+        if new_active_branch == branch_name:
             self.print_success('Branch created.', '')
         else:
             # Not sure we'd ever get here, but print an error anyway to be safe
             raise Exception(f'Unable to create branch {branch_name} due to an unknown error.')
+        # Record client so it can be distinguished from the description later
+        if args['client']:
+            set_branch_metadata(self.repo, branch_name, 'client', args['client'].rstrip('-'))
         # If specified, call commit-template
         if args['ticket']:
-            self.print('Checking ticket number format...')
             set_template_parsed_args = self.parser.parse_args([SetTemplate.command, args['ticket']])
-            set_template = SetTemplate(self.repo, self.parser,
+            set_template = SetTemplate(branch_repo, self.parser,
                                        parsed_args=set_template_parsed_args,
                                        verbosity=self.verbosity)
             set_template.run()
+        if branch_repo is not self.repo:
+            self.print_info(f'Branch {branch_name} is checked out in {branch_repo.working_tree_dir}')
 
     # Helper Methods
 
+    def create_worktree(self, branch_name, args):
+        """Create a new branch in a new linked worktree without modifying the
+        current working tree.
+
+        :param branch_name: Name of the branch to create
+        :param args: get_args() result
+
+        :return: Repo object for the new worktree
+        """
+        worktree_path = self.get_worktree_path(branch_name, args['worktree'])
+        if args['ci']:
+            base_ref = self.fetch_base_ref(args)
+        elif args['base_release'] is None:
+            base_ref = update_branch(self.repo, args['base_branch'], no_pull=args['no_pull'],
+                                     max_age=args['max_age'], mirror=args['mirror'])
+        else:
+            if not args['no_pull']:
+                fetch_tags(self.repo, max_age=args['max_age'], jobs=self.configs.FETCH_JOBS,
+                           mirror=args['mirror'])
+            base_ref = args['base_release']
+        self.print(f'Creating new branch {branch_name} based on {base_ref} in worktree {worktree_path}...')
+        self.repo.git.worktree('add', '--no-track', '-b', branch_name, worktree_path, base_ref)
+        return Repo(worktree_path)
+
+    def fetch_base_ref(self, args):
+        """Fetch only the commit the new branch will be based on (for CI
+        mode), i.e. the tip of the base branch or the tag passed to
+        --base-release.
+
+        :param args: get_args() result
+
+        :return: Ref to create the new branch from
+        """
+        base_release = args['base_release']
+        tracking_info = get_branch_remote(self.repo, args['base_branch'])
+        if base_release is not None:
+            ref = base_release if base_release.startswith('refs/') else f'refs/tags/{base_release}'
+            if not args['no_pull'] and tracking_info is not None and tracking_info.remote_name != '.':
+                self.print(f'Fetching {ref} from {tracking_info.remote_name}...')
+                fetch_minimal(self.repo, tracking_info.remote_name, ref, ref)
+            return ref
+        if args['no_pull'] or tracking_info is None or tracking_info.remote_name == '.':
+            return args['base_branch']
+        self.print(f'Fetching {tracking_info.merge_ref} from {tracking_info.remote_name}...')
+        sha = fetch_minimal(self.repo, tracking_info.remote_name,
+                            tracking_info.merge_ref, tracking_info.ref)
+        self.print(f'{tracking_info.ref} is at {sha}', '')
+        return tracking_info.ref
+
+    def get_worktree_path(self, branch_name, path=''):
+        """Returns the absolute path to create a worktree for a branch at.
+
+        :param branch_name: Name of the branch
+        :param path: (Optional) Path specified via command line argument,
+            relative to the current directory. If empty, workflow.worktreePath
+            is used (relative to the main worktree)
+
+        :return: Absolute path for the new worktree
+        """
+        main_worktree_path = get_main_worktree_path(self.repo)
+        base_path = os.getcwd() if path else main_worktree_path
+        path = (path or self.configs.WORKTREE_PATH).format(
+            repo=os.path.basename(main_worktree_path), branch=branch_name
+        )
+        return os.path.abspath(os.path.join(base_path, os.path.expanduser(path)))
+
+    def get_completion_trie(self):
+        """Returns the trie used to complete clients and descriptions (see
+        utils.completion), loading it the first time it's needed."""
+        if self._completion_trie is None:
+            self._completion_trie = load_trie(self.repo)
+        return self._completion_trie
+
     def format_branch_name(self, val):
         """Convert text to lowercase and replace spaces and underscores with
         hyphens.
@@ -210,22 +393,118 @@ class StartBranch(WorkflowBase):
         """
         return re.sub('[ _]+', '-', val.lower())
 
-    def check_branch_name(self, branch_name):
-        """Checks for configured bad patterns in branch name. Raises exception
-        if one is found.
+    # Preflight Checks
+
+    def preflight(self, branch_name, args):
+        """Run all preflight checks. Checks only read the repo, so they can
+        run before anything is fetched or checked out.
 
-        :param branch_name: Name to check
+        Each check is a generator that yields a message for each problem it
+        finds, so all problems can be reported at once.
+
+        :param branch_name: Name of the branch to create
+        :param args: get_args() result. If a ticket number is specified, it's
+            replaced with its formatted value
+
+        :return: List of problems found (empty if there are none)
         """
+        checks = [
+            self.check_branch_name,
+            self.check_collisions,
+            self.check_base,
+            self.check_working_tree,
+            self.check_ticket,
+        ]
+        problems = []
+        for check in checks:
+            problems.extend(check(branch_name, args))
+        return problems
+
+    def check_branch_name(self, branch_name, args):
+        """Checks for configured bad patterns in branch name (unless
+        --skip-bad-name-check was specified)."""
+        if args['skip_bad_name_check'] or not self.configs.BAD_BRANCH_NAME_PATTERNS:
+            return
         for bad_pattern in self.configs.BAD_BRANCH_NAME_PATTERNS:
             if bad_pattern in branch_name:
-                error_msg = '\n'.join([
-                    f'Branch name "{branch_name}" contains invalid pattern "{bad_pattern}".',
-                    '',
-                    'Branch names should not include the following patterns:',
-                    *[cmd.INDENT + pattern for pattern in self.configs.BAD_BRANCH_NAME_PATTERNS],
-                    '',
-                    '(from git config workflow.badBranchNamePatterns)',
-                    '',
-                    'To skip this check, use --skip-bad-name-check argument.'
-                ])
-                raise Exception(error_msg)
+                yield (f'Branch name contains invalid pattern "{bad_pattern}" '
+                       '(from git config workflow.badBranchNamePatterns). '
+                       'To skip this check, use --skip-bad-name-check argument.')
+
+    def check_collisions(self, branch_name, args):
+        """Checks that the branch (and its worktree, with --worktree) don't
+        exist yet."""
+        if self.repo.ref_exists(f'refs/heads/{branch_name}'):
+            yield f'Branch {branch_name} already exists.'
+        if args['worktree'] is not None:
+            worktree_path = self.get_worktree_path(branch_name, args['worktree'])
+            if os.path.exists(worktree_path):
+                yield f'Unable to create worktree: {worktree_path} already exists.'
+
+    def check_base(self, branch_name, args):
+        """Checks that the base branch or tag exists. Refs that will be
+        fetched (unless --no-pull was specified) may only exist on the remote,
+        so they aren't checked."""
+        base_branch = args['base_branch']
+        base_release = args['base_release']
+        if base_release is not None:
+            if args['no_pull'] and not self.repo.ref_exists(
+                    base_release if base_release.startswith('refs/') else f'refs/tags/{base_release}'):
+                yield f'Tag {base_release} not found.'
+            return
+        if self.repo.ref_exists(f'refs/heads/{base_branch}'):
+            return
+        if args['ci'] and not args['no_pull'] and get_branch_remote(self.repo, base_branch) is not None:
+            # Only the remote's tip is fetched
+            return
+        if (args['worktree'] is None and not args['ci'] and not args['in_place']
+                and any(ref.endswith(f'/{base_branch}') for ref in self.repo.get_refs('refs/remotes/'))):
+            # Checking it out creates it from the remote-tracking branch
+            return
+        yield f'Base branch {base_branch} not found.'
+
+    def check_working_tree(self, branch_name, args):
+        """Checks for uncommitted changes (to tracked files) that checking out
+        the base branch could fail on or carry over. Skipped if the branch is
+        created in a new worktree or from the current branch."""
+        if args['worktree'] is not None or self.parsed_args.branch_from_current:
+            return
+        # Subcommand options have to follow the subcommand
+        if self.repo.git.status('--porcelain', '--untracked-files=no'):
+            yield ('Working tree has uncommitted changes. Commit or stash them, '
+                   'or use --branch-from-current to keep them on the new branch.')
+
+    def check_ticket(self, branch_name, args):
+        """Checks the ticket number against workflow.ticketInputFormatRegex and
+        that the commit template's filename and body can be formatted with
+        it."""
+        if not args['ticket']:
+            return
+        set_template = SetTemplate(self.repo, self.parser, verbosity=0)
+        try:
+            args['ticket'] = set_template.get_validate_ticket_function()(
+                set_template.format_ticket_number(args['ticket'])
+            )
+        except cmd.ValidationError:
+            yield (f'Invalid ticket number {args["ticket"]}, must match regex '
+                   f'{self.configs.TICKET_INPUT_FORMAT_REGEX} (from git config workflow.ticketInputFormatRegex).')
+            return
+        format_kwargs = set_template.get_format_kwargs(args, branch_name)
+        formats_valid = True
+        for config_name, format_string in [
+            ('commitTemplateFilenameFormat', self.configs.COMMIT_TEMPLATE_FILENAME_FORMAT),
+            ('commitTemplateFormat', self.configs.COMMIT_TEMPLATE_FORMAT),
+        ]:
+            try:
+                format_string.format(**format_kwargs)
+            except KeyError as e:
+                yield f'Unknown placeholder {{{e.args[0]}}} in git config workflow.{config_name}.'
+                formats_valid = False
+            except (IndexError, ValueError) as e:
+                yield f'Invalid git config workflow.{config_name}: {e}'
+                formats_valid = False
+        # A new worktree won't have any template files yet
+        if formats_valid and args['worktree'] is None:
+            commit_template_file = set_template.get_commit_template_file(format_kwargs)
+            if os.path.exists(os.path.join(self.repo.working_tree_dir, commit_template_file)):
+                yield f'Commit template {commit_template_file} already exists.'
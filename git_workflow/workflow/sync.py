@@ -0,0 +1,252 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
+import tempfile
+from cmd_utils import cmd
+from git_workflow.utils import branches, repository
+from git_workflow.utils.git_repo import Git, GitCommandError
+from .base import WorkflowBase
+
+#: Result of syncing a branch. status is one of the Sync.STATUS_* constants
+#: and detail is a message to show in the summary (or None)
+SyncResult = namedtuple('SyncResult', ['branch_name', 'status', 'detail'])
+
+
+class Sync(WorkflowBase):
+    """\
+    Update all workflow branches with the latest changes to the base branch.
+
+    The base branch is fetched once, then merged into (or with ``--rebase``,
+    rebased onto) every workflow branch. A branch is considered a workflow
+    branch if it follows the ``workflow start`` naming scheme or has a commit
+    template configured. Specific branches can be passed as arguments instead.
+
+    Each branch is updated in its own temporary worktree, so the current
+    checkout is never touched, and several branches are updated at once
+    (limited by ``--jobs`` or ``workflow.syncJobs``). A branch is only moved
+    once its merge or rebase completes. If there are conflicts, the merge or
+    rebase is abandoned and the branch is left as it was, along with a list
+    of conflicting files in the summary.
+
+    The following branches are skipped:
+
+    - Branches checked out in a worktree (including the current one)
+    - Branches that are already merged into the base branch (see ``workflow
+      cleanup --merged``)
+    """
+
+    command = 'sync'
+    description = 'Update all workflow branches with the latest changes to the base branch.'
+    configs_used = ['baseBranch', 'fetchMaxAge', 'mirrorPath', 'mirrorMaxAge', 'syncJobs']
+
+    #: Possible values of SyncResult.status
+    STATUS_UPDATED = 'updated'
+    STATUS_UP_TO_DATE = 'up to date'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_CONFLICT = 'conflict'
+    STATUS_FAILED = 'failed'
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        sync_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        sync_subparser.add_argument(
+            'branches', metavar='<branch>', nargs='*',
+            help='Branches to update (default: all workflow branches)'
+        )
+        # Sync Options
+        sync_args = sync_subparser.add_argument_group(
+            'Sync Options'
+        )
+        sync_args.add_argument(
+            '-b', '--base-branch', metavar='<branch>',
+            help='Branch to update workflow branches with (default: workflow.baseBranch)'
+        )
+        sync_args.add_argument(
+            '-r', '--rebase', help='Rebase branches onto the base branch instead of merging',
+            action='store_true', default=False
+        )
+        sync_args.add_argument(
+            '-j', '--jobs', metavar='<n>', type=int, default=None,
+            help='Maximum number of branches to update at once (default: workflow.syncJobs)'
+        )
+        sync_args.add_argument(
+            '-P', '--no-pull', help='Skip fetching changes to base branch',
+            action='store_true', default=False
+        )
+        sync_args.add_argument(
+            '--refresh', help='Fetch changes to base branch from the remote even if recently fetched (overrides workflow.fetchMaxAge and workflow.mirrorPath)',
+            action='store_true', default=False
+        )
+
+    def get_args(self):
+        """Parse command line arguments.
+
+        :return: A dictionary with the following keys:
+            branches, base_branch, rebase, jobs, no_pull, max_age, mirror
+        """
+        args = {}
+        args['branches'] = self.parsed_args.branches
+        args['base_branch'] = self.parsed_args.base_branch or self.configs.BASE_BRANCH
+        args['rebase'] = self.parsed_args.rebase
+        args['jobs'] = max(1, self.parsed_args.jobs or self.configs.SYNC_JOBS)
+        args['no_pull'] = self.parsed_args.no_pull
+        args['max_age'] = 0 if self.parsed_args.refresh else self.configs.FETCH_MAX_AGE
+        args['mirror'] = None if self.parsed_args.refresh else self.get_mirror()
+        return args
+
+    def run(self):
+        args = self.get_args()
+        base_branch = args['base_branch']
+        # Fetch once up front, workers only use local refs
+        base_ref = repository.update_branch(self.repo, base_branch, no_pull=args['no_pull'],
+                                            max_age=args['max_age'], mirror=args['mirror'])
+        base_sha = self.repo.git.rev_parse(base_ref, verify=True)
+        results = []
+        targets = self.find_sync_targets(base_branch, base_sha, args['branches'], results)
+        if targets:
+            action = 'Rebasing' if args['rebase'] else 'Merging'
+            self.print(f'{action} {base_ref} into {len(targets)} branches...', '')
+            with ThreadPoolExecutor(max_workers=args['jobs']) as executor:
+                futures = [
+                    executor.submit(self.sync_branch, branch_name, sha, base_branch, base_sha,
+                                    rebase=args['rebase'])
+                    for branch_name, sha in targets.items()
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    self.print(f'{result.branch_name}: {result.status}')
+                    results.append(result)
+            self.print('')
+        self.print_summary(results)
+
+    # Helper Methods
+
+    def find_sync_targets(self, base_branch, base_sha, branch_names, results):
+        """Get branches to sync.
+
+        :param base_branch: Name of the base branch
+        :param base_sha: SHA of the updated base branch
+        :param branch_names: Branches specified via command line arguments. If
+            empty, all workflow branches are used
+        :param results: List to append SyncResults for skipped branches to
+
+        :return: Dictionary mapping branch names to their tip SHAs
+        """
+        all_branches = repository.get_branches(self.repo)
+        if branch_names:
+            for branch_name in branch_names:
+                if branch_name not in all_branches:
+                    raise Exception(f'Branch {branch_name} not found.')
+        else:
+            templates = repository.get_branch_config_files(self.repo)
+            branch_names = [
+                branch_name for branch_name in all_branches
+                if branch_name != base_branch
+                and (branch_name in templates or branches.is_workflow_branch(branch_name))
+            ]
+        worktrees = repository.get_worktrees(self.repo)
+        merged_branches = repository.get_merged_branches(self.repo, base_sha)
+        targets = {}
+        for branch_name in branch_names:
+            if branch_name == base_branch:
+                detail = 'base branch'
+            elif branch_name in worktrees:
+                detail = f'checked out in {worktrees[branch_name]}'
+            elif branch_name in merged_branches:
+                detail = f'already merged into {base_branch}'
+            else:
+                targets[branch_name] = all_branches[branch_name]
+                continue
+            results.append(SyncResult(branch_name, self.STATUS_SKIPPED, detail))
+        return targets
+
+    def sync_branch(self, branch_name, sha, base_branch, base_sha, rebase=False):
+        """Merge or rebase the base branch into a branch using a temporary
+        worktree. The branch is only updated if this succeeds without
+        conflicts. Runs in a worker thread, so it doesn't print anything.
+
+        :param branch_name: Name of the branch to update
+        :param sha: SHA the branch currently points to
+        :param base_branch: Name of the base branch (used in merge messages)
+        :param base_sha: SHA of the base branch
+        :param rebase: (Default: False) If True, rebase instead of merging
+
+        :return: SyncResult
+        """
+        if repository.is_ancestor(self.repo, base_sha, sha):
+            return SyncResult(branch_name, self.STATUS_UP_TO_DATE, None)
+        worktree_path = tempfile.mkdtemp(prefix='workflow-sync-')
+        worktree_added = False
+        try:
+            # Detached, so the branch itself isn't checked out and the
+            # commit-msg hook and per-branch templates don't apply
+            self.repo.git.worktree('add', '--detach', '--quiet', worktree_path, sha)
+            worktree_added = True
+            git = Git(worktree_path)
+            try:
+                if rebase:
+                    git.rebase(base_sha, quiet=True)
+                else:
+                    git.merge(base_sha, no_edit=True, no_ff=True,
+                              m=f"Merge branch '{base_branch}' into {branch_name}")
+            except GitCommandError as e:
+                conflicts = git.diff(name_only=True, diff_filter='U').splitlines()
+                if conflicts:
+                    return SyncResult(branch_name, self.STATUS_CONFLICT, ', '.join(conflicts))
+                return SyncResult(branch_name, self.STATUS_FAILED, self.format_error(e))
+            new_sha = git.rev_parse('HEAD')
+            try:
+                # Fails if the branch moved while syncing
+                self.repo.git.update_ref(f'refs/heads/{branch_name}', new_sha, sha)
+            except GitCommandError as e:
+                return SyncResult(branch_name, self.STATUS_FAILED, self.format_error(e))
+            return SyncResult(branch_name, self.STATUS_UPDATED, new_sha)
+        except GitCommandError as e:
+            return SyncResult(branch_name, self.STATUS_FAILED, self.format_error(e))
+        finally:
+            if not worktree_added or not repository.remove_worktree(self.repo, worktree_path,
+                                                                    force=True):
+                shutil.rmtree(worktree_path, ignore_errors=True)
+                if worktree_added:
+                    self.repo.git.worktree('prune')
+
+    @staticmethod
+    def format_error(error):
+        """Returns the first line of a GitCommandError's stderr."""
+        stderr = error.stderr.strip()
+        return stderr.splitlines()[0] if stderr else str(error)
+
+    def print_summary(self, results):
+        """Print the results of each branch grouped by status.
+
+        :param results: List of SyncResults
+        """
+        if not results:
+            self.print('No workflow branches to sync.')
+            return
+        grouped = {}
+        for result in sorted(results, key=lambda result: result.branch_name):
+            grouped.setdefault(result.status, []).append(result)
+        updated = grouped.get(self.STATUS_UPDATED, [])
+        if updated:
+            self.print(f'Updated {len(updated)} branches:',
+                       *[f'{result.branch_name} ({result.detail[:7]})' for result in updated], '',
+                       first_line_formatting=cmd.SUCCESS)
+        up_to_date = grouped.get(self.STATUS_UP_TO_DATE, [])
+        if up_to_date:
+            self.print(f'{len(up_to_date)} branches already up to date:',
+                       *[result.branch_name for result in up_to_date], '')
+        skipped = grouped.get(self.STATUS_SKIPPED, [])
+        if skipped:
+            self.print(f'Skipped {len(skipped)} branches:',
+                       *[f'{result.branch_name} ({result.detail})' for result in skipped], '')
+        conflicts = grouped.get(self.STATUS_CONFLICT, [])
+        if conflicts:
+            self.print(f'{len(conflicts)} branches have conflicts and were left unchanged:',
+                       *[f'{result.branch_name} ({result.detail})' for result in conflicts], '',
+                       first_line_formatting=cmd.WARNING)
+        failed = grouped.get(self.STATUS_FAILED, [])
+        if failed:
+            self.print(f'Unable to update {len(failed)} branches:',
+                       *[f'{result.branch_name}: {result.detail}' for result in failed], '',
+                       first_line_formatting=cmd.ERROR)
@@ -1,5 +1,10 @@
 import os
 from cmd_utils import cmd
+from git_workflow.utils.git_repo import parse_config
+from git_workflow.utils.plan import ConfigUnset, DeleteFile, Plan, UnregisterTicket
+from git_workflow.utils.repository import (
+    get_branch_config_files, get_branch_metadata_path, get_worktrees
+)
 from .base import WorkflowBase
 
 
@@ -9,11 +14,14 @@ class UnsetTemplate(WorkflowBase):
 
     By default, this command will prompt for confirmation before removing the
     commit template unless ``--force`` is specified.
+
+    If no branch is specified and this command is run in a terminal, branches
+    can be picked interactively (see ``workflow.branchPicker``).
     """
 
     command = 'unset-template'
     description = 'Remove commit template for a branch.'
-    configs_used = ['unsetTemplateConfirmationPrompt']
+    configs_used = ['unsetTemplateConfirmationPrompt', 'branchPicker', 'ticketRegistryPath']
 
     @classmethod
     def add_subparser(cls, subparsers, generic_parent_parser):
@@ -23,9 +31,8 @@ class UnsetTemplate(WorkflowBase):
             'Positional Arguments'
         )
         positional_args.add_argument(
-            'branch', metavar='<branch>', nargs='?',
-            help='Branch to unset template for (default: current)',
-            default=None
+            'branches', metavar='<branch>', nargs='*',
+            help='Branches to unset template for (default: pick interactively, or current)'
         )
         # Confirmation prompt
         confirmation_args = unset_commit_template_subparser.add_argument_group(
@@ -41,17 +48,16 @@ class UnsetTemplate(WorkflowBase):
             '-c', '--confirmation', help='Prompt for confirmation before unsetting',
             dest='confirm', action='store_true', default=None
         )
+        cls._add_dry_run_argument(unset_commit_template_subparser)
 
     def get_args(self):
         """Parse command line arguments and prompt for any missing values.
 
         :return: A dictionary with the following keys:
-            branch, confirm
+            branches, confirm
         """
         args = {}
-        args['branch'] = (self.parsed_args.branch
-                          if self.parsed_args.branch is not None else
-                          self.repo.active_branch.name)
+        args['branches'] = self.get_branches_arg('Unset template for')
         # Default to config value unless otherwise specified
         args['confirm'] = (self.configs.UNSET_TEMPLATE_CONFIRMATION_PROMPT
                            if self.parsed_args.confirm is None else
@@ -60,63 +66,107 @@ class UnsetTemplate(WorkflowBase):
 
     def run(self):
         args = self.get_args()
-        branch = args['branch']
-        # Get branch config path, print and exit if non-existent
-        branch_config_file = self.configs.get_config(
-            f'includeif.onbranch:{branch}.path',
-            local=True, includes=True
-        )
-        if branch_config_file is None:
-            self.print(f'Branch {branch} does not have an associated config file.')
+        # Get branch config paths, skip branches without one
+        configured_branches = get_branch_config_files(self.repo)
+        branch_config_files = {}
+        for branch in args['branches']:
+            branch_config_file = configured_branches.get(branch)
+            if branch_config_file is None:
+                self.print(f'Branch {branch} does not have an associated config file.')
+            else:
+                branch_config_files[branch] = branch_config_file
+        if not branch_config_files:
             return
         # Confirmation prompt
-        if args['confirm']:
+        if args['confirm'] and not self.parsed_args.dry_run:
             confirmation = cmd.prompt(
                 'Unset Template? (y/n)',
-                f'Unset commit template for {branch}?',
+                f'Unset commit template for {", ".join(branch_config_files)}?',
                 default_val='n', validate_function=cmd.validate_yn
             )
             if not confirmation:
                 return
-        # Verify config file exists
-        branch_config_path = os.path.join(self.repo.git_dir, branch_config_file)
-        if not os.path.exists(branch_config_path):
-            self.print(f'Config file {branch_config_file} not found, unsetting include...')
-            self.unset_includeif_onbranch_path(branch)
-            self.print_success('Config include removed.', '')
+        plan = Plan(self.repo)
+        worktrees = get_worktrees(self.repo)
+        success_messages = []
+        for branch, branch_config_file in branch_config_files.items():
+            operation_count = len(plan.operations)
+            commit_template_file = self.plan_unset_template(plan, branch, branch_config_file,
+                                                            worktrees=worktrees)
+            if len(plan.operations) == operation_count:
+                self.print(f'commit.template not configured for branch {branch}.', '')
+            elif commit_template_file is None:
+                success_messages.append(f'Config file {branch_config_file} not found, config include removed.')
+            else:
+                success_messages.append(f'Commit template {commit_template_file} unset for {branch}.')
+        if not plan or not self.run_plan(plan, dry_run=self.parsed_args.dry_run):
             return
-        # Unset commit.template in branch config file
-        self.print(f'Unsetting commit.template config for {branch}...')
-        commit_template_file = self.configs.get_config(
-            'commit.template', file=branch_config_path
-        )
-        if commit_template_file is None:
-            self.print(f'commit.template not configured for branch {branch}.', '')
-            return
-        self.configs.unset_config(
-            'commit.template', file=branch_config_path
-        )
-        self.print_success('commit.template config unset.', '')
-        # Delete commit template
-        repo_root_dir = os.path.dirname(self.repo.git_dir)
-        commit_template_path = os.path.join(repo_root_dir, commit_template_file)
-        if os.path.exists(commit_template_path):
-            self.print(f'Deleting commit template file {commit_template_file}...')
-            os.remove(commit_template_path)
-            self.print_success('Commit template file removed.', '')
-        else:
-            self.print('Commit template file already removed.')
-        # If branch config is now empty, delete the file and unset includeIf
-        if os.stat(branch_config_path).st_size == 0:
-            self.print(f'Removing empty branch config file and unsetting include...')
-            self.unset_includeif_onbranch_path(branch)
-            os.remove(branch_config_path)
-            self.print_success(f'Empty branch config removed.', '')
+        for message in success_messages:
+            self.print_success(message, '')
 
     # Helper Methods
 
-    def unset_includeif_onbranch_path(self, branch):
-        self.configs.unset_config(
-            f'includeif.onbranch:{branch}.path',
-            file=self.configs.CONFIG_PATH
+    def plan_unset_templates(self, plan, branches):
+        """Add operations that unset the commit templates of multiple branches
+        to a plan (see plan_unset_template()). Branches without a config file
+        are skipped.
+
+        :param plan: Plan to add operations to
+        :param branches: Names of the branches
+        """
+        worktrees = get_worktrees(self.repo)
+        branch_config_files = get_branch_config_files(self.repo)
+        for branch in branches:
+            branch_config_file = branch_config_files.get(branch)
+            if branch_config_file is not None:
+                self.plan_unset_template(plan, branch, branch_config_file, worktrees=worktrees)
+
+    def plan_unset_template(self, plan, branch, branch_config_file, worktrees=None):
+        """Add operations that unset a branch's commit template to a plan:
+        commit.template in the branch config, the ticket number in branch
+        metadata and the ticket registry, and the template file. If nothing
+        else is configured in the branch config, it's deleted and its include
+        is removed from config_workflow.
+
+        :param plan: Plan to add operations to
+        :param branch: Name of the branch
+        :param branch_config_file: Name of the branch's config file (see
+            get_branch_config_files())
+        :param worktrees: (Optional) Result of get_worktrees(), to avoid
+            looking it up again when planning multiple branches
+
+        :return: Name of the commit template file, or None if the branch
+            config file doesn't exist. Nothing is added to the plan if the
+            branch config exists but doesn't configure a commit template
+        """
+        include_key = f'includeIf.onbranch:{branch}.path'
+        branch_config_path = os.path.join(self.repo.common_dir, branch_config_file)
+        branch_config = self.repo.read_cached(branch_config_path, parse_config)
+        if branch_config is None:
+            plan.add(ConfigUnset(self.configs.CONFIG_PATH, include_key))
+            return None
+        commit_template_file = None
+        for key, value in branch_config:
+            if key == 'commit.template':
+                commit_template_file = value
+        if commit_template_file is None:
+            return None
+        plan.add(
+            ConfigUnset(branch_config_path, 'commit.template'),
+            ConfigUnset(get_branch_metadata_path(self.repo), f'branch.{branch}.ticket'),
         )
+        if self.configs.TICKET_REGISTRY_PATH:
+            plan.add(UnregisterTicket(self.configs.TICKET_REGISTRY_PATH, branch))
+        # Delete commit template (from the worktree the branch is checked out
+        # in, if any)
+        if worktrees is None:
+            worktrees = get_worktrees(self.repo)
+        repo_root_dir = worktrees.get(branch, self.repo.working_tree_dir)
+        plan.add(DeleteFile(os.path.join(repo_root_dir, commit_template_file)))
+        # If branch config will be empty, delete the file and unset includeIf
+        if all(key == 'commit.template' for key, _ in branch_config):
+            plan.add(
+                ConfigUnset(self.configs.CONFIG_PATH, include_key),
+                DeleteFile(branch_config_path),
+            )
+        return commit_template_file
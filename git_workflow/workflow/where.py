@@ -0,0 +1,68 @@
+from git_workflow.utils.ticket_registry import (
+    find_ticket, get_global_registry_path, get_repo_display_path
+)
+from .base import WorkflowBase
+
+
+class Where(WorkflowBase):
+    """\
+    Find the branches configured for a ticket, across all repos.
+
+    Every commit template configured with ``workflow set-template`` (or
+    ``workflow start``) is recorded in a per-user ticket registry along with
+    its repo and branch, and removed when the template is unset (including by
+    ``workflow finish`` and ``workflow cleanup``). This command looks the
+    ticket up in the registry with a single indexed query, so it's instant no
+    matter how many repos and branches there are. Ticket numbers are matched
+    case insensitively.
+
+    Registry entries for repos that no longer exist are removed. See
+    ``workflow.ticketRegistryPath`` to change where the registry is stored.
+    This command can also be run outside of a repo, in which case
+    ``workflow.ticketRegistryPath`` is read from the global git config.
+    """
+
+    command = 'where'
+    description = 'Find the branches configured for a ticket, across all repos.'
+    configs_used = ['ticketRegistryPath']
+    requires_repo = False
+
+    @classmethod
+    def add_subparser(cls, subparsers, generic_parent_parser):
+        where_subparser = cls._add_base_subparser(subparsers, generic_parent_parser)
+        positional_args = where_subparser.add_argument_group(
+            'Positional Arguments'
+        )
+        positional_args.add_argument(
+            'ticket', metavar='<ticket>', help='Ticket number to look up'
+        )
+        # Output
+        output_args = where_subparser.add_argument_group(
+            'Output Arguments'
+        )
+        output_args.add_argument(
+            '-p', '--paths', help='Only print repo paths, one per line (e.g. for cd "$(workflow where -p <ticket>)")',
+            action='store_true', default=False
+        )
+
+    def run(self):
+        ticket = self.parsed_args.ticket.strip()
+        registry_path = (self.configs.TICKET_REGISTRY_PATH if self.configs is not None else
+                         get_global_registry_path())
+        if not registry_path:
+            raise Exception('The ticket registry is disabled (workflow.ticketRegistryPath is empty).')
+        entries = find_ticket(registry_path, ticket)
+        if not entries:
+            raise Exception(f'No branches found for ticket {ticket}.')
+        if self.parsed_args.paths:
+            paths = []
+            for entry in entries:
+                path = get_repo_display_path(entry.repo)
+                if path not in paths:
+                    paths.append(path)
+            print(*paths, sep='\n')
+            return
+        self.print(f'{entries[0].ticket}:', *[
+            f'{entry.branch} in {get_repo_display_path(entry.repo)}' for entry in entries
+        ])
+
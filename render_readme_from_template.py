@@ -9,9 +9,9 @@ from contextlib import redirect_stdout
 from io import StringIO
 import os
 import textwrap
-from git import Repo
 import jinja2
 from git_workflow.__about__ import *
+from git_workflow.utils.git_repo import Repo
 from git_workflow.utils.parser import get_parser
 from git_workflow.workflow import commands
 from git_workflow.utils.configs import Configs
@@ -41,7 +41,6 @@ setup(
         ]
     },
     install_requires=[
-        'GitPython==3.1.11',
         'cmd-utils>=1.0.0,<1.1',
         'argcomplete>=1.12,<1.13',
     ],